@@ -0,0 +1,201 @@
+"""Хранилище текстов ответов: перенос старых записей и отчёт о месте.
+
+Новые ответы сразу пишутся через database.store_answer: текст длиннее
+ANSWER_DEDUP_MIN хранится в таблице answers один раз (ключ — SHA-1), а
+длиннее ANSWER_COMPRESS_MIN ещё и сжимается zlib. Здесь — перенос ответов,
+записанных в questions.answer до появления answers, удаление текстов, на
+которые больше никто не ссылается, и отчёт о сэкономленном месте.
+
+Запуск из командной строки:
+    python answers.py                  # только отчёт
+    python answers.py --migrate --vacuum
+"""
+import os
+import sys
+import time
+import argparse
+
+import database
+from database import (
+    ANSWER_DEDUP_MIN, attach_archive, db_connect, store_answer
+)
+from instrumentation import instrumented
+
+MIGRATE_BATCH_SIZE = 500
+
+# Размер ключа в answers (SHA-1)
+_HASH_BYTES = 20
+
+
+def _schemas(conn):
+    """Схемы с таблицей questions: основная база и, если есть, архив."""
+    return ["main", "archive"] if attach_archive(conn) else ["main"]
+
+
+@instrumented("answers.migrate_answers")
+def migrate_answers(batch_size=MIGRATE_BATCH_SIZE, progress_cb=None):
+    """Переносит длинные ответы из questions.answer в answers.
+
+    Обрабатывает и основную базу, и архив; каждая пачка — отдельная
+    транзакция. Возвращает число перенесённых ответов.
+    """
+    conn = db_connect()
+    cur = conn.cursor()
+    moved = 0
+    try:
+        for schema in _schemas(conn):
+            while True:
+                cur.execute(
+                    f"SELECT id, answer FROM {schema}.questions "
+                    "WHERE answer_id IS NULL AND length(answer) >= ? LIMIT ?",
+                    (ANSWER_DEDUP_MIN, batch_size)
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                updates = []
+                for qid, text in rows:
+                    _, answer_id = store_answer(cur, text)
+                    updates.append((answer_id, qid))
+                cur.executemany(
+                    f"UPDATE {schema}.questions SET answer=NULL, answer_id=? "
+                    "WHERE id=?",
+                    updates
+                )
+                conn.commit()
+                moved += len(rows)
+                if progress_cb:
+                    progress_cb(moved)
+    finally:
+        conn.close()
+    return moved
+
+
+@instrumented("answers.prune_answers")
+def prune_answers():
+    """Удаляет тексты, на которые не ссылается ни один вопрос."""
+    conn = db_connect()
+    cur = conn.cursor()
+    refs = ["SELECT answer_id FROM main.questions WHERE answer_id IS NOT NULL"]
+    if attach_archive(conn):
+        refs.append(
+            "SELECT answer_id FROM archive.questions WHERE answer_id IS NOT NULL"
+        )
+    cur.execute(
+        f"DELETE FROM answers WHERE id NOT IN ({' UNION '.join(refs)})"
+    )
+    removed = cur.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+
+def space_report():
+    """Сколько места занимали бы ответы без answers и сколько занимают.
+
+    logical_bytes — сумма длин всех ответов (UTF-8), как если бы каждый
+    хранился в своей строке; stored_bytes — ответы в строках вопросов плюс
+    тексты и ключи в answers.
+    """
+    conn = db_connect()
+    cur = conn.cursor()
+    inline_bytes = referenced_bytes = answered = referenced = 0
+    for schema in _schemas(conn):
+        cur.execute(
+            "SELECT COUNT(answer), COALESCE(SUM(length(CAST(answer AS BLOB))), 0) "
+            f"FROM {schema}.questions WHERE answer_id IS NULL"
+        )
+        n, size = cur.fetchone()
+        answered += n
+        inline_bytes += size
+        cur.execute(
+            "SELECT COUNT(1), COALESCE(SUM(a.size), 0) "
+            f"FROM {schema}.questions q JOIN main.answers a ON a.id = q.answer_id"
+        )
+        n, size = cur.fetchone()
+        answered += n
+        referenced += n
+        referenced_bytes += size
+    cur.execute(
+        "SELECT COUNT(1), COALESCE(SUM(compressed), 0), "
+        "COALESCE(SUM(length(CAST(body AS BLOB))), 0), COALESCE(SUM(size), 0) "
+        "FROM answers"
+    )
+    texts, compressed, body_bytes, raw_bytes = cur.fetchone()
+    conn.close()
+
+    logical = inline_bytes + referenced_bytes
+    stored = inline_bytes + body_bytes + texts * _HASH_BYTES
+    return {
+        "answers": answered,
+        "referenced": referenced,
+        "distinct_texts": texts,
+        "compressed_texts": compressed,
+        "logical_bytes": logical,
+        "stored_bytes": stored,
+        "saved_bytes": logical - stored,
+        "dedup_saved_bytes": referenced_bytes - raw_bytes,
+        "compression_saved_bytes": raw_bytes - body_bytes,
+        "db_bytes": os.path.getsize(database.DB_PATH),
+    }
+
+
+def _kb(n):
+    return f"{n / 1024:.1f} КБ"
+
+
+def format_report(report):
+    ratio = (
+        report["logical_bytes"] / report["stored_bytes"]
+        if report["stored_bytes"] else 1.0
+    )
+    return "\n".join([
+        f"Ответов: {report['answers']}, через answers: {report['referenced']} "
+        f"({report['distinct_texts']} разных текстов, "
+        f"сжато {report['compressed_texts']})",
+        f"Без дедупликации: {_kb(report['logical_bytes'])}, "
+        f"хранится: {_kb(report['stored_bytes'])} "
+        f"(в {ratio:.1f} раза меньше)",
+        f"Сэкономлено: {_kb(report['saved_bytes'])}, из них повторы "
+        f"{_kb(report['dedup_saved_bytes'])}, сжатие "
+        f"{_kb(report['compression_saved_bytes'])}",
+        f"Размер файла базы: {_kb(report['db_bytes'])}",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--migrate", action="store_true",
+                        help="перенести старые ответы из questions в answers")
+    parser.add_argument("--prune", action="store_true",
+                        help="удалить тексты без ссылок")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="сжать файл базы после переноса")
+    parser.add_argument("--batch-size", type=int, default=MIGRATE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    database.init_db()
+
+    if args.migrate:
+        t0 = time.perf_counter()
+        moved = migrate_answers(args.batch_size)
+        print(f"Перенесено ответов: {moved} "
+              f"за {time.perf_counter() - t0:.1f} с")
+    if args.prune:
+        print(f"Удалено текстов без ссылок: {prune_answers()}")
+    if args.vacuum:
+        size = os.path.getsize(database.DB_PATH)
+        conn = db_connect()
+        conn.execute("VACUUM")
+        conn.close()
+        print(f"Файл базы: {_kb(size)} -> "
+              f"{_kb(os.path.getsize(database.DB_PATH))}")
+
+    print(format_report(space_report()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""Перенос старых отвеченных вопросов в архивную базу.
+
+Архив — отдельный файл SQLite (database.archive_db_path()), который
+подключается через ATTACH. Вопросы переносятся пачками, каждая пачка —
+отдельная транзакция, так что операторы не ждут окончания всего переноса.
+Истории и списки вопросов читают оба хранилища через all_questions
+(database.db_connect(archive=True)), счётчики question_stats при переносе
+не меняются. В архив не попадают FAQ и ответы, ещё не выгруженные в базу
+знаний.
+
+Запуск из командной строки:
+    python archive.py --days 90
+"""
+import os
+import sys
+import time
+import argparse
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+import database
+from database import (
+    QUESTION_COLUMNS, add_question_stats, archive_db_path, attach_archive,
+    db_connect
+)
+from instrumentation import instrumented, timed
+
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 500
+
+# Какие вопросы можно переносить; параметр — граница по answered_at
+ARCHIVABLE = (
+    "status='answered' AND answered_at IS NOT NULL AND answered_at < ? "
+    "AND user != 'FAQ' AND NOT (kb_approved=1 AND kb_indexed=0)"
+)
+
+
+def _cutoff(days):
+    return time.strftime(
+        "%Y-%m-%d %H:%M:%S", time.localtime(time.time() - days * 86400)
+    )
+
+
+def storage_sizes():
+    """Размеры файлов и число вопросов в основной базе и в архиве."""
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.execute("PRAGMA page_size")
+    page_size = cur.fetchone()[0]
+    cur.execute("PRAGMA freelist_count")
+    free_pages = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(1) FROM questions")
+    main_rows = cur.fetchone()[0]
+    archive_rows = 0
+    if attach_archive(conn):
+        cur.execute("SELECT COUNT(1) FROM archive.questions")
+        archive_rows = cur.fetchone()[0]
+    conn.close()
+
+    path = archive_db_path()
+    return {
+        "main_bytes": os.path.getsize(database.DB_PATH),
+        "main_free_bytes": free_pages * page_size,
+        "main_rows": main_rows,
+        "archive_path": path,
+        "archive_bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+        "archive_rows": archive_rows,
+    }
+
+
+def count_archivable(days=ARCHIVE_AFTER_DAYS):
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(1) FROM questions WHERE {ARCHIVABLE}",
+                (_cutoff(days),))
+    n = cur.fetchone()[0]
+    conn.close()
+    return n
+
+
+def _move_batch(conn, cutoff, batch_size):
+    """Переносит одну пачку вопросов. Возвращает число перенесённых."""
+    columns = ", ".join(QUESTION_COLUMNS)
+    batch = "id IN (SELECT id FROM temp.archive_batch)"
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("DELETE FROM temp.archive_batch")
+        cur.execute(
+            "INSERT INTO temp.archive_batch(id) SELECT id FROM main.questions "
+            f"WHERE {ARCHIVABLE} ORDER BY id LIMIT ?",
+            (cutoff, batch_size)
+        )
+        moved = cur.rowcount
+        if moved:
+            # Триггер удаления вычтет эти строки из question_stats —
+            # заранее добавляем их, чтобы статистика осталась прежней
+            add_question_stats(cur, batch)
+            cur.execute(
+                f"INSERT INTO archive.questions({columns}, archived_at) "
+                f"SELECT {columns}, ? FROM main.questions WHERE {batch}",
+                (database._now(),)
+            )
+            cur.execute(f"DELETE FROM main.questions WHERE {batch}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return moved
+
+
+@instrumented("archive.archive_answered")
+def archive_answered(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                     vacuum=True, progress_cb=None, is_cancelled=None):
+    """Переносит в архив вопросы, отвеченные больше days дней назад.
+
+    С vacuum=True основная база затем сжимается (VACUUM), и освободившееся
+    место возвращается на диск. Возвращает отчёт: сколько перенесено,
+    размеры до и после и reclaimed_bytes.
+    """
+    t0 = time.perf_counter()
+    before = storage_sizes()
+    cutoff = _cutoff(days)
+    total = count_archivable(days)
+
+    moved = batches = 0
+    cancelled = False
+    conn = db_connect()
+    try:
+        attach_archive(conn, create=True)
+        conn.commit()
+        conn.execute("CREATE TEMP TABLE archive_batch (id INTEGER PRIMARY KEY)")
+        while True:
+            if is_cancelled and is_cancelled():
+                cancelled = True
+                break
+            with timed("archive.batch"):
+                n = _move_batch(conn, cutoff, batch_size)
+            if not n:
+                break
+            moved += n
+            batches += 1
+            if progress_cb:
+                progress_cb(moved, max(total, moved))
+    finally:
+        conn.close()
+
+    if vacuum and moved:
+        with timed("archive.vacuum"):
+            conn = db_connect()
+            conn.execute("VACUUM")
+            conn.close()
+
+    after = storage_sizes()
+    return {
+        "moved": moved,
+        "batches": batches,
+        "cancelled": cancelled,
+        "cutoff": cutoff,
+        "before": before,
+        "after": after,
+        "reclaimed_bytes": before["main_bytes"] - after["main_bytes"],
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+
+def _mb(n):
+    return f"{n / 1024 / 1024:.1f} МБ"
+
+
+def format_report(report):
+    before, after = report["before"], report["after"]
+    lines = [
+        f"Перенесено в архив: {report['moved']} "
+        f"(отвечены раньше {report['cutoff']})",
+        f"Основная база: {_mb(before['main_bytes'])} -> "
+        f"{_mb(after['main_bytes'])}, "
+        f"освобождено {_mb(report['reclaimed_bytes'])}",
+        f"Вопросов в основной базе: {after['main_rows']}, "
+        f"в архиве: {after['archive_rows']}",
+        f"Архив: {after['archive_path']} ({_mb(after['archive_bytes'])})",
+    ]
+    if after["main_free_bytes"]:
+        lines.append(
+            f"Свободно внутри файла базы: {_mb(after['main_free_bytes'])}"
+        )
+    if report["cancelled"]:
+        lines.insert(0, "Перенос остановлен, уже перенесённое осталось в архиве.")
+    return "\n".join(lines)
+
+
+class ArchiveThread(QThread):
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
+
+    def __init__(self, days=ARCHIVE_AFTER_DAYS, vacuum=True):
+        super().__init__()
+        self.days = days
+        self.vacuum = vacuum
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            report = archive_answered(
+                self.days, vacuum=self.vacuum,
+                progress_cb=self.progress.emit,
+                is_cancelled=lambda: self._cancelled
+            )
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="переносить вопросы, отвеченные раньше стольких дней")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--no-vacuum", action="store_true",
+                        help="не сжимать основную базу после переноса")
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="только посчитать, сколько вопросов будет перенесено")
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    database.init_db()
+    if args.dry_run:
+        print(f"К переносу: {count_archivable(args.days)}")
+        return 0
+
+    report = archive_answered(
+        args.days, batch_size=args.batch_size, vacuum=not args.no_vacuum
+    )
+    print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,501 @@
+"""Локальный сервер базы InfoDesk.
+
+Сервер держит единственное соединение с data.db и выполняет операции
+database.API_OPS по запросам настольных клиентов, так что клиентам не
+нужно открывать файл базы по сетевой папке. Все операции выполняются по
+очереди в одном потоке базы; HTTP обслуживает asyncio из стандартной
+библиотеки.
+
+    POST /login    {"login", "password"} — пароль проверяет сервер, ответ
+                   {"session", "user"}; сессия передаётся в заголовке
+                   X-InfoDesk-Session
+    POST /logout
+    POST /call     {"calls": [{"op", "args", "kwargs"}, ...]} — пачка
+                   операций, ответ {"results": [{"ok", "value" | "error",
+                   "type"}], "version"}
+    GET  /events   ?since=N&timeout=25 — long-poll: ждёт изменений после
+                   версии N, ответ {"version", "events": [{"version", "op",
+                   "topic"}]}
+    GET  /health
+
+Клиент включается переменной INFODESK_BACKEND_URL (см. backend_client.py).
+Операции доступны по ролям вошедшего пользователя (OP_ACCESS), пароли в
+ответах не передаются. Слушать не только localhost сервер согласится лишь
+с общим токеном INFODESK_BACKEND_TOKEN.
+В простое сервер сам выполняет задачи maintenance.py, а если задан адрес
+RAG API (--api-url, INFODESK_API_URL) — разбирает очередь ожидающих
+вопросов после его восстановления (drain.py).
+
+Запуск:
+    python backend.py --host 127.0.0.1 --port 8765
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import secrets
+import ipaddress
+import sqlite3
+import asyncio
+import logging
+import argparse
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+HOST = os.environ.get("INFODESK_BACKEND_HOST", "127.0.0.1")
+PORT = int(os.environ.get("INFODESK_BACKEND_PORT", "8765"))
+# Если задан, клиенты должны передавать его в заголовке X-InfoDesk-Token
+TOKEN = os.environ.get("INFODESK_BACKEND_TOKEN", "")
+
+MAX_BATCH = 200
+MAX_BODY_BYTES = 32 * 1024 * 1024
+EVENTS_KEEP = 1000
+LONG_POLL_TIMEOUT = 25
+MAX_LONG_POLL_TIMEOUT = 60
+
+# Обслуживание базы — после MAINTENANCE_IDLE_SECONDS без запросов
+MAINTENANCE_CHECK_SECONDS = 60
+MAINTENANCE_IDLE_SECONDS = 120
+
+# Разбор очереди через RAG (drain.py); пустой адрес — не разбирать
+RAG_API_URL = os.environ.get("INFODESK_API_URL", "")
+DRAIN_CHECK_SECONDS = 30
+
+# Операции, меняющие данные, и о чём сообщать клиентам
+WRITE_OPS = {
+    "create_user": "users",
+    "delete_user_db": "users",
+    "update_user_name": "users",
+    "update_user_theme": "users",
+    "update_user_password": "users",
+    "set_answer": "questions",
+    "answer_pending_bulk": "questions",
+    "add_question": "questions",
+    "add_questions_bulk": "questions",
+    "mark_kb_indexed": "questions",
+    "set_kb_approved": "questions",
+}
+
+# Кому доступна операция: public — без входа (нужна до окна входа),
+# user — любому вошедшему, own — своему логину (первый аргумент) или
+# администратору, staff — оператору и администратору, admin — только ему
+OP_ACCESS = {
+    "init_db": "public",
+    "list_faq_items": "user",
+    "get_user": "own",
+    "update_user_name": "own",
+    "update_user_theme": "own",
+    "update_user_password": "own",
+    "add_question": "own",
+    "list_user_questions_all": "own",
+    "list_user_questions_recent": "own",
+    "list_pending_questions": "staff",
+    "get_question_by_id": "staff",
+    "set_answer": "staff",
+    "answer_pending_bulk": "staff",
+    "add_questions_bulk": "staff",
+    "list_questions_by_status": "staff",
+    "list_all_questions": "staff",
+    "questions_page": "staff",
+    "list_kb_pending": "staff",
+    "mark_kb_indexed": "staff",
+    "set_kb_approved": "staff",
+    "get_stats": "staff",
+    "acquire_lease": "staff",
+    "release_lease": "staff",
+    "list_users": "admin",
+    "create_user": "admin",
+    "delete_user_db": "admin",
+}
+# Сессия забывается после стольких секунд без запросов
+SESSION_IDLE_SECONDS = 12 * 3600
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    413: "Payload Too Large",
+}
+
+logger = logging.getLogger("infodesk.backend")
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _public(value):
+    """Значение для ответа клиенту: без паролей."""
+    if isinstance(value, dict):
+        return {k: v for k, v in value.items() if k != "password"}
+    if isinstance(value, list):
+        return [_public(v) for v in value]
+    return value
+
+
+def _authorize(op, args, kwargs, session):
+    """None, если операцию можно выполнить, иначе текст ошибки."""
+    access = OP_ACCESS.get(op)
+    if access == "public":
+        return None
+    if session is None:
+        return "Требуется вход в систему"
+    role = session["role"]
+    if role == "admin":
+        return None
+    if access == "user":
+        return None
+    if access == "own":
+        target = args[0] if args else next(iter(kwargs.values()), None)
+        if target == session["login"]:
+            return None
+        return "Операция доступна только для своей учётной записи"
+    if access == "staff" and role == "operator":
+        return None
+    return "Недостаточно прав"
+
+
+class Backend:
+
+    def __init__(self):
+        # Один поток — одно соединение: операции не конкурируют за блокировки
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="infodesk-db"
+        )
+        # Запросы к RAG долгие, поэтому разбор очереди идёт в своём потоке,
+        # а с базой работает через поток базы (см. _drain)
+        self.drain_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="infodesk-drain"
+        )
+        self.conn = None
+        self.version = 0
+        self.events = deque(maxlen=EVENTS_KEEP)
+        self.changed = None
+        self.last_request = time.monotonic()
+        self.stats = {"requests": 0, "calls": 0, "errors": 0}
+        self.sessions = {}
+        self.stopping = False
+
+    # ---------- поток базы ----------
+    def _open(self):
+        database.init_db()
+        self.conn = sqlite3.connect(database.DB_PATH)
+        database.use_connection(self.conn)
+
+    def _close(self):
+        database.use_connection(None)
+        if self.conn is not None:
+            self.conn.close()
+
+    def _run_calls(self, calls, session):
+        results, written = [], []
+        for c in calls:
+            op = c.get("op") if isinstance(c, dict) else None
+            if op not in database.API_OPS:
+                results.append({"ok": False, "type": "BackendError",
+                                "error": f"Неизвестная операция: {op}"})
+                continue
+            args, kwargs = c.get("args") or [], c.get("kwargs") or {}
+            denied = _authorize(op, args, kwargs, session)
+            if denied:
+                results.append({"ok": False, "type": "BackendError",
+                                "error": denied})
+                continue
+            try:
+                value = getattr(database, op)(*args, **kwargs)
+            except Exception as e:
+                # Не даём незавершённой операции попасть в чужой commit
+                self.conn.rollback()
+                results.append({"ok": False, "type": type(e).__name__,
+                                "error": str(e)})
+                continue
+            results.append({"ok": True, "value": _public(value)})
+            if op in WRITE_OPS:
+                written.append(op)
+            if op == "delete_user_db":
+                self._drop_sessions(args[0] if args else None)
+        return results, written
+
+    def _maintenance(self):
+        try:
+            import maintenance
+        except ImportError as e:
+            logger.info("Обслуживание базы недоступно: %s", e)
+            return None
+        return maintenance.run_due(
+            is_idle=lambda: time.monotonic() - self.last_request
+            >= MAINTENANCE_IDLE_SECONDS
+        )
+
+    def _drain(self, drain, api_url, healthy, loop):
+        """Проверяет RAG API; после восстановления разбирает очередь.
+
+        Выполняется в потоке разбора, операции с базой передаются в поток
+        базы и его единственное соединение.
+        """
+        if healthy:
+            return {"healthy": drain.check_health(api_url)}
+
+        def db(func, *args):
+            return asyncio.run_coroutine_threadsafe(
+                self.db(func, *args), loop
+            ).result()
+
+        report = drain.drain_pending(
+            api_url, db=db, is_cancelled=lambda: self.stopping
+        )
+        if report["total"] or report["busy"]:
+            logger.info("Разбор очереди: %s",
+                        drain.format_report(report).replace("\n", "; "))
+        return report
+
+    # ---------- сессии ----------
+    def _session(self, headers):
+        sid = headers.get("x-infodesk-session")
+        session = self.sessions.get(sid) if sid else None
+        now = time.monotonic()
+        if session is not None and now - session["seen"] > SESSION_IDLE_SECONDS:
+            del self.sessions[sid]
+            return None
+        if session is not None:
+            session["seen"] = now
+        return session
+
+    def _drop_sessions(self, login):
+        for sid in [k for k, v in self.sessions.items() if v["login"] == login]:
+            del self.sessions[sid]
+
+    async def db(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    # ---------- события ----------
+    async def publish(self, ops):
+        async with self.changed:
+            for op in ops:
+                self.version += 1
+                self.events.append(
+                    {"version": self.version, "op": op, "topic": WRITE_OPS[op]}
+                )
+            self.changed.notify_all()
+
+    async def wait_events(self, since, timeout):
+        async with self.changed:
+            # Сервер перезапускался или клиент отстал больше чем на
+            # EVENTS_KEEP событий — пусть перечитает всё
+            oldest = self.events[0]["version"] if self.events else self.version + 1
+            if since is not None and (since > self.version or since < oldest - 1):
+                return {"version": self.version,
+                        "events": [{"version": self.version, "op": "reset",
+                                    "topic": "*"}]}
+            if since is not None and since == self.version:
+                try:
+                    await asyncio.wait_for(
+                        self.changed.wait_for(lambda: self.version > since),
+                        timeout
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            events = [] if since is None else [
+                e for e in self.events if e["version"] > since
+            ]
+            return {"version": self.version, "events": events}
+
+    # ---------- HTTP ----------
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        if TOKEN and not hmac.compare_digest(
+                headers.get("x-infodesk-token", ""), TOKEN):
+            return 403, {"error": "Неверный токен"}
+
+        if method == "GET" and url.path == "/health":
+            return 200, {"status": "ok", "version": self.version, **self.stats}
+
+        if method == "GET" and url.path == "/events":
+            query = parse_qs(url.query)
+            try:
+                since = int(query["since"][0]) if "since" in query else None
+                timeout = float(query.get("timeout", [LONG_POLL_TIMEOUT])[0])
+            except ValueError:
+                return 400, {"error": "Неверные параметры"}
+            timeout = max(0.0, min(timeout, MAX_LONG_POLL_TIMEOUT))
+            return 200, await self.wait_events(since, timeout)
+
+        if method == "POST" and url.path == "/login":
+            try:
+                data = json.loads(body)
+                login, password = str(data["login"]), str(data["password"])
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": "Ожидается {\"login\", \"password\"}"}
+            user = await self.db(database.check_password, login, password)
+            if user is None:
+                return 403, {"error": "Неверный логин или пароль"}
+            sid = secrets.token_urlsafe(32)
+            self.sessions[sid] = {"login": user["login"], "role": user["role"],
+                                  "seen": time.monotonic()}
+            return 200, {"session": sid, "user": _public(user)}
+
+        if method == "POST" and url.path == "/logout":
+            self.sessions.pop(headers.get("x-infodesk-session"), None)
+            return 200, {"status": "ok"}
+
+        if method == "POST" and url.path == "/call":
+            self.last_request = time.monotonic()
+            try:
+                calls = json.loads(body)["calls"]
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": "Ожидается {\"calls\": [...]}"}
+            if not isinstance(calls, list) or len(calls) > MAX_BATCH:
+                return 400, {"error": f"Не больше {MAX_BATCH} операций за запрос"}
+            results, written = await self.db(
+                self._run_calls, calls, self._session(headers)
+            )
+            self.stats["requests"] += 1
+            self.stats["calls"] += len(calls)
+            self.stats["errors"] += sum(1 for r in results if not r["ok"])
+            if written:
+                await self.publish(written)
+            return 200, {"results": results, "version": self.version}
+
+        return 404, {"error": "Не найдено"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = h.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "Слишком большой запрос"}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length)
+                    status, payload = await self.route(method, target, headers, body)
+
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def maintenance_loop(self):
+        while True:
+            await asyncio.sleep(MAINTENANCE_CHECK_SECONDS)
+            if time.monotonic() - self.last_request < MAINTENANCE_IDLE_SECONDS:
+                continue
+            try:
+                done = await self.db(self._maintenance)
+            except Exception:
+                logger.exception("Ошибка обслуживания базы")
+                continue
+            for item in done or ():
+                logger.info("Обслуживание: %s за %s с", item["task"], item["seconds"])
+
+    async def drain_loop(self, api_url):
+        try:
+            import drain
+        except ImportError as e:
+            logger.info("Разбор очереди через RAG недоступен: %s", e)
+            return
+        loop = asyncio.get_running_loop()
+        healthy = False
+        while True:
+            try:
+                report = await loop.run_in_executor(
+                    self.drain_executor, self._drain, drain, api_url, healthy,
+                    loop
+                )
+            except Exception:
+                logger.exception("Ошибка разбора очереди")
+                report = {"healthy": False}
+            if report.get("resolved"):
+                await self.publish(["answer_pending_bulk"])
+            healthy = not drain.needs_drain(report)
+            await asyncio.sleep(DRAIN_CHECK_SECONDS)
+
+    async def serve(self, host=HOST, port=PORT, maintenance=True, ready=None,
+                    api_url=RAG_API_URL):
+        if not TOKEN and not is_loopback(host):
+            raise ValueError(
+                f"Слушать {host} без INFODESK_BACKEND_TOKEN нельзя: "
+                "задайте токен или используйте 127.0.0.1"
+            )
+        self.changed = asyncio.Condition()
+        await self.db(self._open)
+        server = await asyncio.start_server(self.handle, host, port)
+        address = server.sockets[0].getsockname()
+        logger.info("Сервер базы %s слушает %s:%s", database.DB_PATH, *address[:2])
+        if ready is not None:
+            ready(address)
+        tasks = [asyncio.ensure_future(self.maintenance_loop())] if maintenance else []
+        if api_url:
+            tasks.append(asyncio.ensure_future(self.drain_loop(api_url)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stopping = True
+            for t in tasks:
+                t.cancel()
+            await self.db(self._close)
+            self.executor.shutdown()
+            self.drain_executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный сервер базы InfoDesk")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--no-maintenance", action="store_true",
+                        help="не выполнять задачи maintenance.py в простое")
+    parser.add_argument("--api-url", default=RAG_API_URL,
+                        help="RAG API (/ask) для разбора очереди после его сбоя")
+    args = parser.parse_args(argv)
+
+    if database.BACKEND_URL:
+        parser.error("сервер сам работает с базой: уберите INFODESK_BACKEND_URL")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    database.DB_PATH = args.db
+    if not TOKEN and not is_loopback(args.host):
+        parser.error(f"слушать {args.host} без INFODESK_BACKEND_TOKEN нельзя")
+    try:
+        asyncio.run(Backend().serve(
+            args.host, args.port, maintenance=not args.no_maintenance,
+            api_url=args.api_url
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
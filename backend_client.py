@@ -0,0 +1,250 @@
+"""Клиент локального сервера InfoDesk (backend.py).
+
+install() подменяет функции database.API_OPS вызовами POST /call, так что
+остальной код приложения не знает, работает ли он с data.db напрямую или
+через сервер. Несколько операций можно отправить одним запросом через
+Batch. ChangeListener ждёт изменений на сервере (GET /events, long-poll)
+и сообщает о них сигналом changed.
+
+Пароль проверяет сервер: check_password отправляет POST /login и
+запоминает выданную сессию, с которой выполняются остальные операции.
+Консольные утилиты могут войти сами через INFODESK_BACKEND_LOGIN и
+INFODESK_BACKEND_PASSWORD.
+"""
+import os
+import sqlite3
+import functools
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from instrumentation import instrumented
+
+BACKEND_TOKEN = os.environ.get("INFODESK_BACKEND_TOKEN", "")
+BACKEND_LOGIN = os.environ.get("INFODESK_BACKEND_LOGIN", "")
+BACKEND_PASSWORD = os.environ.get("INFODESK_BACKEND_PASSWORD", "")
+REQUEST_TIMEOUT = 30
+LONG_POLL_TIMEOUT = 25
+RETRY_DELAY = 5
+
+_url = None
+_session_id = None
+_local = threading.local()
+_listener = None
+
+
+class BackendError(Exception):
+    pass
+
+
+def _session():
+    # requests импортируется только при работе через сервер
+    session = getattr(_local, "session", None)
+    if session is None:
+        import requests
+        session = requests.Session()
+        if BACKEND_TOKEN:
+            session.headers["X-InfoDesk-Token"] = BACKEND_TOKEN
+        _local.session = session
+    return session
+
+
+def _raise(result):
+    # Ошибки SQLite поднимаются тем же типом, что и без сервера
+    exc_type = getattr(sqlite3, result.get("type") or "", None)
+    if not (isinstance(exc_type, type) and issubclass(exc_type, sqlite3.Error)):
+        exc_type = BackendError
+    raise exc_type(result.get("error") or "Ошибка сервера")
+
+
+def _value(value):
+    # JSON не различает кортежи и списки: строки таблиц снова делаем кортежами
+    if isinstance(value, list) and value and all(isinstance(v, list) for v in value):
+        return [tuple(v) for v in value]
+    return value
+
+
+def login(login, password, url=None):
+    """Вход на сервере. Запись пользователя без пароля или None."""
+    global _session_id
+    resp = _session().post(
+        f"{url or _url}/login",
+        json={"login": login, "password": password},
+        timeout=REQUEST_TIMEOUT
+    )
+    if resp.status_code == 403:
+        return None
+    if resp.status_code != 200:
+        raise BackendError(f"Сервер базы ответил {resp.status_code}: {resp.text[:200]}")
+    data = resp.json()
+    _session_id = data["session"]
+    return data["user"]
+
+
+def logout(url=None):
+    global _session_id
+    if _session_id is None:
+        return
+    try:
+        _session().post(f"{url or _url}/logout", headers=_headers(),
+                        timeout=REQUEST_TIMEOUT)
+    except Exception:
+        # Не вышло — сессия истечёт сама при перезапуске сервера
+        pass
+    _session_id = None
+
+
+def _headers():
+    if _session_id is None and BACKEND_LOGIN:
+        login(BACKEND_LOGIN, BACKEND_PASSWORD)
+    return {"X-InfoDesk-Session": _session_id} if _session_id else {}
+
+
+def call_batch(calls, url=None):
+    """Выполняет [(op, args, kwargs), ...] одним запросом, список значений.
+
+    Если какая-то операция завершилась ошибкой, поднимается первая ошибка
+    (остальные операции сервер всё равно выполнил).
+    """
+    resp = _session().post(
+        f"{url or _url}/call",
+        json={"calls": [
+            {"op": op, "args": list(args), "kwargs": kwargs}
+            for op, args, kwargs in calls
+        ]},
+        headers=_headers(),
+        timeout=REQUEST_TIMEOUT
+    )
+    if resp.status_code != 200:
+        raise BackendError(f"Сервер базы ответил {resp.status_code}: {resp.text[:200]}")
+    values = []
+    for result in resp.json()["results"]:
+        if not result["ok"]:
+            _raise(result)
+        values.append(_value(result["value"]))
+    return values
+
+
+def call(op, *args, **kwargs):
+    return call_batch([(op, args, kwargs)])[0]
+
+
+class Batch:
+    """Копит операции и отправляет их одним запросом при выходе из with.
+
+        with Batch() as b:
+            user = b.call("get_user", login)
+            recent = b.call("list_user_questions_recent", login)
+        user.value, recent.value
+    """
+
+    class Result:
+        value = None
+
+    def __init__(self, url=None):
+        self.url = url
+        self.calls = []
+        self.results = []
+
+    def call(self, op, *args, **kwargs):
+        self.calls.append((op, args, kwargs))
+        self.results.append(Batch.Result())
+        return self.results[-1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.calls:
+            for result, value in zip(self.results, call_batch(self.calls, self.url)):
+                result.value = value
+        return False
+
+
+def _proxy(op, func):
+    @instrumented(f"db.{op}")
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return call(op, *args, **kwargs)
+    return wrapper
+
+
+def install(namespace, url):
+    """Подменяет функции API_OPS в модуле database вызовами сервера."""
+    global _url
+    _url = url.rstrip("/")
+    for op in namespace["API_OPS"]:
+        namespace[op] = _proxy(op, namespace[op])
+
+    # Пароль проверяет сервер, он же выдаёт сессию для остальных операций
+    @instrumented("db.check_password")
+    def check_password(login_name, password):
+        return login(login_name, password)
+
+    namespace["check_password"] = check_password
+
+
+def enabled():
+    return _url is not None
+
+
+class ChangeListener(QObject):
+    """Ждёт изменений на сервере; changed — список событий
+    {"version", "op", "topic"}, topic — "questions" или "users".
+
+    Опрос идёт в фоновом потоке-демоне: запрос long-poll висит до
+    LONG_POLL_TIMEOUT секунд и не должен задерживать выход из приложения.
+    """
+
+    changed = pyqtSignal(list)
+
+    def __init__(self, url=None, timeout=LONG_POLL_TIMEOUT, parent=None):
+        super().__init__(parent)
+        self.url = url or _url
+        self.timeout = timeout
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="infodesk-events", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        import requests
+
+        session = requests.Session()
+        if BACKEND_TOKEN:
+            session.headers["X-InfoDesk-Token"] = BACKEND_TOKEN
+        since = None
+        while not self._stopped.is_set():
+            params = {"timeout": self.timeout}
+            if since is not None:
+                params["since"] = since
+            try:
+                resp = session.get(
+                    f"{self.url}/events", params=params,
+                    timeout=self.timeout + REQUEST_TIMEOUT
+                )
+                data = resp.json()
+            except (requests.RequestException, ValueError):
+                self._stopped.wait(RETRY_DELAY)
+                continue
+            if since is not None and data["events"] and not self._stopped.is_set():
+                self.changed.emit(data["events"])
+            since = data["version"]
+
+
+def listener():
+    """Общий ChangeListener приложения; запускается при первом обращении."""
+    global _listener
+    if _listener is None:
+        _listener = ChangeListener()
+        _listener.start()
+    return _listener
@@ -0,0 +1,152 @@
+"""Пакетная отправка вопросов в RAG API без графического интерфейса.
+
+    python batch_cli.py questions.csv --api-url http://host:5000/ask --workers 8
+
+Вопросы читаются из TXT, CSV или JSONL (utils.parse_questions_file) и
+отправляются параллельно ограниченным пулом потоков через rag.ask_question.
+Результаты пишутся в таблицу questions пачками, как это делает окно
+пользователя: уверенный ответ — answered с оператором RAG, остальное —
+pending для операторов. В конце печатается пропускная способность.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+import database
+import instrumentation
+from rag import DEFAULT_API_URL, RagApiError, ask_question, clean_text, is_failed_answer
+from utils import parse_questions_file
+
+BATCH_USER = "BATCH"
+
+
+def _ask(api_url, question, timeout):
+    t0 = time.perf_counter()
+    try:
+        answer = clean_text(ask_question(api_url, question, timeout=timeout))
+        route = "operator" if is_failed_answer(answer) else "rag"
+        error = None
+    except (RagApiError, requests.exceptions.RequestException) as e:
+        answer, route, error = "", "api_error", str(e)
+    return {
+        "question": question,
+        "answer": answer,
+        "route": route,
+        "error": error,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+def run_batch(items, api_url, workers=8, timeout=60, user=BATCH_USER,
+              batch_size=200, store=True, on_result=None):
+    """Прогоняет вопросы через RAG. Возвращает Counter по маршрутам."""
+    routes = Counter()
+    pending_rows = []
+    queue = deque(q for q, _ in items)
+    in_flight = set()
+
+    def flush():
+        if store and pending_rows:
+            database.add_questions_bulk(pending_rows)
+        pending_rows.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queue or in_flight:
+            # Не больше 2*workers задач в полёте, чтобы не держать весь файл в памяти
+            while queue and len(in_flight) < workers * 2:
+                in_flight.add(pool.submit(_ask, api_url, queue.popleft(), timeout))
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                result = future.result()
+                routes[result["route"]] += 1
+                if result["route"] == "rag":
+                    pending_rows.append(
+                        (user, result["question"], result["answer"], "answered", "RAG")
+                    )
+                else:
+                    pending_rows.append(
+                        (user, result["question"], None, "pending", None)
+                    )
+                if on_result is not None:
+                    on_result(result)
+
+            if len(pending_rows) >= batch_size:
+                flush()
+    flush()
+    return routes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="файл с вопросами (.txt, .csv, .jsonl)")
+    parser.add_argument("--api-url", default=os.environ.get("INFODESK_API_URL", DEFAULT_API_URL))
+    parser.add_argument("--workers", type=int, default=8,
+                        help="одновременных запросов к RAG API")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--user", default=BATCH_USER,
+                        help="от чьего имени сохранять вопросы")
+    parser.add_argument("--batch-size", type=int, default=200,
+                        help="сколько строк вставлять в базу за раз")
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="не записывать результаты в базу")
+    parser.add_argument("--out", help="сохранить ответы в JSONL (для сравнения прогонов)")
+    args = parser.parse_args(argv)
+
+    try:
+        items = parse_questions_file(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось прочитать файл: {e}", file=sys.stderr)
+        return 2
+    if not items:
+        print("В файле нет вопросов.", file=sys.stderr)
+        return 2
+
+    database.DB_PATH = args.db
+    if not args.dry_run:
+        database.init_db()
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    done = [0]
+    total = len(items)
+
+    def on_result(result):
+        done[0] += 1
+        if out is not None:
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        if done[0] % 100 == 0 or done[0] == total:
+            print(f"\r{done[0]}/{total}", end="", file=sys.stderr, flush=True)
+
+    t0 = time.perf_counter()
+    try:
+        routes = run_batch(
+            items, args.api_url, workers=args.workers, timeout=args.timeout,
+            user=args.user, batch_size=args.batch_size,
+            store=not args.dry_run, on_result=on_result,
+        )
+    finally:
+        if out is not None:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(file=sys.stderr)
+
+    ask = next((r for r in instrumentation.snapshot() if r["op"] == "rag.ask"), None)
+    print(f"Вопросов: {total} за {elapsed:.1f} с ({total / elapsed:.1f} в секунду), "
+          f"потоков: {args.workers}")
+    print(f"Ответил RAG: {routes['rag']}, оператору: {routes['operator']}, "
+          f"ошибок API: {routes['api_error']}")
+    if ask:
+        print(f"Задержка /ask, мс: p50 {ask['p50_ms']}, p95 {ask['p95_ms']}, "
+              f"p99 {ask['p99_ms']}, max {ask['max_ms']}")
+    return 0 if routes["api_error"] < total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Бенчмарк гибридного поиска: FAISS, BM25 и их слияние (RRF).
+
+Запуск из корня репозитория (нужна папка data с lx.xlsx):
+    python -m benchmarks.bench_hybrid --sample 300 --budget-ms 5
+
+Запросы — перефразировки вопросов базы знаний (сокращения, обрывки,
+опечатки). Для каждого способа поиска считаются recall@k, доля запросов,
+которые ушли бы оператору, и задержки p50/p99. Если p99 добавочной
+задержки BM25+RRF превышает бюджет, скрипт завершается с кодом 1.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import rag_backends
+import rag_server
+from bm25 import reciprocal_rank_fusion
+from rag_cache import EmbeddingCache
+from benchmarks.common import percentile, make_paraphrases
+
+
+def load(data_dir, backend):
+    rag_server.init_nlp()
+    rag_server.load_knowledge_base(data_dir)
+    rag_server.embedder = rag_backends.load_embedder(backend)
+    rag_server.build_index()
+    # Кэш отключён, иначе повторные запросы искажают задержки
+    rag_server.embedding_cache = EmbeddingCache(0)
+
+
+def run(queries, k):
+    stats = {
+        name: {"hits": 0, "answered": 0, "correct_top1": 0, "ms": []}
+        for name in ("dense", "bm25", "hybrid")
+    }
+    extra_ms = []
+    n_cand = max(k, rag_server.HYBRID_CANDIDATES)
+
+    for text, target, _ in queries:
+        proc_q = rag_server.preprocess_text(text)
+        q_emb = rag_server.embed_query(proc_q)
+
+        t = time.perf_counter()
+        D, I = rag_server.index.search(q_emb, n_cand)
+        dense_ms = (time.perf_counter() - t) * 1000
+        dense = [int(i) for i in I[0] if i >= 0]
+
+        t = time.perf_counter()
+        sparse, _ = rag_server.bm25_index.search(proc_q, n_cand)
+        sparse_ms = (time.perf_counter() - t) * 1000
+        sparse_ids = [doc for doc, _ in sparse]
+
+        t = time.perf_counter()
+        reciprocal_rank_fusion([dense, sparse_ids], limit=k)
+        fusion_ms = (time.perf_counter() - t) * 1000
+
+        # Итог — как в /ask, вместе с порогами уверенности
+        hybrid = rag_server.retrieve(proc_q, k)
+
+        results = {
+            "dense": (dense[:k], float(D[0][0]) if dense else float("inf")),
+            "bm25": (sparse_ids[:k], 0.0 if sparse_ids else float("inf")),
+            "hybrid": ([d for d, _ in hybrid],
+                       hybrid[0][1] if hybrid else float("inf")),
+        }
+        timings = {
+            "dense": dense_ms,
+            "bm25": sparse_ms,
+            "hybrid": dense_ms + sparse_ms + fusion_ms,
+        }
+        extra_ms.append(sparse_ms + fusion_ms)
+
+        for name, (ids, top_distance) in results.items():
+            st = stats[name]
+            st["ms"].append(timings[name])
+            if target in ids:
+                st["hits"] += 1
+            if top_distance <= rag_server.DISTANCE_THRESHOLD:
+                st["answered"] += 1
+                if ids and ids[0] == target:
+                    st["correct_top1"] += 1
+
+    n = len(queries) or 1
+    report = {}
+    for name, st in stats.items():
+        report[name] = {
+            f"recall@{k}": round(st["hits"] / n, 4),
+            "operator_rate": round(1 - st["answered"] / n, 4),
+            "correct_answer_rate": round(st["correct_top1"] / n, 4),
+            "p50_ms": round(percentile(st["ms"], 50), 3),
+            "p99_ms": round(percentile(st["ms"], 99), 3),
+        }
+    # У BM25 нет порога расстояния, доля оператора для него не показательна
+    report["bm25"].pop("operator_rate")
+    report["bm25"].pop("correct_answer_rate")
+    report["hybrid_overhead"] = {
+        "p50_ms": round(percentile(extra_ms, 50), 3),
+        "p99_ms": round(percentile(extra_ms, 99), 3),
+    }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", default=rag_server.DATA_DIR)
+    parser.add_argument("--backend", default=rag_backends.INFERENCE_BACKEND)
+    parser.add_argument("--sample", type=int, default=300,
+                        help="сколько перефразировок проверить (0 — все)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget-ms", type=float, default=5.0,
+                        help="допустимая p99 добавочная задержка BM25+RRF")
+    parser.add_argument("--json", help="куда сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    load(args.data_dir, args.backend)
+
+    queries = make_paraphrases(
+        rag_server.questions, rag_server.abbreviations, seed=args.seed
+    )
+    rnd = random.Random(args.seed)
+    if args.sample and len(queries) > args.sample:
+        queries = rnd.sample(queries, args.sample)
+
+    report = run(queries, args.k)
+    report["queries"] = len(queries)
+    report["budget_ms"] = args.budget_ms
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    if report["hybrid_overhead"]["p99_ms"] > args.budget_ms:
+        print(
+            f"Бюджет задержки превышен: p99 "
+            f"{report['hybrid_overhead']['p99_ms']} мс > {args.budget_ms} мс",
+            file=sys.stderr
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Сравнение бэкендов инференса RAG-сервера: PyTorch и ONNX Runtime (int8).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_inference --questions questions.txt --json out.json
+
+Для каждого бэкенда измеряются задержка эмбеддинга и генерации
+(p50/p95), пропускная способность и близость ответов к PyTorch-версии.
+Генерация жадная (do_sample=False), чтобы ответы были сравнимы.
+"""
+import argparse
+import difflib
+import json
+import statistics
+import time
+
+import numpy as np
+
+import rag_backends
+from benchmarks.common import percentile
+
+SAMPLE_QUESTIONS = [
+    "Как оформить отпуск?",
+    "Где посмотреть расчётный лист по зп?",
+    "Как получить справку НДФЛ?",
+    "Как продлить СТД?",
+    "Куда сдавать авансовый отчёт?",
+    "Как получить ЭЦП?",
+    "Сколько длится отпуск по БиР?",
+    "Как попасть в кадровый резерв?",
+]
+
+
+def cosine(a, b):
+    a = np.asarray(a, dtype=np.float32).ravel()
+    b = np.asarray(b, dtype=np.float32).ravel()
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b)) or 1.0
+    return float(np.dot(a, b) / denom)
+
+
+def run_backend(name, questions, max_new_tokens, batch_size):
+    t0 = time.perf_counter()
+    embedder, generator = rag_backends.load_models(name)
+    load_s = time.perf_counter() - t0
+
+    # Прогрев
+    embedder.encode(questions[:1], convert_to_numpy=True)
+    generator(questions[0], max_new_tokens=4, do_sample=False)
+
+    embed_ms, embeddings = [], []
+    for q in questions:
+        t = time.perf_counter()
+        embeddings.append(embedder.encode([q], convert_to_numpy=True)[0])
+        embed_ms.append((time.perf_counter() - t) * 1000)
+
+    t = time.perf_counter()
+    for start in range(0, len(questions), batch_size):
+        embedder.encode(questions[start:start + batch_size], convert_to_numpy=True)
+    batch_s = time.perf_counter() - t
+
+    gen_ms, answers = [], []
+    t_gen = time.perf_counter()
+    for q in questions:
+        t = time.perf_counter()
+        out = generator(q, max_new_tokens=max_new_tokens, do_sample=False)
+        gen_ms.append((time.perf_counter() - t) * 1000)
+        answers.append(out[0]["generated_text"])
+    gen_s = time.perf_counter() - t_gen
+
+    return {
+        "backend": name,
+        "load_s": round(load_s, 2),
+        "embed_p50_ms": round(percentile(embed_ms, 50), 2),
+        "embed_p95_ms": round(percentile(embed_ms, 95), 2),
+        "embed_batch_qps": round(len(questions) / batch_s, 1) if batch_s else 0.0,
+        "generate_p50_ms": round(percentile(gen_ms, 50), 1),
+        "generate_p95_ms": round(percentile(gen_ms, 95), 1),
+        "generate_mean_ms": round(statistics.mean(gen_ms), 1),
+        "requests_per_s": round(len(questions) / gen_s, 2) if gen_s else 0.0,
+        "_embeddings": embeddings,
+        "_answers": answers,
+    }
+
+
+def compare(reference, other):
+    emb_sim = [
+        cosine(a, b)
+        for a, b in zip(reference["_embeddings"], other["_embeddings"])
+    ]
+    text_sim = [
+        difflib.SequenceMatcher(None, a, b).ratio()
+        for a, b in zip(reference["_answers"], other["_answers"])
+    ]
+    exact = sum(a == b for a, b in zip(reference["_answers"], other["_answers"]))
+    return {
+        "embedding_cosine_mean": round(statistics.mean(emb_sim), 4),
+        "embedding_cosine_min": round(min(emb_sim), 4),
+        "answer_text_similarity": round(statistics.mean(text_sim), 4),
+        "answer_exact_match": round(exact / len(text_sim), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", help="файл с вопросами, по одному в строке")
+    parser.add_argument("--backends", default="torch,onnx")
+    parser.add_argument("--max-new-tokens", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--json", help="куда сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    questions = SAMPLE_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as fh:
+            questions = [ln.strip() for ln in fh if ln.strip()]
+
+    results = [
+        run_backend(name.strip(), questions, args.max_new_tokens, args.batch_size)
+        for name in args.backends.split(",") if name.strip()
+    ]
+
+    reference = results[0]
+    for res in results[1:]:
+        res["vs_" + reference["backend"]] = compare(reference, res)
+
+    report = [
+        {k: v for k, v in res.items() if not k.startswith("_")}
+        for res in results
+    ]
+    for res in report:
+        print(f"== {res['backend']}")
+        for key, value in res.items():
+            if key != "backend":
+                print(f"  {key}: {value}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
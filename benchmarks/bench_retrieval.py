@@ -0,0 +1,250 @@
+"""Качество и скорость поиска по базе знаний (lx.xlsx).
+
+Запуск из корня репозитория (нужна папка data с lx.xlsx):
+    python -m benchmarks.bench_retrieval --json retrieval.json
+    python -m benchmarks.bench_retrieval --compare retrieval.json
+
+Запросы — отложенные перефразировки вопросов базы (сокращения, обрывки,
+опечатки), в индекс они не попадают. Для каждой комбинации варианта
+предобработки, типа индекса FAISS и top_k считаются hit@k, MRR и задержка
+одного запроса (предобработка + эмбеддинг + поиск). Отчёт содержит хэш
+коммита; в режиме --compare он сравнивается с предыдущим, и при падении
+hit@k или MRR больше допуска скрипт завершается с кодом 1.
+"""
+import argparse
+import json
+import random
+import re
+import subprocess
+import sys
+import time
+
+import faiss
+import numpy as np
+
+import rag_backends
+import rag_server
+from benchmarks.common import percentile, make_paraphrases
+
+TOP_K = (1, 3, 5)
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 8
+
+
+def _raw(text):
+    text = re.sub(r'[^\w\s]', ' ', str(text).lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+PREPROCESS = {
+    # Как в /ask: сокращения, исправление опечаток, леммы без стоп-слов
+    "full": lambda text: rag_server.preprocess_text(text),
+    # Без difflib-исправления опечаток (самая дорогая часть)
+    "no_spellfix": lambda text: rag_server.lemmatize_text(text),
+    # Только нижний регистр и пунктуация
+    "raw": _raw,
+}
+
+
+def build_index(kind, embeddings):
+    dim = embeddings.shape[1]
+    if kind == "flat_l2":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "flat_ip":
+        index = faiss.IndexFlatIP(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind == "ivf":
+        nlist = max(1, int(len(embeddings) ** 0.5))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(embeddings)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"Неизвестный тип индекса: {kind}")
+    index.add(embeddings)
+    return index
+
+
+def _encode(texts, normalize):
+    emb = rag_server.embedder.encode(texts, convert_to_numpy=True).astype(np.float32)
+    if normalize:
+        faiss.normalize_L2(emb)
+    return emb
+
+
+def run(queries, variants, index_kinds, top_k):
+    """[{variant, index, k, hit@k, mrr, p50_ms, ...}] для всех комбинаций."""
+    # Одинаковые вопросы в базе считаются одним правильным ответом
+    norm_q = [_raw(q) for q in rag_server.questions]
+    correct = {}
+    for doc_id, q in enumerate(norm_q):
+        correct.setdefault(q, set()).add(doc_id)
+
+    results = []
+    for variant in variants:
+        prep = PREPROCESS[variant]
+        corpus = [prep(q) for q in rag_server.questions]
+
+        for kind in index_kinds:
+            normalize = kind == "flat_ip"
+            t = time.perf_counter()
+            index = build_index(kind, _encode(corpus, normalize))
+            build_s = time.perf_counter() - t
+
+            for k in top_k:
+                hits, rr, ms = 0, 0.0, []
+                for text, target, _ in queries:
+                    t = time.perf_counter()
+                    q_emb = _encode([prep(text)], normalize)
+                    _, I = index.search(q_emb, k)
+                    ms.append((time.perf_counter() - t) * 1000)
+
+                    good = correct[norm_q[target]]
+                    for rank, doc_id in enumerate(I[0], 1):
+                        if int(doc_id) in good:
+                            hits += 1
+                            rr += 1 / rank
+                            break
+
+                n = len(queries) or 1
+                results.append({
+                    "variant": variant,
+                    "index": kind,
+                    "k": k,
+                    "hit@k": round(hits / n, 4),
+                    "mrr": round(rr / n, 4),
+                    "p50_ms": round(percentile(ms, 50), 3),
+                    "p95_ms": round(percentile(ms, 95), 3),
+                    "p99_ms": round(percentile(ms, 99), 3),
+                    "build_s": round(build_s, 3),
+                })
+                print(
+                    f"{variant:12s} {kind:8s} k={k}: hit@k {results[-1]['hit@k']:.3f} "
+                    f"MRR {results[-1]['mrr']:.3f} p95 {results[-1]['p95_ms']} мс",
+                    file=sys.stderr
+                )
+    return results
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def compare(base, new, tolerance, latency_ratio):
+    """Сравнивает два отчёта. Возвращает (строки, есть ли регрессия качества)."""
+    key = lambda r: (r["variant"], r["index"], r["k"])
+    old = {key(r): r for r in base["results"]}
+    lines = [
+        f"база: {base['meta'].get('commit') or '?'}  ->  "
+        f"текущий: {new['meta'].get('commit') or '?'}"
+    ]
+    regressed = False
+    for r in new["results"]:
+        prev = old.get(key(r))
+        if prev is None:
+            continue
+        d_hit = r["hit@k"] - prev["hit@k"]
+        d_mrr = r["mrr"] - prev["mrr"]
+        notes = []
+        if d_hit < -tolerance or d_mrr < -tolerance:
+            notes.append("ТОЧНОСТЬ")
+            regressed = True
+        if prev["p95_ms"] and r["p95_ms"] > prev["p95_ms"] * latency_ratio:
+            notes.append("задержка")
+        lines.append(
+            f"{r['variant']:12s} {r['index']:8s} k={r['k']}  "
+            f"hit@k {prev['hit@k']:.3f}->{r['hit@k']:.3f} ({d_hit:+.3f})  "
+            f"MRR {prev['mrr']:.3f}->{r['mrr']:.3f} ({d_mrr:+.3f})  "
+            f"p95 {prev['p95_ms']}->{r['p95_ms']} мс"
+            + (f"  !! {', '.join(notes)}" if notes else "")
+        )
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", default=rag_server.DATA_DIR)
+    parser.add_argument("--backend", default=rag_backends.INFERENCE_BACKEND)
+    parser.add_argument("--variants", default=",".join(PREPROCESS),
+                        help="варианты предобработки через запятую")
+    parser.add_argument("--indexes", default="flat_l2,flat_ip,hnsw,ivf",
+                        help="типы индексов через запятую")
+    parser.add_argument("--top-k", default=",".join(map(str, TOP_K)))
+    parser.add_argument("--sample", type=int, default=0,
+                        help="сколько перефразировок проверить (0 — все)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="куда сохранить отчёт")
+    parser.add_argument("--compare", metavar="BASE",
+                        help="сравнить с отчётом BASE")
+    parser.add_argument("--report", metavar="NEW",
+                        help="вместе с --compare: взять готовый отчёт вместо прогона")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="допустимое падение hit@k и MRR")
+    parser.add_argument("--latency-ratio", type=float, default=1.25,
+                        help="во сколько раз может вырасти p95 без пометки")
+    args = parser.parse_args(argv)
+
+    if args.report:
+        with open(args.report, "r", encoding="utf-8") as fh:
+            report = json.load(fh)
+    else:
+        rag_server.init_nlp()
+        rag_server.load_knowledge_base(args.data_dir)
+        rag_server.embedder = rag_backends.load_embedder(args.backend)
+
+        queries = make_paraphrases(
+            rag_server.questions, rag_server.abbreviations, seed=args.seed
+        )
+        if args.sample and len(queries) > args.sample:
+            queries = random.Random(args.seed).sample(queries, args.sample)
+
+        commit, dirty = git_revision()
+        report = {
+            "meta": {
+                "commit": commit,
+                "dirty": dirty,
+                "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "backend": args.backend,
+                "documents": len(rag_server.questions),
+                "queries": len(queries),
+                "seed": args.seed,
+            },
+            "results": run(
+                queries,
+                [v for v in args.variants.split(",") if v],
+                [i for i in args.indexes.split(",") if i],
+                [int(k) for k in args.top_k.split(",") if k],
+            ),
+        }
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    if not args.compare:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    with open(args.compare, "r", encoding="utf-8") as fh:
+        base = json.load(fh)
+    lines, regressed = compare(base, report, args.tolerance, args.latency_ratio)
+    print("\n".join(lines))
+    if regressed:
+        print(f"Качество поиска упало больше чем на {args.tolerance}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Время холодного запуска настольного приложения.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --runs 5 --offscreen
+
+Каждый прогон — отдельный процесс main.py с INFODESK_STARTUP_PROBE=1:
+приложение печатает отметки времени (импорты, QApplication, окно, готовое
+окно входа) и сразу закрывается. Первый прогон идёт на пустой базе (с
+созданием схемы), остальные — на уже готовой. Отдельно через
+python -X importtime снимается разбивка времени импорта по модулям.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import percentile
+
+PROBE_PREFIX = "STARTUP "
+
+
+def run_once(env, timeout):
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "main.py"], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    marks = None
+    for line in proc.stdout:
+        if line.startswith(PROBE_PREFIX):
+            marks = json.loads(line[len(PROBE_PREFIX):])
+            marks["wall_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            break
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    if marks is None:
+        raise RuntimeError(
+            "main.py не сообщил о готовности:\n" + proc.stderr.read()[-2000:]
+        )
+    return marks
+
+
+def import_breakdown(env, top):
+    """Модули первого уровня, которые импортирует main, по убыванию времени."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        except ValueError:
+            continue
+        if not self_us.strip().isdigit():
+            continue
+        # После «|» один пробел, дальше по два на уровень вложенности
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+
+    # Модули, импортированные самим main (отступ на уровень глубже)
+    main_depth = next((d for d, n, _, _ in rows if n == "main"), 0)
+    direct = [
+        {"module": n, "cumulative_ms": round(c / 1000, 1), "self_ms": round(s / 1000, 1)}
+        for d, n, s, c in rows if d == main_depth + 1
+    ]
+    direct.sort(key=lambda r: -r["cumulative_ms"])
+    total = next((c for d, n, _, c in rows if n == "main"), 0)
+    return {"main_total_ms": round(total / 1000, 1), "modules": direct[:top]}
+
+
+def summarize(runs, key):
+    values = [r[key] for r in runs]
+    return {
+        "p50": round(percentile(values, 50), 1),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offscreen", action="store_true",
+                        help="QT_QPA_PLATFORM=offscreen (для CI без дисплея)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--top", type=int, default=15,
+                        help="сколько модулей показать в разбивке импорта")
+    parser.add_argument("--json", help="куда сохранить отчёт")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="infodesk-startup-") as tmp:
+        env = dict(os.environ)
+        env["INFODESK_STARTUP_PROBE"] = "1"
+        env["INFODESK_DB_PATH"] = os.path.join(tmp, "startup.db")
+        env.pop("INFODESK_PROFILE", None)
+        if args.offscreen:
+            env["QT_QPA_PLATFORM"] = "offscreen"
+
+        runs = [run_once(env, args.timeout) for _ in range(max(1, args.runs))]
+        imports = import_breakdown(env, args.top)
+
+    warm = runs[1:] or runs
+    keys = ("imports_ms", "qapplication_ms", "main_window_ms", "shown_ms",
+            "login_ready_ms", "wall_ms")
+    report = {
+        "runs": len(runs),
+        "first_run": runs[0],
+        "warm": {key: summarize(warm, key) for key in keys},
+        "imports": imports,
+    }
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Общие помощники для бенчмарков."""
+
+
+def percentile(values, p):
+    """Перцентиль p (0..100) с линейной интерполяцией."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def make_paraphrases(questions, abbreviations, seed=0, per_question=3):
+    """Детерминированные «перефразировки» вопросов базы знаний.
+
+    Возвращает [(запрос, номер_исходного_вопроса, вид)], где вид —
+    abbr (расшифровки заменены сокращениями), short (осталось 2-3 слова)
+    или typo (опечатка в одном слове).
+    """
+    import random
+    import re
+
+    rnd = random.Random(seed)
+    reverse = sorted(
+        ((desc.lower(), abbr) for abbr, desc in abbreviations.items()),
+        key=lambda kv: -len(kv[0])
+    )
+    out = []
+    for idx, q in enumerate(questions):
+        q = str(q).strip()
+        if not q:
+            continue
+        variants = []
+
+        abbr_q = q
+        for desc, abbr in reverse:
+            abbr_q = re.sub(re.escape(desc), abbr, abbr_q, flags=re.IGNORECASE)
+        if abbr_q != q:
+            variants.append((abbr_q, "abbr"))
+
+        words = re.findall(r"\w+", q)
+        long_words = [w for w in words if len(w) > 3]
+        if len(long_words) > 3:
+            keep = sorted(rnd.sample(range(len(long_words)), rnd.randint(2, 3)))
+            variants.append((" ".join(long_words[i] for i in keep), "short"))
+
+        if long_words:
+            w = rnd.choice(long_words)
+            pos = rnd.randrange(len(w) - 1)
+            typo = w[:pos] + w[pos + 1] + w[pos] + w[pos + 2:]
+            variants.append((q.replace(w, typo, 1), "typo"))
+
+        for text, kind in variants[:per_question]:
+            out.append((text, idx, kind))
+    return out
@@ -0,0 +1,272 @@
+"""Нагрузочный тест клиента: пользователи, операторы, RAG API и SQLite.
+
+Запуск из корня репозитория (сеть и модели не нужны):
+    python -m benchmarks.load_test --users 20 --operators 3 --questions 30
+
+Без GUI гоняет тот же путь, что и приложение: rag.ask_question ->
+is_failed_answer -> database.add_question, а операторы разбирают очередь
+через list_pending_questions / set_answer. По умолчанию поднимается
+локальная заглушка /ask (benchmarks.stub_server), база создаётся во
+временной папке. В отчёте — пропускная способность, перцентили задержек
+RAG и операций с базой, ошибки «database is locked» и глубина очереди.
+С --max-lock-errors скрипт завершается с кодом 1 при превышении порога.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+import database
+import instrumentation
+from rag import RagApiError, ask_question, clean_text, is_failed_answer
+from benchmarks.common import percentile
+from benchmarks.stub_server import StubConfig, start_stub_server
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ask_ms = []
+        self.routes = Counter()         # rag / operator / api_error
+        self.answered_by_operator = 0
+        self.lock_errors = Counter()    # операция -> число «database is locked»
+        self.other_errors = Counter()
+        self.queue_depth = []
+
+    def add(self, **kwargs):
+        with self.lock:
+            for key, value in kwargs.items():
+                getattr(self, key).append(value)
+
+
+def _count_db_error(stats, op, error):
+    with stats.lock:
+        if "locked" in str(error) or "busy" in str(error):
+            stats.lock_errors[op] += 1
+        else:
+            stats.other_errors[f"{op}: {error}"] += 1
+
+
+def _db_call(stats, op, func, *args, **kwargs):
+    """Вызов функции database.py с учётом ошибок блокировки."""
+    try:
+        func(*args, **kwargs)
+        return True
+    except sqlite3.OperationalError as e:
+        _count_db_error(stats, op, e)
+        return False
+
+
+def user_worker(name, api_url, n_questions, think_ms, stats, seed):
+    rnd = random.Random(seed)
+    for i in range(n_questions):
+        question = f"Вопрос {i} от {name}: как оформить заявку №{rnd.randint(1, 500)}?"
+        t0 = time.perf_counter()
+        try:
+            answer = ask_question(api_url, question, timeout=30)
+            route = "operator" if is_failed_answer(answer) else "rag"
+        except (RagApiError, requests.exceptions.RequestException):
+            answer, route = None, "api_error"
+        stats.add(ask_ms=(time.perf_counter() - t0) * 1000)
+        with stats.lock:
+            stats.routes[route] += 1
+
+        if route == "rag":
+            _db_call(stats, "add_question", database.add_question,
+                     name, question, answer=clean_text(answer),
+                     status="answered", operator="RAG")
+        else:
+            _db_call(stats, "add_question", database.add_question,
+                     name, question, status="pending")
+
+        if think_ms:
+            time.sleep(rnd.uniform(0, 2 * think_ms) / 1000)
+
+
+def operator_worker(name, answer_ms, users_done, claimed, stats, seed):
+    rnd = random.Random(seed)
+    while True:
+        try:
+            rows = database.list_pending_questions()
+        except sqlite3.OperationalError as e:
+            _count_db_error(stats, "list_pending_questions", e)
+            time.sleep(0.05)
+            continue
+
+        with stats.lock:
+            free = [r for r in rows if r[0] not in claimed]
+            row = free[0] if free else None
+            if row is not None:
+                claimed.add(row[0])
+
+        if row is None:
+            if users_done.is_set():
+                return
+            time.sleep(0.05)
+            continue
+
+        time.sleep(rnd.uniform(0, 2 * answer_ms) / 1000)
+        if _db_call(stats, "set_answer", database.set_answer,
+                    row[0], f"Ответ оператора {name}", name):
+            with stats.lock:
+                stats.answered_by_operator += 1
+        else:
+            with stats.lock:
+                claimed.discard(row[0])
+
+
+def queue_sampler(stop, interval, stats):
+    while not stop.wait(interval):
+        try:
+            conn = database.db_connect()
+            depth = conn.execute(
+                "SELECT COUNT(1) FROM questions WHERE status='pending'"
+            ).fetchone()[0]
+            conn.close()
+        except sqlite3.OperationalError:
+            continue
+        stats.add(queue_depth=depth)
+
+
+def run(args, api_url):
+    stats = LoadStats()
+    users_done = threading.Event()
+    sampler_stop = threading.Event()
+    claimed = set()
+
+    users = [
+        threading.Thread(
+            target=user_worker,
+            args=(f"user{i}", api_url, args.questions, args.think_ms, stats, args.seed + i),
+            name=f"user{i}",
+        )
+        for i in range(args.users)
+    ]
+    operators = [
+        threading.Thread(
+            target=operator_worker,
+            args=(f"operator{i}", args.answer_ms, users_done, claimed, stats,
+                  args.seed + 1000 + i),
+            name=f"operator{i}",
+        )
+        for i in range(args.operators)
+    ]
+    sampler = threading.Thread(
+        target=queue_sampler, args=(sampler_stop, 0.1, stats), daemon=True
+    )
+
+    t0 = time.perf_counter()
+    sampler.start()
+    for t in users + operators:
+        t.start()
+    for t in users:
+        t.join()
+    users_elapsed = time.perf_counter() - t0
+    users_done.set()
+    for t in operators:
+        t.join()
+    total_elapsed = time.perf_counter() - t0
+    sampler_stop.set()
+    sampler.join()
+
+    asked = len(stats.ask_ms)
+    depth = stats.queue_depth or [0]
+    report = {
+        "users": args.users,
+        "operators": args.operators,
+        "questions": asked,
+        "users_elapsed_s": round(users_elapsed, 3),
+        "total_elapsed_s": round(total_elapsed, 3),
+        "ask_throughput_rps": round(asked / users_elapsed, 2) if users_elapsed else 0.0,
+        "ask_latency_ms": {
+            "p50": round(percentile(stats.ask_ms, 50), 2),
+            "p95": round(percentile(stats.ask_ms, 95), 2),
+            "p99": round(percentile(stats.ask_ms, 99), 2),
+            "max": round(max(stats.ask_ms, default=0.0), 2),
+        },
+        "routes": dict(stats.routes),
+        "answered_by_operator": stats.answered_by_operator,
+        "queue_depth": {
+            "max": max(depth),
+            "avg": round(sum(depth) / len(depth), 2),
+            "samples": len(stats.queue_depth),
+        },
+        "db_lock_errors": dict(stats.lock_errors),
+        "db_lock_errors_total": sum(stats.lock_errors.values()),
+        "db_other_errors": dict(stats.other_errors),
+        "db_ops": [
+            row for row in instrumentation.snapshot() if row["op"].startswith("db.")
+        ],
+    }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--operators", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=20,
+                        help="вопросов на одного пользователя")
+    parser.add_argument("--think-ms", type=float, default=20.0,
+                        help="средняя пауза пользователя между вопросами")
+    parser.add_argument("--answer-ms", type=float, default=30.0,
+                        help="среднее время ответа оператора")
+    parser.add_argument("--latency-ms", type=float, default=50.0,
+                        help="средняя задержка заглушки /ask")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--fail-rate", type=float, default=0.02,
+                        help="доля ответов 500 от заглушки")
+    parser.add_argument("--unknown-rate", type=float, default=0.3,
+                        help="доля ответов «не знаю», уходящих оператору")
+    parser.add_argument("--api-url",
+                        help="настоящий RAG API вместо заглушки")
+    parser.add_argument("--db", help="файл базы (по умолчанию временный)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-lock-errors", type=int,
+                        help="код 1, если ошибок блокировки больше")
+    parser.add_argument("--json", help="куда сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="infodesk-load-") as tmp:
+        database.DB_PATH = args.db or os.path.join(tmp, "load.db")
+        instrumentation.SLOW_OP_LOG = os.path.join(tmp, "slow_ops.log")
+        database.init_db()
+
+        server = None
+        api_url = args.api_url
+        if not api_url:
+            config = StubConfig(args.latency_ms, args.jitter_ms,
+                                args.fail_rate, args.unknown_rate, args.seed)
+            server, api_url = start_stub_server(config)
+        try:
+            report = run(args, api_url)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    if args.max_lock_errors is not None and report["db_lock_errors_total"] > args.max_lock_errors:
+        print(
+            f"Ошибок блокировки базы: {report['db_lock_errors_total']} "
+            f"> {args.max_lock_errors}",
+            file=sys.stderr
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
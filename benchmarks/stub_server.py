@@ -0,0 +1,120 @@
+"""Локальная заглушка RAG API для нагрузочных тестов.
+
+Отвечает на POST /ask с настраиваемой задержкой и долей ошибок и на
+GET /health. Модели и сеть не нужны, поэтому подходит для CI:
+    python -m benchmarks.stub_server --port 8765 --latency-ms 80 --fail-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=20.0, fail_rate=0.0,
+                 unknown_rate=0.3, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.unknown_rate = unknown_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def draw(self):
+        """(задержка в секундах, исход: ok | unknown | error)."""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.rnd.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            roll = self.rnd.random()
+        if roll < self.fail_rate:
+            return delay, "error"
+        if roll < self.fail_rate + self.unknown_rate:
+            return delay, "unknown"
+        return delay, "ok"
+
+
+def _make_handler(config):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "entries": 0})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if self.path != "/ask":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                question = json.loads(raw or b"{}").get("question", "")
+            except ValueError:
+                self._send_json(400, {"error": "bad json"})
+                return
+
+            delay, outcome = config.draw()
+            time.sleep(delay)
+            if outcome == "error":
+                self._send_json(500, {"error": "stub failure"})
+            elif outcome == "unknown":
+                self._send_json(200, {"answer": "Не знаю ответа, перевожу на оператора.",
+                                      "route": "operator"})
+            else:
+                self._send_json(200, {"answer": f"Ответ на вопрос: {question}",
+                                      "route": "retrieval", "distance": 0.1})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(config, host="127.0.0.1", port=0):
+    """Запускает заглушку в фоновом потоке. Возвращает (server, url /ask)."""
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="stub-rag", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/ask"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--unknown-rate", type=float, default=0.3,
+                        help="доля ответов «не знаю», уходящих оператору")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.fail_rate, args.unknown_rate)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(config))
+    server.daemon_threads = True
+    print(f"Заглушка RAG API: http://{args.host}:{args.port}/ask")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Разреженный поиск BM25 по лемматизированному тексту и слияние рангов (RRF)."""
+import math
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+
+class BM25Index:
+    """Инвертированный индекс BM25.
+
+    Документы — строки из preprocess_text (леммы через пробел). Поиск
+    проходит только по спискам документов для терминов запроса, поэтому
+    его стоимость зависит от длины запроса, а не от размера корпуса.
+    Термины, встречающиеся больше чем в max_df_ratio документов,
+    пропускаются: они почти ничего не дают и дороже всего по времени.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B, max_df_ratio=0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.postings = defaultdict(list)
+        self.doc_len = []
+        self.total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, texts):
+        """Добавляет документы; их номера продолжают текущую нумерацию."""
+        with self._lock:
+            for text in texts:
+                doc_id = len(self.doc_len)
+                terms = Counter(str(text).split())
+                for term, tf in terms.items():
+                    self.postings[term].append((doc_id, tf))
+                length = sum(terms.values())
+                self.doc_len.append(length)
+                self.total_len += length
+
+    def idf(self, term):
+        n = len(self.doc_len)
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=10):
+        """Возвращает [(doc_id, score)] и долю терминов запроса, найденных в индексе."""
+        terms = set(str(query).split())
+        if not terms:
+            return [], 0.0
+
+        with self._lock:
+            n = len(self.doc_len)
+            if not n:
+                return [], 0.0
+            avg_len = self.total_len / n
+            max_df = max(1, int(n * self.max_df_ratio))
+
+            scores = defaultdict(float)
+            matched = 0
+            for term in terms:
+                plist = self.postings.get(term)
+                if not plist:
+                    continue
+                matched += 1
+                if len(plist) > max_df:
+                    continue
+                idf = self.idf(term)
+                for doc_id, tf in plist:
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return top, matched / len(terms)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, limit=None):
+    """Сливает несколько ранжированных списков doc_id методом RRF."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (k + rank + 1)
+    items = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+    return items[:limit] if limit else items
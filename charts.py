@@ -0,0 +1,117 @@
+"""Графики статистики для администратора.
+
+matplotlib импортируется только при первом построении графика и
+работает через Agg без pyplot, картинки рендерятся в память (PNG в
+bytes) — без временных файлов. Все графики строятся по одной выборке
+database.get_stats().
+"""
+import io
+
+from database import get_stats
+
+CHART_TYPES = ("status", "operator", "day")
+CHART_TITLES = {
+    "status": "Статус вопросов",
+    "operator": "Ответы операторов",
+    "day": "Вопросы по дням",
+}
+DEFAULT_DPI = 100
+
+_mpl = None
+
+
+def _matplotlib():
+    """(Figure, FigureCanvasAgg), импорт при первом обращении."""
+    global _mpl
+    if _mpl is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        _mpl = (Figure, FigureCanvasAgg)
+    return _mpl
+
+
+def _draw_status(ax, stats):
+    rows = stats["by_status"] or {"pending": 0, "answered": 0}
+    ax.bar(list(rows), list(rows.values()))
+    ax.set_title(CHART_TITLES["status"])
+    ax.set_xlabel("Статус")
+    ax.set_ylabel("Количество")
+
+
+def _draw_operator(ax, stats):
+    rows = sorted(stats["by_operator"].items(), key=lambda kv: kv[1]["answered"])
+    names = [name for name, _ in rows]
+    counts = [st["answered"] for _, st in rows]
+    ax.barh(names, counts)
+    for y, (_, st) in enumerate(rows):
+        if st["avg_answer_s"] is not None:
+            ax.annotate(
+                f" ~{st['avg_answer_s'] / 60:.0f} мин", (st["answered"], y),
+                va="center", fontsize=8
+            )
+    ax.set_title(CHART_TITLES["operator"])
+    ax.set_xlabel("Ответов")
+
+
+def _draw_day(ax, stats):
+    days = list(stats["by_day"])
+    created = [stats["by_day"][d]["created"] for d in days]
+    answered = [stats["by_day"][d]["answered"] for d in days]
+    labels = [d[5:] for d in days]   # ММ-ДД
+    ax.plot(labels, created, marker="o", label="Создано")
+    ax.plot(labels, answered, marker="o", label="Отвечено")
+    ax.set_title(CHART_TITLES["day"])
+    ax.set_ylabel("Количество")
+    ax.tick_params(axis="x", labelrotation=45, labelsize=8)
+    if days:
+        ax.legend()
+
+
+_DRAW = {
+    "status": _draw_status,
+    "operator": _draw_operator,
+    "day": _draw_day,
+}
+
+
+def _to_png(fig, dpi):
+    Figure, FigureCanvasAgg = _matplotlib()
+    FigureCanvasAgg(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi)
+    return buf.getvalue()
+
+
+def render_charts(kinds=CHART_TYPES, stats=None, dpi=DEFAULT_DPI):
+    """Отдельные графики: {тип: PNG в bytes}."""
+    Figure, _ = _matplotlib()
+    stats = stats if stats is not None else get_stats()
+    out = {}
+    for kind in kinds:
+        fig = Figure(figsize=(6, 4), tight_layout=True)
+        _DRAW[kind](fig.add_subplot(), stats)
+        out[kind] = _to_png(fig, dpi)
+    return out
+
+
+def render_dashboard(kinds=CHART_TYPES, stats=None, dpi=DEFAULT_DPI):
+    """Все графики на одной картинке, PNG в bytes."""
+    Figure, _ = _matplotlib()
+    stats = stats if stats is not None else get_stats()
+    fig = Figure(figsize=(6, 4 * len(kinds)), tight_layout=True)
+    for i, kind in enumerate(kinds, 1):
+        _DRAW[kind](fig.add_subplot(len(kinds), 1, i), stats)
+    return _to_png(fig, dpi)
+
+
+def save_png(data, path):
+    with open(path, "wb") as fh:
+        fh.write(data)
+    return path
+
+
+def to_pixmap(data):
+    from PyQt6.QtGui import QPixmap
+    pix = QPixmap()
+    pix.loadFromData(data, "PNG")
+    return pix
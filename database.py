@@ -1,15 +1,299 @@
+import os
+import time
+import zlib
 import sqlite3
+import hashlib
+import threading
 
-DB_PATH = "data.db"
+from instrumentation import instrumented
 
-def db_connect():
-    return sqlite3.connect(DB_PATH)
+DB_PATH = os.environ.get("INFODESK_DB_PATH", "data.db")
+# Архив старых отвеченных вопросов (archive.py); по умолчанию рядом с DB_PATH
+ARCHIVE_PATH = os.environ.get("INFODESK_ARCHIVE_PATH")
 
+# Версия схемы в PRAGMA user_version; увеличивается при каждом изменении DDL
+SCHEMA_VERSION = 5
+ARCHIVE_SCHEMA_VERSION = 1
 
+# Ответы от ANSWER_DEDUP_MIN символов хранятся один раз в таблице answers
+# (по хэшу текста), а от ANSWER_COMPRESS_MIN байт ещё и сжимаются zlib
+ANSWER_DEDUP_MIN = 64
+ANSWER_COMPRESS_MIN = 256
+
+# Время ответа на вопрос в секундах (NULL, если нет одной из меток)
+_ANSWER_SECONDS = (
+    "(julianday({row}.answered_at) - julianday({row}.created_at)) * 86400"
+)
+
+
+# Колонки вопроса, общие для основной таблицы и архива
+QUESTION_COLUMNS = (
+    "id", "user", "question", "answer", "answer_id", "status", "operator",
+    "kb_approved", "kb_indexed", "created_at", "answered_at",
+)
+
+# Текст ответа для строки q, к которой присоединена answers a
+_ANSWER_TEXT = "COALESCE(answer_text(a.body, a.compressed), q.answer)"
+
+
+def _answer_text(body, compressed):
+    if compressed:
+        return zlib.decompress(body).decode("utf-8")
+    return body
+
+
+def _questions_select(table):
+    """SELECT колонок QUESTION_COLUMNS из table с уже распакованным ответом."""
+    columns = ", ".join(
+        _ANSWER_TEXT + " AS answer" if c == "answer" else "q." + c
+        for c in QUESTION_COLUMNS
+    )
+    return (
+        f"SELECT {columns} FROM {table} q "
+        "LEFT JOIN main.answers a ON a.id = q.answer_id"
+    )
+
+
+def archive_db_path():
+    if ARCHIVE_PATH:
+        return ARCHIVE_PATH
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}.archive{ext or '.db'}"
+
+
+def attach_archive(conn, create=False):
+    """Подключает архив как схему archive. False, если архива нет."""
+    path = archive_db_path()
+    if not create and not os.path.exists(path):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    if conn.execute("PRAGMA archive.user_version").fetchone()[0] \
+            >= ARCHIVE_SCHEMA_VERSION:
+        return True
+    
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS archive.questions (
+            id INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT,
+            answer_id INTEGER,
+            status TEXT NOT NULL,
+            operator TEXT,
+            kb_approved INTEGER NOT NULL DEFAULT 0,
+            kb_indexed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            answered_at TEXT,
+            archived_at TEXT NOT NULL
+        )
+        """
+    )
+    cols = [r[1] for r in conn.execute("PRAGMA archive.table_info(questions)")]
+    if "answer_id" not in cols:
+        conn.execute("ALTER TABLE archive.questions ADD COLUMN answer_id INTEGER")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_archive_user "
+        "ON questions(user)"
+    )
+    conn.execute(f"PRAGMA archive.user_version = {ARCHIVE_SCHEMA_VERSION}")
+    conn.commit()
+    return True
+
+
+class _SharedConnection:
+    """Общее соединение сервера (backend.py): close() его не закрывает."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        pass
+
+
+_shared_conn = None
+_shared_thread = None
+
+
+def use_connection(conn):
+    """Все функции модуля будут работать через conn (None — как обычно).
+
+    Используется сервером backend.py, который держит одно соединение и
+    вызывает функции только из своего потока базы. Другие потоки (разбор
+    очереди, drain.py) открывают свои соединения, как обычно.
+    """
+    global _shared_conn, _shared_thread
+    if conn is not None:
+        conn.create_function("answer_text", 2, _answer_text, deterministic=True)
+    _shared_conn = conn
+    _shared_thread = threading.get_ident()
+
+
+def db_connect(archive=False):
+    """Соединение с базой.
+
+    Тексты из answers читаются через SQL-функцию answer_text (см.
+    _ANSWER_TEXT). С archive=True подключается и архив, а вопросы обоих
+    хранилищ с готовым текстом ответа доступны через временное
+    представление all_questions.
+    """
+    shared = _shared_conn if threading.get_ident() == _shared_thread else None
+    if shared is not None:
+        conn = shared
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        conn.create_function("answer_text", 2, _answer_text, deterministic=True)
+    if archive:
+        if shared is not None:
+            # Архив мог появиться после открытия соединения
+            conn.execute("DROP VIEW IF EXISTS temp.all_questions")
+            attached = any(
+                r[1] == "archive" for r in conn.execute("PRAGMA database_list")
+            )
+        else:
+            attached = False
+        sql = _questions_select("main.questions")
+        if attached or attach_archive(conn):
+            sql += " UNION ALL " + _questions_select("archive.questions")
+        conn.execute(f"CREATE TEMP VIEW all_questions AS {sql}")
+    if shared is not None:
+        return _SharedConnection(conn)
+    return conn
+
+
+def store_answer(cur, text):
+    """Значения (answer, answer_id) для записи ответа text в questions.
+
+    Короткие ответы остаются в самой строке вопроса, длинные сохраняются
+    в answers один раз на одинаковый текст.
+    """
+    if text is None or len(text) < ANSWER_DEDUP_MIN:
+        return text, None
+    raw = text.encode("utf-8")
+    digest = hashlib.sha1(raw).digest()
+    cur.execute("SELECT id FROM answers WHERE hash=?", (digest,))
+    row = cur.fetchone()
+    if row:
+        return None, row[0]
+    
+    compressed, body = 0, text
+    if len(raw) >= ANSWER_COMPRESS_MIN:
+        packed = zlib.compress(raw)
+        if len(packed) < len(raw):
+            compressed, body = 1, packed
+    # Тот же текст мог только что записать другой клиент
+    cur.execute(
+        "INSERT INTO answers(hash, compressed, body, size) VALUES(?,?,?,?) "
+        "ON CONFLICT(hash) DO NOTHING",
+        (digest, compressed, body, len(raw))
+    )
+    if cur.rowcount == 1:
+        return None, cur.lastrowid
+    cur.execute("SELECT id FROM answers WHERE hash=?", (digest,))
+    return None, cur.fetchone()[0]
+
+
+def _now(delay=0):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() + delay))
+
+
+def _stats_delta(row, sign):
+    """SQL для триггеров: учесть строку row (NEW/OLD) в question_stats со знаком sign."""
+    secs = _ANSWER_SECONDS.format(row=row)
+    parts = [
+        ("'status'", f"{row}.status", "0", "0", "1"),
+        ("'created_day'", f"date({row}.created_at)", "0", "0",
+         f"date({row}.created_at) IS NOT NULL"),
+        ("'operator'", f"{row}.operator",
+         f"({secs}) IS NOT NULL", f"COALESCE({secs}, 0)",
+         f"{row}.status = 'answered' AND {row}.operator IS NOT NULL"),
+        ("'answered_day'", f"date({row}.answered_at)",
+         f"({secs}) IS NOT NULL", f"COALESCE({secs}, 0)",
+         f"{row}.status = 'answered' AND date({row}.answered_at) IS NOT NULL"),
+    ]
+    return "".join(
+        f"""
+            INSERT INTO question_stats(kind, key, count, timed, answer_seconds)
+            SELECT {kind}, {key}, {sign}1, {sign}({timed}), {sign}({seconds})
+            WHERE {cond}
+            ON CONFLICT(kind, key) DO UPDATE SET
+                count = count + excluded.count,
+                timed = timed + excluded.timed,
+                answer_seconds = answer_seconds + excluded.answer_seconds;"""
+        for kind, key, timed, seconds, cond in parts
+    )
+
+
+def add_question_stats(cur, where="1", table="questions"):
+    """Добавляет в question_stats строки table, подходящие под where."""
+    secs = _ANSWER_SECONDS.format(row=table)
+    upsert = (
+        " ON CONFLICT(kind, key) DO UPDATE SET "
+        "count = count + excluded.count, timed = timed + excluded.timed, "
+        "answer_seconds = answer_seconds + excluded.answer_seconds"
+    )
+    # У каждого SELECT есть WHERE: без него SQLite принимает ON CONFLICT
+    # за часть JOIN
+    cur.execute(
+        "INSERT INTO question_stats(kind, key, count, timed, answer_seconds) "
+        f"SELECT 'status', status, COUNT(1), 0, 0 FROM {table} WHERE {where} "
+        "GROUP BY status" + upsert
+    )
+    cur.execute(
+        "INSERT INTO question_stats(kind, key, count, timed, answer_seconds) "
+        f"SELECT 'created_day', date(created_at), COUNT(1), 0, 0 FROM {table} "
+        f"WHERE ({where}) AND date(created_at) IS NOT NULL "
+        "GROUP BY date(created_at)" + upsert
+    )
+    for kind, key, cond in (
+        ("operator", "operator", "operator IS NOT NULL"),
+        ("answered_day", "date(answered_at)", "date(answered_at) IS NOT NULL"),
+    ):
+        cur.execute(
+            "INSERT INTO question_stats(kind, key, count, timed, answer_seconds) "
+            f"SELECT '{kind}', k, COUNT(1), COUNT(secs), COALESCE(SUM(secs), 0) "
+            f"FROM (SELECT {key} AS k, {secs} AS secs FROM {table} "
+            f"WHERE ({where}) AND status='answered' AND {cond}) WHERE 1 "
+            "GROUP BY k" + upsert
+        )
+
+
+def rebuild_question_stats(cur):
+    """Пересчитывает question_stats по таблице questions целиком.
+
+    Если к соединению подключён архив, учитываются и его вопросы — как и
+    при переносе (archive.py), статистика покрывает оба хранилища.
+    """
+    cur.execute("DELETE FROM question_stats")
+    add_question_stats(cur, table="main.questions")
+    schemas = [r[1] for r in cur.execute("PRAGMA database_list").fetchall()]
+    if "archive" in schemas:
+        add_question_stats(cur, table="archive.questions")
+
+
+@instrumented("db.init_db")
 def init_db():
     conn = db_connect()
     cur = conn.cursor()
     
+    # Быстрый путь: схема уже актуальна, DDL и проверки не нужны
+    cur.execute("PRAGMA user_version")
+    if cur.fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
+    
+    # Архив нужен, если придётся пересчитывать question_stats
+    cur.execute("PRAGMA database_list")
+    if "archive" not in [r[1] for r in cur.fetchall()]:
+        attach_archive(conn)
+    
+    # Новые базы сразу создаются с incremental_vacuum (maintenance.py);
+    # у существующих режим применится при следующем полном VACUUM
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    
     # Создание таблицы пользователей
     cur.execute(
         """
@@ -48,6 +332,131 @@ def init_db():
     except Exception:
         pass
     
+    # Флаги выгрузки ответов операторов в базу знаний RAG
+    try:
+        cur.execute("PRAGMA table_info(questions)")
+        cols = [r[1] for r in cur.fetchall()]
+        if "kb_approved" not in cols:
+            cur.execute(
+                "ALTER TABLE questions ADD COLUMN kb_approved INTEGER "
+                "NOT NULL DEFAULT 0"
+            )
+        if "kb_indexed" not in cols:
+            cur.execute(
+                "ALTER TABLE questions ADD COLUMN kb_indexed INTEGER "
+                "NOT NULL DEFAULT 0"
+            )
+    except Exception:
+        pass
+    
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_questions_kb "
+        "ON questions(kb_approved, kb_indexed)"
+    )
+    
+    # Метки времени: у старых записей остаются пустыми
+    try:
+        cur.execute("PRAGMA table_info(questions)")
+        cols = [r[1] for r in cur.fetchall()]
+        if "created_at" not in cols:
+            cur.execute("ALTER TABLE questions ADD COLUMN created_at TEXT")
+        if "answered_at" not in cols:
+            cur.execute("ALTER TABLE questions ADD COLUMN answered_at TEXT")
+    except Exception:
+        pass
+    
+    # Длинные ответы хранятся один раз на одинаковый текст (store_answer);
+    # старые записи переносит python answers.py --migrate
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            compressed INTEGER NOT NULL DEFAULT 0,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL
+        )
+        """
+    )
+    try:
+        cur.execute("PRAGMA table_info(questions)")
+        cols = [r[1] for r in cur.fetchall()]
+        if "answer_id" not in cols:
+            cur.execute(
+                "ALTER TABLE questions ADD COLUMN answer_id INTEGER "
+                "REFERENCES answers(id)"
+            )
+    except Exception:
+        pass
+    
+    # Счётчики по статусам, операторам и дням, которые ведут триггеры,
+    # чтобы статистика не требовала GROUP BY по всей таблице вопросов
+    cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='question_stats'"
+    )
+    stats_exists = cur.fetchone() is not None
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS question_stats (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            timed INTEGER NOT NULL DEFAULT 0,
+            answer_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_questions_stats_insert "
+        "AFTER INSERT ON questions BEGIN"
+        + _stats_delta("NEW", "+") + "\n        END"
+    )
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_questions_stats_update "
+        "AFTER UPDATE OF status, operator, created_at, answered_at "
+        "ON questions BEGIN"
+        + _stats_delta("OLD", "-") + _stats_delta("NEW", "+") + "\n        END"
+    )
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_questions_stats_delete "
+        "AFTER DELETE ON questions BEGIN"
+        + _stats_delta("OLD", "-") + "\n        END"
+    )
+    if not stats_exists:
+        rebuild_question_stats(cur)
+    
+    # Поиск старых отвеченных вопросов для переноса в архив (archive.py)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_questions_answered "
+        "ON questions(status, answered_at)"
+    )
+    
+    # Когда последний раз выполнялись задачи обслуживания (maintenance.py)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+            task TEXT PRIMARY KEY,
+            last_run TEXT NOT NULL,
+            seconds REAL NOT NULL DEFAULT 0,
+            result TEXT
+        )
+        """
+    )
+    
+    # Аренда фоновых задач, которые должен выполнять один клиент базы
+    # (drain.py); cursor — до какого id задача уже дошла
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS task_leases (
+            task TEXT PRIMARY KEY,
+            holder TEXT,
+            expires TEXT NOT NULL DEFAULT '',
+            cursor INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    
     # Создание администратора по умолчанию
     cur.execute("SELECT COUNT(1) FROM users WHERE login=?", ("admin",))
     if cur.fetchone()[0] == 0:
@@ -57,11 +466,13 @@ def init_db():
             ("admin", "admin", "admin", "Administrator", "light"),
         )
     
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
 
 # ------------- Функции для работы с пользователями --------------
+@instrumented("db.get_user")
 def get_user(login):
     conn = db_connect()
     cur = conn.cursor()
@@ -84,6 +495,16 @@ def get_user(login):
     }
 
 
+@instrumented("db.check_password")
+def check_password(login, password):
+    """Запись пользователя без пароля, если пароль верен, иначе None."""
+    user = get_user(login)
+    if not user or user.pop("password") != password:
+        return None
+    return user
+
+
+@instrumented("db.list_users")
 def list_users():
     conn = db_connect()
     cur = conn.cursor()
@@ -93,6 +514,7 @@ def list_users():
     return rows
 
 
+@instrumented("db.create_user")
 def create_user(login, password, role, name, theme="light"):
     conn = db_connect()
     cur = conn.cursor()
@@ -105,6 +527,7 @@ def create_user(login, password, role, name, theme="light"):
     conn.close()
 
 
+@instrumented("db.delete_user_db")
 def delete_user_db(login):
     conn = db_connect()
     cur = conn.cursor()
@@ -113,6 +536,7 @@ def delete_user_db(login):
     conn.close()
 
 
+@instrumented("db.update_user_name")
 def update_user_name(login, name):
     conn = db_connect()
     cur = conn.cursor()
@@ -121,6 +545,7 @@ def update_user_name(login, name):
     conn.close()
 
 
+@instrumented("db.update_user_theme")
 def update_user_theme(login, theme):
     conn = db_connect()
     cur = conn.cursor()
@@ -129,6 +554,7 @@ def update_user_theme(login, theme):
     conn.close()
 
 
+@instrumented("db.update_user_password")
 def update_user_password(login, password):
     conn = db_connect()
     cur = conn.cursor()
@@ -138,6 +564,7 @@ def update_user_password(login, password):
 
 
 # ----------- Функции для работы с вопросами ------------
+@instrumented("db.list_pending_questions")
 def list_pending_questions():
     conn = db_connect()
     cur = conn.cursor()
@@ -150,12 +577,13 @@ def list_pending_questions():
     return rows
 
 
+@instrumented("db.get_question_by_id")
 def get_question_by_id(qid):
-    conn = db_connect()
+    conn = db_connect(archive=True)
     cur = conn.cursor()
     cur.execute(
         "SELECT id, user, question, answer, status, operator "
-        "FROM questions WHERE id=?",
+        "FROM all_questions WHERE id=?",
         (qid,)
     )
     row = cur.fetchone()
@@ -174,34 +602,91 @@ def get_question_by_id(qid):
     }
 
 
-def set_answer(qid, answer, operator):
+@instrumented("db.set_answer")
+def set_answer(qid, answer, operator, kb_approved=False):
     conn = db_connect()
     cur = conn.cursor()
+    answer, answer_id = store_answer(cur, answer)
     cur.execute(
-        "UPDATE questions SET answer=?, status='answered', operator=? WHERE id=?",
-        (answer, operator, qid)
+        "UPDATE questions SET answer=?, answer_id=?, status='answered', "
+        "operator=?, kb_approved=?, kb_indexed=0, answered_at=? WHERE id=?",
+        (answer, answer_id, operator, 1 if kb_approved else 0, _now(), qid)
     )
     conn.commit()
     conn.close()
 
 
+@instrumented("db.add_question")
 def add_question(user, question, answer=None, status="pending", operator=None):
     conn = db_connect()
     cur = conn.cursor()
+    now = _now()
+    answer, answer_id = store_answer(cur, answer)
     cur.execute(
-        "INSERT INTO questions(user, question, answer, status, operator) "
-        "VALUES(?,?,?,?,?)",
-        (user, question, answer, status, operator)
+        "INSERT INTO questions(user, question, answer, answer_id, status, "
+        "operator, created_at, answered_at) VALUES(?,?,?,?,?,?,?,?)",
+        (user, question, answer, answer_id, status, operator, now,
+         now if status == "answered" else None)
     )
     conn.commit()
     conn.close()
 
 
-def list_user_questions_all(user):
+@instrumented("db.add_questions_bulk")
+def add_questions_bulk(rows):
+    """Вставка многих вопросов одной транзакцией.
+
+    rows — кортежи (user, question, answer, status, operator).
+    """
     conn = db_connect()
     cur = conn.cursor()
+    now = _now()
+    values = []
+    for user, question, answer, status, operator in rows:
+        answer, answer_id = store_answer(cur, answer)
+        values.append((user, question, answer, answer_id, status, operator,
+                       now, now if status == "answered" else None))
+    cur.executemany(
+        "INSERT INTO questions(user, question, answer, answer_id, status, "
+        "operator, created_at, answered_at) VALUES(?,?,?,?,?,?,?,?)",
+        values
+    )
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+@instrumented("db.answer_pending_bulk")
+def answer_pending_bulk(rows, operator):
+    """Отвечает на вопросы, которые всё ещё ждут ответа, одной транзакцией.
+
+    rows — пары (id, ответ). Вопросы, на которые уже ответил оператор,
+    не трогаются. Возвращает число отвеченных.
+    """
+    conn = db_connect()
+    cur = conn.cursor()
+    now = _now()
+    answered = 0
+    for qid, answer in rows:
+        answer, answer_id = store_answer(cur, answer)
+        cur.execute(
+            "UPDATE questions SET answer=?, answer_id=?, status='answered', "
+            "operator=?, kb_approved=0, kb_indexed=0, answered_at=? "
+            "WHERE id=? AND status='pending'",
+            (answer, answer_id, operator, now, qid)
+        )
+        answered += cur.rowcount
+    conn.commit()
+    conn.close()
+    return answered
+
+
+@instrumented("db.list_user_questions_all")
+def list_user_questions_all(user):
+    conn = db_connect(archive=True)
+    cur = conn.cursor()
     cur.execute(
-        "SELECT id, question, answer, status, operator FROM questions "
+        "SELECT id, question, answer, status, operator FROM all_questions "
         "WHERE user=? ORDER BY id DESC",
         (user,)
     )
@@ -210,11 +695,12 @@ def list_user_questions_all(user):
     return rows
 
 
+@instrumented("db.list_user_questions_recent")
 def list_user_questions_recent(user, limit=20):
-    conn = db_connect()
+    conn = db_connect(archive=True)
     cur = conn.cursor()
     cur.execute(
-        "SELECT id, question, answer, status, operator FROM questions "
+        "SELECT id, question, answer, status, operator FROM all_questions "
         "WHERE user=? ORDER BY id DESC LIMIT ?",
         (user, limit)
     )
@@ -223,11 +709,12 @@ def list_user_questions_recent(user, limit=20):
     return rows
 
 
+@instrumented("db.list_questions_by_status")
 def list_questions_by_status(status):
-    conn = db_connect()
+    conn = db_connect(archive=True)
     cur = conn.cursor()
     cur.execute(
-        "SELECT id, user, question, answer, status, operator FROM questions "
+        "SELECT id, user, question, answer, status, operator FROM all_questions "
         "WHERE status=? ORDER BY id DESC",
         (status,)
     )
@@ -236,11 +723,12 @@ def list_questions_by_status(status):
     return rows
 
 
+@instrumented("db.list_all_questions")
 def list_all_questions():
-    conn = db_connect()
+    conn = db_connect(archive=True)
     cur = conn.cursor()
     cur.execute(
-        "SELECT id, user, question, answer, status, operator FROM questions "
+        "SELECT id, user, question, answer, status, operator FROM all_questions "
         "ORDER BY id DESC"
     )
     rows = cur.fetchall()
@@ -248,14 +736,231 @@ def list_all_questions():
     return rows
 
 
+EXPORT_COLUMNS = (
+    "id", "user", "question", "answer", "status", "operator",
+    "created_at", "answered_at",
+)
+
+
+@instrumented("db.questions_page")
+def questions_page(status=None, ids=None, before_id=None, limit=500):
+    """Одна страница вопросов в порядке EXPORT_COLUMNS.
+
+    С ids — эти номера по возрастанию, иначе до limit вопросов с номером
+    меньше before_id по убыванию (status — фильтр по статусу).
+    """
+    columns = ", ".join(EXPORT_COLUMNS)
+    conn = db_connect(archive=True)
+    cur = conn.cursor()
+    if ids is not None:
+        cur.execute(
+            f"SELECT {columns} FROM all_questions WHERE id IN "
+            f"({','.join('?' * len(ids))}) ORDER BY id ASC",
+            list(ids)
+        )
+    else:
+        where, params = [], []
+        if status is not None:
+            where.append("status=?")
+            params.append(status)
+        if before_id is not None:
+            where.append("id<?")
+            params.append(before_id)
+        cur.execute(
+            f"SELECT {columns} FROM all_questions "
+            + (f"WHERE {' AND '.join(where)} " if where else "")
+            + "ORDER BY id DESC LIMIT ?",
+            params + [limit]
+        )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def iter_questions(status=None, ids=None, chunk_size=500):
+    """Вопросы пачками по chunk_size строк, без загрузки всей выборки.
+
+    status — фильтр по статусу, ids — только эти номера (порядок по id).
+    Строки — кортежи в порядке EXPORT_COLUMNS. Каждая пачка читается
+    отдельным запросом (по номеру последней строки), так что чтение
+    базы не блокируется на всё время выгрузки.
+    """
+    if ids is not None:
+        ids = sorted(set(int(i) for i in ids))
+        # Лимит параметров SQLite — запрашиваем номера порциями
+        for start in range(0, len(ids), chunk_size):
+            rows = questions_page(ids=ids[start:start + chunk_size])
+            if rows:
+                yield rows
+        return
+
+    before_id = None
+    while True:
+        rows = questions_page(status, before_id=before_id, limit=chunk_size)
+        if not rows:
+            break
+        yield rows
+        before_id = rows[-1][0]
+
+
+@instrumented("db.list_faq_items")
 def list_faq_items():
     conn = db_connect()
     cur = conn.cursor()
     cur.execute(
-        "SELECT id, question, answer, status FROM questions WHERE user='FAQ' "
-        "ORDER BY id ASC"
+        f"SELECT q.id, q.question, {_ANSWER_TEXT}, q.status FROM questions q "
+        "LEFT JOIN answers a ON a.id = q.answer_id WHERE q.user='FAQ' "
+        "ORDER BY q.id ASC"
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+
+# ----------- Выгрузка ответов операторов в базу знаний ------------
+@instrumented("db.list_kb_pending")
+def list_kb_pending(limit=100):
+    """Одобренные ответы операторов, ещё не отправленные в индекс RAG."""
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT q.id, q.question, {_ANSWER_TEXT}, q.operator FROM questions q "
+        "LEFT JOIN answers a ON a.id = q.answer_id "
+        "WHERE q.status='answered' AND q.kb_approved=1 AND q.kb_indexed=0 "
+        "AND (q.answer IS NOT NULL OR q.answer_id IS NOT NULL) "
+        "ORDER BY q.id ASC LIMIT ?",
+        (limit,)
     )
     rows = cur.fetchall()
     conn.close()
     return rows
 
+
+@instrumented("db.mark_kb_indexed")
+def mark_kb_indexed(qids):
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.executemany(
+        "UPDATE questions SET kb_indexed=1 WHERE id=?",
+        [(qid,) for qid in qids]
+    )
+    conn.commit()
+    conn.close()
+
+
+@instrumented("db.set_kb_approved")
+def set_kb_approved(qid, approved=True):
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE questions SET kb_approved=?, kb_indexed=0 WHERE id=?",
+        (1 if approved else 0, qid)
+    )
+    conn.commit()
+    conn.close()
+
+
+# ----------- Статистика ------------
+@instrumented("db.get_stats")
+def get_stats(days=30):
+    """Сводка из question_stats без просмотра таблицы вопросов.
+
+    Возвращает {"by_status": {статус: n}, "by_operator": {оператор:
+    {"answered", "avg_answer_s"}}, "by_day": {день: {"created", "answered",
+    "avg_answer_s"}}, "total": n}; by_day — только последние days дней.
+    """
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT kind, key, count, timed, answer_seconds FROM question_stats "
+        "WHERE count != 0 AND (kind NOT IN ('created_day', 'answered_day') "
+        "OR key >= date('now', 'localtime', ?))",
+        (f"-{int(days)} days",)
+    )
+    rows = cur.fetchall()
+    conn.close()
+
+    stats = {"by_status": {}, "by_operator": {}, "by_day": {}, "total": 0}
+    for kind, key, count, timed, seconds in rows:
+        avg = round(seconds / timed, 1) if timed else None
+        if kind == "status":
+            stats["by_status"][key] = count
+            stats["total"] += count
+        elif kind == "operator":
+            stats["by_operator"][key] = {"answered": count, "avg_answer_s": avg}
+        else:
+            day = stats["by_day"].setdefault(
+                key, {"created": 0, "answered": 0, "avg_answer_s": None}
+            )
+            if kind == "created_day":
+                day["created"] = count
+            else:
+                day["answered"] = count
+                day["avg_answer_s"] = avg
+    stats["by_day"] = dict(sorted(stats["by_day"].items()))
+    return stats
+
+
+# ----------- Аренда фоновых задач ------------
+@instrumented("db.acquire_lease")
+def acquire_lease(task, holder, seconds, cursor=None):
+    """Берёт или продлевает аренду задачи task на seconds секунд.
+
+    Пока аренда не истекла, задачу выполняет только holder; cursor, если
+    задан, запоминается (значение только растёт). Возвращает сохранённый
+    cursor или None, если задачу сейчас выполняет другой клиент.
+    """
+    conn = db_connect()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO task_leases(task, holder, expires, cursor) "
+        "VALUES(?,?,?,COALESCE(?, 0)) "
+        "ON CONFLICT(task) DO UPDATE SET holder=excluded.holder, "
+        "expires=excluded.expires, "
+        "cursor=MAX(task_leases.cursor, excluded.cursor) "
+        "WHERE task_leases.holder IS NULL "
+        "OR task_leases.holder=excluded.holder OR task_leases.expires < ?",
+        (task, holder, _now(seconds), cursor, _now())
+    )
+    cur.execute(
+        "SELECT cursor FROM task_leases WHERE task=? AND holder=?",
+        (task, holder)
+    )
+    row = cur.fetchone()
+    conn.commit()
+    conn.close()
+    return row[0] if row else None
+
+
+@instrumented("db.release_lease")
+def release_lease(task, holder, cursor=None):
+    conn = db_connect()
+    conn.execute(
+        "UPDATE task_leases SET holder=NULL, expires='', "
+        "cursor=MAX(cursor, COALESCE(?, 0)) WHERE task=? AND holder=?",
+        (cursor, task, holder)
+    )
+    conn.commit()
+    conn.close()
+
+
+# Операции, которые сервер backend.py выполняет по запросу клиентов
+API_OPS = (
+    "init_db", "get_user", "list_users", "create_user", "delete_user_db",
+    "update_user_name", "update_user_theme", "update_user_password",
+    "list_pending_questions", "get_question_by_id", "set_answer",
+    "answer_pending_bulk", "add_question", "add_questions_bulk",
+    "list_user_questions_all", "list_user_questions_recent",
+    "list_questions_by_status", "list_all_questions", "questions_page",
+    "list_faq_items", "list_kb_pending", "mark_kb_indexed", "set_kb_approved",
+    "get_stats", "acquire_lease", "release_lease",
+)
+
+# Режим клиента: с INFODESK_BACKEND_URL операции API_OPS выполняет
+# сервер backend.py, а приложение не открывает data.db само; пароль при
+# входе (check_password) проверяет сервер
+BACKEND_URL = os.environ.get("INFODESK_BACKEND_URL")
+if BACKEND_URL:
+    import backend_client
+    backend_client.install(globals(), BACKEND_URL)
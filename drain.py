@@ -0,0 +1,293 @@
+"""Разбор очереди ожидающих вопросов через RAG после восстановления API.
+
+Пока RAG API недоступен, вопросы пользователей копятся в статусе pending.
+Когда /health снова отвечает, они отправляются в /ask пачками:
+не больше DRAIN_WORKERS запросов одновременно и не чаще DRAIN_RATE в
+секунду, чтобы только что поднявшийся сервер не лёг снова. Уверенные
+ответы записываются как answered с оператором RAG, остальные вопросы
+остаются операторам. Ответ записывается, только если вопрос всё ещё
+pending — ответ оператора, данный за это время, не перезаписывается.
+
+Разбирает очередь один клиент базы за раз: перед началом берётся аренда
+task_leases (database.acquire_lease), в ней же хранится, до какого id
+очередь уже разобрана, так что другие клиенты и повторные входы не
+спрашивают RAG о тех же вопросах. При работе через сервер базы
+(backend.py) очередь разбирает сам сервер.
+
+Модуль не зависит от Qt, чтобы его мог использовать сервер базы без GUI;
+поток и наблюдатель за /health для приложения — в drain_watch.py.
+
+Запуск из командной строки:
+    python drain.py --api-url http://host:5000/ask --wait
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import database
+from database import (
+    acquire_lease, answer_pending_bulk, list_pending_questions, release_lease
+)
+from instrumentation import instrumented
+from rag import (
+    DEFAULT_API_URL, RagApiError, ask, check_health, clean_text,
+    is_failed_answer
+)
+
+DRAIN_WORKERS = 4
+DRAIN_RATE = 5.0
+DRAIN_BATCH_SIZE = 50
+# Ответ с расстоянием до найденной записи больше этого считается
+# неуверенным (см. DISTANCE_THRESHOLD и HIGH_CONFIDENCE_DISTANCE в rag_server)
+DRAIN_MAX_DISTANCE = float(
+    os.environ.get("INFODESK_DRAIN_MAX_DISTANCE", "0.35")
+)
+# Ответ из семантического кэша (route "cached") принимается, только если
+# вопрос достаточно близок к закэшированному
+DRAIN_MIN_SIMILARITY = float(
+    os.environ.get("INFODESK_DRAIN_MIN_SIMILARITY", "0.95")
+)
+DRAIN_OPERATOR = "RAG"
+DRAIN_TIMEOUT = 60
+
+HEALTH_CHECK_SECONDS = 30
+
+DRAIN_TASK = "drain_pending"
+# Продлевается после каждой пачки; истекает, если клиент упал
+DRAIN_LEASE_SECONDS = 300
+
+
+class RateLimiter:
+    """Не больше rate вызовов wait() в секунду на все потоки вместе."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def is_confident(result, max_distance=DRAIN_MAX_DISTANCE,
+                 min_similarity=DRAIN_MIN_SIMILARITY):
+    """True, если ответ RAG можно отдать пользователю без оператора.
+
+    Без расстояния ответ не считается уверенным: так сервер отвечает в
+    режиме generate, когда ничего не нашёл, и старые записи кэша.
+    """
+    if is_failed_answer(result.get("answer")):
+        return False
+    if result.get("route") == "operator":
+        return False
+    if result.get("route") == "cached":
+        similarity = result.get("similarity")
+        if similarity is None or similarity < min_similarity:
+            return False
+    distance = result.get("distance")
+    return distance is not None and distance <= max_distance
+
+
+def _call(func, *args):
+    return func(*args)
+
+
+def _ask_one(api_url, limiter, item, timeout):
+    qid, _, question = item
+    limiter.wait()
+    t0 = time.perf_counter()
+    try:
+        result = ask(api_url, question, timeout=timeout)
+        error = None
+    except (RagApiError, requests.exceptions.RequestException) as e:
+        result, error = {"answer": ""}, str(e)
+    return qid, result, error, (time.perf_counter() - t0) * 1000
+
+
+@instrumented("drain.drain_pending")
+def drain_pending(api_url, workers=DRAIN_WORKERS, rate=DRAIN_RATE,
+                  batch_size=DRAIN_BATCH_SIZE, max_distance=DRAIN_MAX_DISTANCE,
+                  limit=None, retry=False, timeout=DRAIN_TIMEOUT,
+                  progress_cb=None, is_cancelled=None, db=None):
+    """Отправляет ожидающие вопросы в RAG и записывает уверенные ответы.
+
+    Спрашиваются только вопросы новее уже разобранных (cursor аренды);
+    retry=True — все ожидающие, в том числе те, на которые RAG раньше не
+    смог уверенно ответить. Если очередь сейчас разбирает другой клиент,
+    ничего не делается (busy в отчёте). Если API снова перестал отвечать
+    (вся пачка с ошибками), разбор прекращается. Возвращает отчёт:
+    сколько спрошено, отвечено, осталось операторам и с какой скоростью.
+
+    db(func, *args) выполняет операции с базой; по умолчанию они вызываются
+    прямо в этом потоке, сервер базы передаёт их в свой поток базы.
+    """
+    db = db or _call
+    t0 = time.perf_counter()
+    report = {
+        "healthy": check_health(api_url),
+        "busy": False,
+        "total": 0,
+        "asked": 0,
+        "resolved": 0,
+        "left_pending": 0,
+        "errors": 0,
+        "aborted": False,
+        "cancelled": False,
+    }
+    rag_ms = 0.0
+
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    cursor = None
+    if report["healthy"]:
+        cursor = db(acquire_lease, DRAIN_TASK, holder, DRAIN_LEASE_SECONDS)
+        report["busy"] = cursor is None
+
+    if cursor is not None:
+        try:
+            items = db(list_pending_questions)
+            if not retry:
+                items = [r for r in items if r[0] > cursor]
+            if limit:
+                items = items[:limit]
+            report["total"] = len(items)
+
+            limiter = RateLimiter(rate)
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for start in range(0, len(items), batch_size):
+                    if is_cancelled and is_cancelled():
+                        report["cancelled"] = True
+                        break
+                    batch = items[start:start + batch_size]
+                    answered, errors = [], 0
+                    for qid, result, error, ms in pool.map(
+                        lambda item: _ask_one(api_url, limiter, item, timeout),
+                        batch
+                    ):
+                        rag_ms += ms
+                        if error is not None:
+                            errors += 1
+                            continue
+                        if is_confident(result, max_distance):
+                            answered.append((qid, clean_text(result["answer"])))
+                    if answered:
+                        report["resolved"] += db(
+                            answer_pending_bulk, answered, DRAIN_OPERATOR
+                        )
+                    report["asked"] += len(batch)
+                    report["errors"] += errors
+                    if progress_cb:
+                        progress_cb(report["asked"], report["total"])
+                    if errors == len(batch):
+                        report["aborted"] = True
+                        break
+                    # Продлеваем аренду и отмечаем пачку разобранной; если
+                    # аренду успел перехватить другой клиент — останавливаемся
+                    if db(acquire_lease, DRAIN_TASK, holder,
+                          DRAIN_LEASE_SECONDS, batch[-1][0]) is None:
+                        report["busy"] = True
+                        break
+        finally:
+            db(release_lease, DRAIN_TASK, holder)
+
+    seconds = time.perf_counter() - t0
+    report["left_pending"] = report["asked"] - report["resolved"]
+    report["seconds"] = round(seconds, 2)
+    report["questions_per_s"] = (
+        round(report["asked"] / seconds, 2) if seconds and report["asked"] else 0.0
+    )
+    report["avg_rag_ms"] = (
+        round(rag_ms / report["asked"], 1) if report["asked"] else 0.0
+    )
+    return report
+
+
+def format_report(report):
+    if not report["healthy"]:
+        return "RAG API недоступен, вопросы остаются в очереди."
+    if report["busy"] and not report["asked"]:
+        return "Очередь уже разбирает другой клиент базы."
+    if not report["total"]:
+        return "Нет ожидающих вопросов для RAG."
+    lines = [
+        f"Отправлено в RAG: {report['asked']} из {report['total']}",
+        f"Отвечено автоматически: {report['resolved']}, "
+        f"осталось операторам: {report['left_pending']}",
+        f"Время: {report['seconds']} с ({report['questions_per_s']} вопр./с, "
+        f"в среднем {report['avg_rag_ms']} мс на ответ RAG)",
+    ]
+    if report["errors"]:
+        lines.append(f"Ошибок API: {report['errors']}")
+    if report["aborted"]:
+        lines.insert(0, "RAG API снова перестал отвечать, разбор остановлен.")
+    if report["cancelled"]:
+        lines.insert(0, "Разбор остановлен, уже полученные ответы сохранены.")
+    if report["busy"]:
+        lines.insert(0, "Разбор продолжил другой клиент базы.")
+    return "\n".join(lines)
+
+
+def needs_drain(report):
+    """True, если очередь ещё надо разобрать при следующей проверке.
+
+    Так и после сбоя API посреди разбора, и когда очередь разбирал другой
+    клиент: он мог остановиться, не дойдя до конца.
+    """
+    return not report["healthy"] or bool(report.get("aborted") or report.get("busy"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url",
+                        default=os.environ.get("INFODESK_API_URL", DEFAULT_API_URL))
+    parser.add_argument("--workers", type=int, default=DRAIN_WORKERS,
+                        help="одновременных запросов к RAG API")
+    parser.add_argument("--rate", type=float, default=DRAIN_RATE,
+                        help="не больше стольких запросов в секунду (0 — без ограничения)")
+    parser.add_argument("--batch-size", type=int, default=DRAIN_BATCH_SIZE)
+    parser.add_argument("--max-distance", type=float, default=DRAIN_MAX_DISTANCE,
+                        help="порог уверенности по расстоянию до найденной записи")
+    parser.add_argument("--limit", type=int, help="разобрать не больше N вопросов")
+    parser.add_argument("--retry", action="store_true",
+                        help="спросить и уже разобранные ожидающие вопросы")
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--wait", action="store_true",
+                        help="ждать, пока RAG API станет доступен")
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    database.init_db()
+
+    if args.wait:
+        while not check_health(args.api_url):
+            time.sleep(HEALTH_CHECK_SECONDS)
+
+    def on_progress(done, total):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    report = drain_pending(
+        args.api_url, workers=args.workers, rate=args.rate,
+        batch_size=args.batch_size, max_distance=args.max_distance,
+        limit=args.limit, retry=args.retry, progress_cb=on_progress
+    )
+    if report["asked"]:
+        print(file=sys.stderr)
+    print(format_report(report))
+    return 0 if report["healthy"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Разбор очереди из приложения: поток и наблюдатель за /health.
+
+Сам разбор — в drain.py, который не зависит от Qt.
+"""
+from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal
+
+from drain import HEALTH_CHECK_SECONDS, drain_pending, needs_drain
+from rag import check_health
+
+
+class DrainThread(QThread):
+    """Разбирает очередь; с drain=False только проверяет /health."""
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
+
+    def __init__(self, api_url, retry=False, drain=True):
+        super().__init__()
+        self.api_url = api_url
+        self.retry = retry
+        self.drain = drain
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        if not self.drain:
+            self.finished.emit({"healthy": check_health(self.api_url)})
+            return
+        try:
+            report = drain_pending(
+                self.api_url, retry=self.retry,
+                progress_cb=self.progress.emit,
+                is_cancelled=lambda: self._cancelled
+            )
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(report)
+
+
+class PendingDrain(QObject):
+    """Следит за /health и разбирает очередь, когда RAG API поднимается.
+
+    Разбор запускается при переходе «недоступен → доступен» (и при старте,
+    если API уже работает), а также повторяется, пока очередь занята другим
+    клиентом. Вопросы, уже разобранные этим или другим клиентом, повторно
+    не отправляются (cursor аренды в базе).
+    """
+
+    drained = pyqtSignal(dict)
+
+    def __init__(self, api_url_getter, interval_ms=HEALTH_CHECK_SECONDS * 1000,
+                 parent=None):
+        super().__init__(parent)
+        self.api_url_getter = api_url_getter
+        self.thread = None
+        self.healthy = False
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.check_now)
+
+    def start(self):
+        self.healthy = False
+        self.timer.start()
+        self.check_now()
+
+    def stop(self):
+        self.timer.stop()
+        if self.thread is not None:
+            self.thread.cancel()
+
+    def check_now(self):
+        if self.thread is not None and self.thread.isRunning():
+            return
+        self.thread = DrainThread(self.api_url_getter(), drain=not self.healthy)
+        self.thread.finished.connect(self._on_finished)
+        self.thread.start()
+
+    def _on_finished(self, report):
+        if report.get("total"):
+            self.drained.emit(report)
+        self.healthy = not needs_drain(report)
@@ -0,0 +1,211 @@
+"""Экспорт вопросов в TXT, CSV, JSONL и Parquet.
+
+Строки читаются из базы пачками (database.iter_questions) и сразу
+пишутся в файл, поэтому память не зависит от размера выборки. Файл
+пишется во временный <путь>.part и переименовывается в конце; при отмене
+или ошибке незаконченный файл удаляется. Parquet доступен, если
+установлен pyarrow.
+"""
+import os
+import csv
+import json
+import importlib.util
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from database import EXPORT_COLUMNS, iter_questions, get_stats
+
+EXPORT_CHUNK_SIZE = 500
+
+FORMAT_FILTERS = {
+    "txt": "Text Files (*.txt)",
+    "csv": "CSV Files (*.csv)",
+    "jsonl": "JSON Lines (*.jsonl)",
+    "parquet": "Parquet Files (*.parquet)",
+}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class TxtWriter:
+    """Тот же формат, что и прежний экспорт из меню."""
+
+    def __init__(self, path):
+        self.fh = open(path, "w", encoding="utf-8")
+
+    def write_rows(self, rows):
+        parts = []
+        for row in rows:
+            r = dict(zip(EXPORT_COLUMNS, row))
+            parts.append(
+                f"ID: {r['id']}\n"
+                f"Пользователь: {r['user']}\n"
+                f"Статус: {r['status']}\n"
+                f"Оператор: {r['operator']}\n"
+                f"Вопрос:\n{r['question']}\n"
+            )
+            if r["answer"]:
+                parts.append(f"Ответ:\n{r['answer']}\n")
+            parts.append("-" * 40 + "\n")
+        self.fh.write("".join(parts))
+
+    def close(self):
+        self.fh.close()
+
+
+class CsvWriter:
+
+    def __init__(self, path):
+        # utf-8-sig, чтобы Excel правильно открывал кириллицу
+        self.fh = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.fh)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.fh.close()
+
+
+class JsonlWriter:
+
+    def __init__(self, path):
+        self.fh = open(path, "w", encoding="utf-8")
+
+    def write_rows(self, rows):
+        self.fh.write("".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+            for row in rows
+        ))
+
+    def close(self):
+        self.fh.close()
+
+
+class ParquetWriter:
+    """Колоночный формат; каждая пачка строк — отдельная row group."""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema(
+            [("id", pa.int64())]
+            + [(name, pa.string()) for name in EXPORT_COLUMNS[1:]]
+        )
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write_rows(self, rows):
+        columns = list(zip(*rows))
+        table = self.pa.Table.from_arrays(
+            [self.pa.array(col, type=field.type)
+             for col, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    "txt": TxtWriter,
+    "csv": CsvWriter,
+    "jsonl": JsonlWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def available_formats():
+    formats = ["txt", "csv", "jsonl"]
+    if importlib.util.find_spec("pyarrow") is not None:
+        formats.append("parquet")
+    return formats
+
+
+def format_from_path(path, default="txt"):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return ext if ext in WRITERS else default
+
+
+def count_questions(status=None, ids=None):
+    """Сколько строк будет выгружено (для индикатора прогресса)."""
+    if ids is not None:
+        return len(set(ids))
+    by_status = get_stats()["by_status"]
+    if status is None:
+        return sum(by_status.values())
+    return by_status.get(status, 0)
+
+
+def export_questions(path, fmt=None, status=None, ids=None,
+                     chunk_size=EXPORT_CHUNK_SIZE, progress_cb=None,
+                     is_cancelled=None):
+    """Выгружает вопросы в файл. Возвращает число записанных строк."""
+    fmt = fmt or format_from_path(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    if fmt == "parquet" and "parquet" not in available_formats():
+        raise RuntimeError("Для экспорта в Parquet нужен пакет pyarrow")
+
+    total = count_questions(status, ids)
+    tmp_path = path + ".part"
+    written = 0
+    writer = WRITERS[fmt](tmp_path)
+    chunks = iter_questions(status=status, ids=ids, chunk_size=chunk_size)
+    try:
+        for rows in chunks:
+            if is_cancelled and is_cancelled():
+                raise ExportCancelled()
+            writer.write_rows(rows)
+            written += len(rows)
+            if progress_cb:
+                progress_cb(written, max(total, written))
+        writer.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        writer.close()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    finally:
+        # Закрывает соединение с базой и при досрочном выходе
+        chunks.close()
+    return written
+
+
+class ExportThread(QThread):
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
+
+    def __init__(self, path, fmt=None, status=None, ids=None):
+        super().__init__()
+        self.path = path
+        self.fmt = fmt
+        self.status = status
+        self.ids = ids
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            written = export_questions(
+                self.path, self.fmt, status=self.status, ids=self.ids,
+                progress_cb=self.progress.emit,
+                is_cancelled=lambda: self._cancelled
+            )
+        except ExportCancelled:
+            self.finished.emit({"path": self.path, "rows": 0, "cancelled": True})
+            return
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit({"path": self.path, "rows": written, "cancelled": False})
@@ -0,0 +1,222 @@
+"""Потоковая загрузка документации (PDF/MD/TXT) в индекс RAG."""
+import os
+import re
+import json
+import contextlib
+
+import requests
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from rag import post_passages
+
+DOCS_DIR = "docs"
+
+# Размер фрагмента и перекрытие (в словах)
+PASSAGE_WORDS = 180
+OVERLAP_WORDS = 40
+
+# Сколько фрагментов отправлять в RAG API за один запрос
+BATCH_SIZE = 32
+
+# Сколько строк Markdown/TXT считать одной «страницей»
+LINES_PER_PAGE = 60
+
+
+# ------------- Извлечение текста --------------
+def iter_pdf_pages(path):
+    """Постранично отдаёт (номер_страницы, текст, доля_прогресса)."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError(
+            "Для загрузки PDF установите пакет pypdf (pip install pypdf)."
+        )
+
+    # PdfReader держит файл открытым и разбирает страницы по требованию
+    with open(path, "rb") as fh:
+        reader = PdfReader(fh)
+        total = len(reader.pages) or 1
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page.extract_text() or "", (i + 1) / total
+
+
+_MD_RULES = [
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),   # картинки
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),    # ссылки
+    (re.compile(r"<[^>]+>"), " "),                    # html-теги
+    (re.compile(r"^\s{0,3}#{1,6}\s*"), ""),           # заголовки
+    (re.compile(r"^\s{0,3}>\s?"), ""),                # цитаты
+    (re.compile(r"^\s*([-*+]|\d+[.)])\s+"), ""),      # списки
+    (re.compile(r"[*_~`]{1,3}"), ""),                 # выделение
+    (re.compile(r"^\s*\|?[-:| ]{3,}\|?\s*$"), ""),    # разделители таблиц
+]
+
+
+def strip_markdown(line):
+    if line.lstrip().startswith("```"):
+        return ""
+    for rx, repl in _MD_RULES:
+        line = rx.sub(repl, line)
+    return line.replace("|", " ")
+
+
+def iter_text_pages(path, markdown=False):
+    """Читает TXT/MD построчно, группируя строки в «страницы»."""
+    size = os.path.getsize(path) or 1
+    page_no = 1
+    buf = []
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        for ln in fh:
+            if markdown:
+                ln = strip_markdown(ln)
+            buf.append(ln)
+            if len(buf) >= LINES_PER_PAGE:
+                yield page_no, "".join(buf), min(fh.buffer.tell() / size, 1.0)
+                page_no += 1
+                buf = []
+    if buf:
+        yield page_no, "".join(buf), 1.0
+
+
+def iter_document_pages(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return iter_pdf_pages(path)
+    if ext in (".md", ".markdown"):
+        return iter_text_pages(path, markdown=True)
+    if ext == ".txt":
+        return iter_text_pages(path)
+    raise ValueError(f"Неподдерживаемый формат: {ext}")
+
+
+# ------------- Нарезка на фрагменты --------------
+def iter_passages(pages, size=PASSAGE_WORDS, overlap=OVERLAP_WORDS):
+    """Склеивает страницы в перекрывающиеся фрагменты по size слов.
+
+    Отдаёт (текст, номер_страницы_начала, доля_прогресса). В памяти
+    держится только текущий фрагмент, а не весь документ.
+    """
+    overlap = max(0, min(overlap, size - 1))
+    words = []
+    word_pages = []
+    emitted = False
+
+    for page_no, text, progress in pages:
+        for w in text.split():
+            words.append(w)
+            word_pages.append(page_no)
+            if len(words) >= size:
+                yield " ".join(words), word_pages[0], progress
+                emitted = True
+                words = words[size - overlap:]
+                word_pages = word_pages[size - overlap:]
+
+    # Хвост выдаём, только если в нём есть что-то кроме перекрытия
+    if words and (len(words) > overlap or not emitted):
+        yield " ".join(words), word_pages[0], 1.0
+
+
+def ingest_document(path, api_url=None, docs_dir=DOCS_DIR,
+                    progress_cb=None, is_cancelled=None):
+    """Разбирает документ и сохраняет фрагменты в docs/<имя>.passages.jsonl.
+
+    Если указан api_url, фрагменты пачками отправляются в /index RAG API.
+    Возвращает словарь со статистикой загрузки.
+    """
+    os.makedirs(docs_dir, exist_ok=True)
+    basename = os.path.basename(path)
+    out_path = os.path.join(docs_dir, basename + ".passages.jsonl")
+
+    stats = {
+        "file": basename,
+        "passages": 0,
+        "indexed": 0,
+        "pages": 0,
+        "output": out_path,
+        "api_error": None,
+        "cancelled": False,
+    }
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        if api_url and stats["api_error"] is None:
+            try:
+                stats["indexed"] += post_passages(api_url, batch)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Фрагменты всё равно остаются в docs/: их подхватит
+                # сервер, запущенный рядом с этой папкой, или повторная загрузка
+                stats["api_error"] = str(e)
+        batch.clear()
+
+    tmp_path = out_path + ".part"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for text, page_no, progress in iter_passages(
+                    iter_document_pages(path)):
+                if is_cancelled and is_cancelled():
+                    stats["cancelled"] = True
+                    break
+
+                item = {
+                    "text": text,
+                    "source": basename,
+                    "page": page_no,
+                }
+                out.write(json.dumps(item, ensure_ascii=False) + "\n")
+                batch.append(item)
+                stats["passages"] += 1
+                stats["pages"] = max(stats["pages"], page_no)
+
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+                if progress_cb:
+                    progress_cb(int(progress * 100), stats["passages"])
+
+            if not stats["cancelled"]:
+                flush()
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+    if stats["cancelled"]:
+        os.unlink(tmp_path)
+    else:
+        os.replace(tmp_path, out_path)
+    return stats
+
+
+class IngestThread(QThread):
+
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
+
+    def __init__(self, path, api_url=None, docs_dir=DOCS_DIR):
+        super().__init__()
+        self.path = path
+        self.api_url = api_url
+        self.docs_dir = docs_dir
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        def on_progress(percent, passages):
+            self.progress.emit(percent, f"Обработано фрагментов: {passages}")
+
+        try:
+            stats = ingest_document(
+                self.path,
+                api_url=self.api_url,
+                docs_dir=self.docs_dir,
+                progress_cb=on_progress,
+                is_cancelled=lambda: self._cancelled
+            )
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(stats)
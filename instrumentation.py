@@ -0,0 +1,142 @@
+"""Замеры обращений к базе данных и RAG API на стороне клиента.
+
+Каждый вызов, обёрнутый в @instrumented или timed(), попадает в
+гистограмму задержек; вызовы дольше порога пишутся в журнал медленных
+операций (logs/slow_ops.log) и в последние записи для окна администратора.
+"""
+import os
+import csv
+import json
+import time
+import logging
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+SLOW_OP_THRESHOLD_MS = float(os.environ.get("INFODESK_SLOW_OP_MS", "200"))
+SLOW_OP_LOG = os.environ.get(
+    "INFODESK_SLOW_OP_LOG", os.path.join("logs", "slow_ops.log")
+)
+
+OP_SECONDS = REGISTRY.histogram(
+    "infodesk_op_seconds", "Длительность операций клиента", ("op",)
+)
+OP_ERRORS = REGISTRY.counter(
+    "infodesk_op_errors_total", "Операции клиента, завершившиеся ошибкой", ("op",)
+)
+
+_slow_ops = deque(maxlen=500)
+_slow_lock = threading.Lock()
+_slow_logger = logging.getLogger("infodesk.slow_ops")
+
+
+def set_slow_threshold(ms):
+    global SLOW_OP_THRESHOLD_MS
+    SLOW_OP_THRESHOLD_MS = float(ms)
+
+
+def _slow_log():
+    if SLOW_OP_LOG and not _slow_logger.handlers:
+        try:
+            os.makedirs(os.path.dirname(SLOW_OP_LOG) or ".", exist_ok=True)
+            handler = logging.FileHandler(SLOW_OP_LOG, encoding="utf-8")
+        except OSError:
+            return None
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _slow_logger.addHandler(handler)
+        _slow_logger.setLevel(logging.INFO)
+        _slow_logger.propagate = False
+    return _slow_logger if _slow_logger.handlers else None
+
+
+def record(op, elapsed, error=None):
+    OP_SECONDS.observe(elapsed, op=op)
+    if error is not None:
+        OP_ERRORS.inc(op=op)
+
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms < SLOW_OP_THRESHOLD_MS:
+        return
+
+    entry = {
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "op": op,
+        "ms": round(elapsed_ms, 1),
+        "thread": threading.current_thread().name,
+        "error": error,
+    }
+    with _slow_lock:
+        _slow_ops.append(entry)
+    logger = _slow_log()
+    if logger is not None:
+        logger.info(json.dumps(entry, ensure_ascii=False))
+
+
+@contextmanager
+def timed(op):
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record(op, time.perf_counter() - t0, error)
+
+
+def instrumented(op=None):
+    """Декоратор: замеряет каждый вызов функции под именем op."""
+    def decorator(func):
+        name = op or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Сводка по операциям: [{op, count, errors, avg_ms, p50_ms, ...}]."""
+    errors = {key[0]: value for key, value in OP_ERRORS.values().items()}
+    rows = []
+    for key, st in sorted(OP_SECONDS.summary().items()):
+        rows.append({
+            "op": key[0],
+            "count": st["count"],
+            "errors": errors.get(key[0], 0),
+            "avg_ms": round(st["avg"] * 1000, 2),
+            "p50_ms": round(st["p50"] * 1000, 2),
+            "p95_ms": round(st["p95"] * 1000, 2),
+            "p99_ms": round(st["p99"] * 1000, 2),
+            "max_ms": round(st["max"] * 1000, 2),
+        })
+    return rows
+
+
+def slow_ops():
+    with _slow_lock:
+        return list(_slow_ops)
+
+
+def export_json(path):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({
+            "threshold_ms": SLOW_OP_THRESHOLD_MS,
+            "operations": snapshot(),
+            "slow_ops": slow_ops(),
+        }, fh, ensure_ascii=False, indent=2)
+
+
+def export_csv(path):
+    rows = snapshot()
+    fields = ["op", "count", "errors", "avg_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,116 @@
+"""Фоновая выгрузка одобренных ответов операторов в индекс RAG."""
+import re
+import logging
+
+from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal
+
+from database import list_kb_pending, mark_kb_indexed
+from rag import post_passages
+
+SYNC_INTERVAL_MS = 60 * 1000
+SYNC_BATCH_SIZE = 50
+
+KB_CATEGORY = "ответы операторов"
+
+logger = logging.getLogger("infodesk.kb_sync")
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", str(text).lower())).strip()
+
+
+def export_operator_answers(api_url, batch_size=SYNC_BATCH_SIZE, max_batches=20):
+    """Отправляет новые одобренные пары вопрос-ответ в /index RAG API.
+
+    Повторы одного и того же вопроса внутри пачки схлопываются в
+    последний ответ; сервер дополнительно отбрасывает то, что уже есть
+    в индексе. Возвращает (отправлено, добавлено сервером).
+    """
+    sent = added = 0
+    for _ in range(max_batches):
+        rows = list_kb_pending(batch_size)
+        if not rows:
+            break
+
+        latest = {}
+        for qid, question, answer, operator in rows:
+            latest[_normalize(question)] = (qid, question, answer, operator)
+
+        passages = [
+            {
+                "question": question,
+                "text": answer,
+                "title": question,
+                "category": KB_CATEGORY,
+                "source": f"operator:{operator}",
+                "qid": qid,
+            }
+            for qid, question, answer, operator in latest.values()
+        ]
+        added += post_passages(api_url, passages)
+        sent += len(passages)
+
+        # Схлопнутые дубли тоже считаются выгруженными
+        mark_kb_indexed([r[0] for r in rows])
+
+        if len(rows) < batch_size:
+            break
+    return sent, added
+
+
+class KnowledgeSyncThread(QThread):
+
+    finished = pyqtSignal(int, int)
+    error = pyqtSignal(str)
+
+    def __init__(self, api_url):
+        super().__init__()
+        self.api_url = api_url
+
+    def run(self):
+        try:
+            sent, added = export_operator_answers(self.api_url)
+        except Exception as e:
+            # Сеть, «database is locked», ошибка сервера базы — не должны
+            # выходить из run(): исключение в QThread роняет приложение
+            self.error.emit(str(e))
+            return
+        self.finished.emit(sent, added)
+
+
+class KnowledgeSync(QObject):
+    """Периодически запускает KnowledgeSyncThread, не допуская наложений.
+
+    Неудачная выгрузка пишется в журнал и сообщается сигналом failed;
+    следующая попытка — по таймеру.
+    """
+
+    synced = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, api_url_getter, interval_ms=SYNC_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self.api_url_getter = api_url_getter
+        self.thread = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.sync_now)
+
+    def start(self):
+        self.timer.start()
+        self.sync_now()
+
+    def stop(self):
+        self.timer.stop()
+
+    def sync_now(self):
+        if self.thread is not None and self.thread.isRunning():
+            return
+        self.thread = KnowledgeSyncThread(self.api_url_getter())
+        self.thread.finished.connect(self.synced.emit)
+        self.thread.error.connect(self._on_error)
+        self.thread.start()
+
+    def _on_error(self, message):
+        logger.warning("Не удалось выгрузить ответы в базу знаний: %s", message)
+        self.failed.emit(message)
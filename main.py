@@ -1,40 +1,76 @@
 """Главный модуль приложения InfoDesk."""
 import sys
 import os
+import time
 import shutil
 import json
 
+_STARTED = time.perf_counter()
+
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton,
     QVBoxLayout, QHBoxLayout, QStackedWidget, QFormLayout, QDialog,
     QInputDialog, QFileDialog, QMenuBar, QTableWidget, QTableWidgetItem,
-    QMessageBox, QTextEdit, QSizePolicy, 
+    QMessageBox, QTextEdit, QSizePolicy, QProgressDialog, QScrollArea,
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QPixmap, QAction, QMovie
 
-from rag import DEFAULT_API_URL
 from database import (
-    init_db, get_user, update_user_theme, list_faq_items, add_question,
+    init_db, list_faq_items, add_questions_bulk,
     list_all_questions, list_questions_by_status
 )
-from widgets import (
-    ProfileDialog, AdminWidget, OperatorWidget, UserWidget
-)
-from utils import parse_faq_file, build_and_save_stats_chart
-from themes import get_light_theme, get_dark_theme, get_custom_theme, ThemeDialog
+import database
+import charts
+from session import UserSession
+from profiling import ProfilingSession, parse_profile_flag
+from themes import ThemeEngine, ThemeDialog
+
+# widgets, rag, ingest, kb_sync, drain и utils импортируются там, где нужны:
+# они тянут requests и не требуются до входа в систему
 
 
 class MainWindow(QMainWindow):
     def __init__(self, api_url_default=None):
         super().__init__()
         self.setWindowTitle("InfoDesk")
-        init_db()
         
         # URL-адрес RAG
-        self.api_url_default = api_url_default or DEFAULT_API_URL
+        self._api_url = api_url_default
         self.current_user = None
+        self.session = None
+        self.theme_engine = ThemeEngine()
+        
+        # Выгрузка ответов операторов в индекс RAG (для admin/operator),
+        # создаётся при первом входе такого пользователя
+        self.kb_sync = None
+        # Разбор очереди через RAG, когда API снова доступен (drain.py)
+        self.pending_drain = None
+        # Резервные копии и обслуживание базы в простое (maintenance.py)
+        self.maintenance = None
         self._build_ui()
+        
+        # Проверка схемы базы — после первой отрисовки окна входа
+        QTimer.singleShot(0, self._init_storage)
+    
+    def _init_storage(self):
+        init_db()
+        # При работе через сервер базы (backend.py) обслуживанием занимается он
+        if database.BACKEND_URL:
+            return
+        from maintenance import MaintenanceScheduler
+        self.maintenance = MaintenanceScheduler(self)
+    
+    @property
+    def api_url_default(self):
+        if self._api_url is None:
+            from rag import DEFAULT_API_URL
+            self._api_url = DEFAULT_API_URL
+        return self._api_url
+    
+    @api_url_default.setter
+    def api_url_default(self, value):
+        self._api_url = value
     
     def _build_ui(self):
         central = QWidget()
@@ -94,7 +130,7 @@ class MainWindow(QMainWindow):
         self.update_menu_visibility()
         
         self.resize(980, 660)
-        self.setStyleSheet(get_light_theme())
+        self.theme_engine.apply("light")
     
     def _setup_menu(self):
         # Меню "Файл"
@@ -120,7 +156,7 @@ class MainWindow(QMainWindow):
         file_menu.addAction(self.act_settings)
         file_menu.addSeparator()
         
-        self.act_export_questions = QAction("Экспорт вопросов (TXT)...", self)
+        self.act_export_questions = QAction("Экспорт вопросов...", self)
         self.act_export_questions.triggered.connect(
             self.action_export_questions
         )
@@ -130,6 +166,22 @@ class MainWindow(QMainWindow):
         self.act_export_stats.triggered.connect(self.action_export_stats)
         file_menu.addAction(self.act_export_stats)
         
+        self.act_drain_pending = QAction("Разобрать очередь через RAG...", self)
+        self.act_drain_pending.triggered.connect(self.action_drain_pending)
+        file_menu.addAction(self.act_drain_pending)
+        
+        self.act_archive = QAction("Архивировать старые вопросы...", self)
+        self.act_archive.triggered.connect(self.action_archive_questions)
+        file_menu.addAction(self.act_archive)
+        
+        self.act_maintenance = QAction("Обслуживание базы...", self)
+        self.act_maintenance.triggered.connect(self.action_maintenance)
+        file_menu.addAction(self.act_maintenance)
+        
+        self.act_performance = QAction("Производительность клиента...", self)
+        self.act_performance.triggered.connect(self.action_performance)
+        file_menu.addAction(self.act_performance)
+        
         # Меню "Вопросы" для admin/operator
         self.questions_menu = self.menu_bar.addMenu("Вопросы")
         self.act_q_all = QAction("Все вопросы", self)
@@ -172,9 +224,8 @@ class MainWindow(QMainWindow):
             return
         
         self.menu_bar.setVisible(True)
-        role = get_user(self.current_user).get("role")
-        is_admin = (role == "admin")
-        is_operator = (role == "operator")
+        is_admin = self.session.is_admin
+        is_operator = self.session.is_operator
         
         # Меню файлов доступно всем после входа в систему
         self.act_view_faq.setVisible(True)
@@ -183,6 +234,12 @@ class MainWindow(QMainWindow):
         self.act_settings.setVisible(is_admin)
         self.act_export_questions.setVisible(is_admin)
         self.act_export_stats.setVisible(is_admin)
+        self.act_drain_pending.setVisible(is_admin)
+        # Архив и обслуживание работают с файлом базы напрямую
+        local_db = not database.BACKEND_URL
+        self.act_archive.setVisible(is_admin and local_db)
+        self.act_maintenance.setVisible(is_admin and local_db)
+        self.act_performance.setVisible(is_admin)
         
         # Меню вопросов только для админа и операторов
         self.questions_menu.menuAction().setVisible(
@@ -225,8 +282,7 @@ class MainWindow(QMainWindow):
         dlg.exec()
     
     def action_import_faq(self):
-        if (not self.current_user or
-                get_user(self.current_user).get("role") != "admin"):
+        if self.session is None or not self.session.is_admin:
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Только администратор может импортировать FAQ."
@@ -240,6 +296,8 @@ class MainWindow(QMainWindow):
         if not path:
             return
         
+        from utils import parse_faq_file
+        
         try:
             items = parse_faq_file(path)
         except Exception as e:
@@ -249,15 +307,11 @@ class MainWindow(QMainWindow):
             )
             return
         
-        added = 0
-        for q, a in items:
-            if a:
-                add_question(
-                    "FAQ", q, answer=a, status="answered", operator="FAQ"
-                )
-            else:
-                add_question("FAQ", q, status="pending")
-            added += 1
+        added = add_questions_bulk([
+            ("FAQ", q, a, "answered", "FAQ") if a
+            else ("FAQ", q, None, "pending", None)
+            for q, a in items
+        ])
         
         QMessageBox.information(
             self, "Импорт FAQ",
@@ -265,14 +319,15 @@ class MainWindow(QMainWindow):
         )
     
     def action_load_documentation(self):
-        if (not self.current_user or
-                get_user(self.current_user).get("role") != "admin"):
+        if self.session is None or not self.session.is_admin:
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Только администратор может загружать документацию."
             )
             return
         
+        from ingest import IngestThread, DOCS_DIR
+        
         path, _ = QFileDialog.getOpenFileName(
             self, "Выберите файл документации", "",
             "Документы (*.pdf *.txt *.md);;All Files (*)"
@@ -280,37 +335,80 @@ class MainWindow(QMainWindow):
         if not path:
             return
         
-        docs_dir = "docs"
+        docs_dir = DOCS_DIR
         os.makedirs(docs_dir, exist_ok=True)
         
         try:
             basename = os.path.basename(path)
             dst = os.path.join(docs_dir, basename)
-            shutil.copy(path, dst)
-            
-            if not basename.lower().endswith(".txt"):
-                txt_stub = os.path.join(docs_dir, basename + ".txt")
-                with open(txt_stub, "w", encoding="utf-8") as fh:
-                    fh.write(
-                        f"Документ {basename} загружён.\n"
-                        "Отредактируйте этот файл (TXT) по необходимости.\n"
-                    )
-            
-            QMessageBox.information(
-                self, "Документация",
-                f"Файл сохранён в {dst} "
-                f"(и создана TXT-заглушка в {docs_dir})."
-            )
+            if os.path.abspath(path) != os.path.abspath(dst):
+                shutil.copy(path, dst)
         except Exception as e:
             QMessageBox.warning(
                 self, "Ошибка",
                 f"Не удалось загрузить документацию: {e}"
             )
+            return
+        
+        # Разбор и индексация выполняются в фоне, чтобы не блокировать UI
+        progress = QProgressDialog(
+            f"Обработка {basename}...", "Отмена", 0, 100, self
+        )
+        progress.setWindowTitle("Загрузка документации")
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setValue(0)
+        
+        thread = IngestThread(dst, api_url=self.api_url_default,
+                              docs_dir=docs_dir)
+        self.ingest_thread = thread
+        
+        def on_progress(percent, message):
+            progress.setValue(percent)
+            progress.setLabelText(f"{basename}: {message}")
+        
+        def on_finished(stats):
+            progress.close()
+            if stats["cancelled"]:
+                QMessageBox.information(
+                    self, "Документация", "Загрузка документа отменена."
+                )
+                return
+            
+            text = (
+                f"Файл сохранён в {dst}.\n"
+                f"Страниц: {stats['pages']}, "
+                f"фрагментов: {stats['passages']}.\n"
+                f"Фрагменты: {stats['output']}"
+            )
+            if stats["api_error"]:
+                text += (
+                    f"\n\nНе удалось отправить фрагменты в RAG API "
+                    f"(добавлено в индекс: {stats['indexed']}):\n"
+                    f"{stats['api_error']}\n"
+                    "Загрузите документ ещё раз, когда API станет доступен: "
+                    "уже добавленные фрагменты повторно не индексируются."
+                )
+            else:
+                text += f"\nДобавлено в индекс RAG: {stats['indexed']}."
+            QMessageBox.information(self, "Документация", text)
+        
+        def on_error(message):
+            progress.close()
+            QMessageBox.warning(
+                self, "Ошибка",
+                f"Не удалось обработать документацию: {message}"
+            )
+        
+        thread.progress.connect(on_progress)
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        progress.canceled.connect(thread.cancel)
+        thread.start()
     
     def action_settings_api(self):
         # Только админ может изменить URL-адрес RAG
-        if (not self.current_user or
-                get_user(self.current_user).get("role") != "admin"):
+        if self.session is None or not self.session.is_admin:
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Только администратор может менять настройки RAG API."
@@ -331,8 +429,7 @@ class MainWindow(QMainWindow):
             )
     
     def action_export_questions(self):
-        if (not self.current_user or
-                get_user(self.current_user).get("role") != "admin"):
+        if self.session is None or not self.session.is_admin:
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Только администратор может экспортировать вопросы."
@@ -340,7 +437,7 @@ class MainWindow(QMainWindow):
             return
         
         dlg = QDialog(self)
-        dlg.setWindowTitle("Экспорт вопросов (TXT)")
+        dlg.setWindowTitle("Экспорт вопросов")
         v = QVBoxLayout(dlg)
         v.addWidget(QLabel("Экспортировать вопросы:"))
         
@@ -355,61 +452,85 @@ class MainWindow(QMainWindow):
         v.addLayout(hl)
         
         def do_export(mode):
-            if mode == "all":
-                rows = list_all_questions()
-            elif mode == "pending":
-                rows = list_questions_by_status("pending")
-            else:
-                rows = list_questions_by_status("answered")
-            
-            if not rows:
-                QMessageBox.information(
-                    self, "Экспорт",
-                    "Нет вопросов для экспорта."
-                )
-                return
-            
-            save_to, _ = QFileDialog.getSaveFileName(
-                self, "Сохранить вопросы в TXT", "questions.txt",
-                "Text Files (*.txt)"
-            )
-            
-            if save_to:
-                try:
-                    with open(save_to, "w", encoding="utf-8") as fh:
-                        for r in rows:
-                            qid, user, question, answer, status, operator = r
-                            fh.write(
-                                f"ID: {qid}\n"
-                                f"Пользователь: {user}\n"
-                                f"Статус: {status}\n"
-                                f"Оператор: {operator}\n"
-                                f"Вопрос:\n{question}\n"
-                            )
-                            if answer:
-                                fh.write(f"Ответ:\n{answer}\n")
-                            fh.write("-" * 40 + "\n")
-                    
-                    QMessageBox.information(
-                        self, "Экспорт",
-                        f"Экспорт завершён: {save_to}"
-                    )
-                except Exception as e:
-                    QMessageBox.warning(
-                        self, "Ошибка",
-                        f"Не удалось сохранить файл: {e}"
-                    )
             dlg.accept()
+            self.start_export(
+                "questions", status=None if mode == "all" else mode
+            )
         
         btn_all.clicked.connect(lambda: do_export("all"))
         btn_pending.clicked.connect(lambda: do_export("pending"))
         btn_answered.clicked.connect(lambda: do_export("answered"))
         dlg.exec()
     
+    def start_export(self, default_name, status=None, ids=None):
+        """Спрашивает файл и формат и выгружает вопросы в фоновом потоке."""
+        from exporters import (
+            ExportThread, FORMAT_FILTERS, available_formats, count_questions
+        )
+        
+        if count_questions(status, ids) == 0:
+            QMessageBox.information(
+                self, "Экспорт",
+                "Нет вопросов для экспорта."
+            )
+            return
+        
+        formats = available_formats()
+        save_to, selected_filter = QFileDialog.getSaveFileName(
+            self, "Сохранить вопросы", f"{default_name}.txt",
+            ";;".join(FORMAT_FILTERS[f] for f in formats)
+        )
+        if not save_to:
+            return
+        
+        fmt = next(
+            (f for f in formats if FORMAT_FILTERS[f] == selected_filter), "txt"
+        )
+        if not save_to.lower().endswith("." + fmt):
+            save_to = os.path.splitext(save_to)[0] + "." + fmt
+        
+        progress = QProgressDialog(
+            f"Экспорт в {os.path.basename(save_to)}...", "Отмена", 0, 100, self
+        )
+        progress.setWindowTitle("Экспорт вопросов")
+        progress.setMinimumDuration(300)
+        progress.setAutoClose(False)
+        progress.setValue(0)
+        
+        thread = ExportThread(save_to, fmt, status=status, ids=ids)
+        self.export_thread = thread
+        
+        def on_progress(done, total):
+            progress.setValue(int(done * 100 / total) if total else 100)
+            progress.setLabelText(f"Выгружено записей: {done} из {total}")
+        
+        def on_finished(result):
+            progress.close()
+            if result["cancelled"]:
+                QMessageBox.information(self, "Экспорт", "Экспорт отменён.")
+                return
+            QMessageBox.information(
+                self, "Экспорт",
+                f"Экспорт завершён: {result['path']}\n"
+                f"Записей: {result['rows']}"
+            )
+        
+        def on_error(message):
+            progress.close()
+            QMessageBox.warning(
+                self, "Ошибка",
+                f"Не удалось сохранить файл: {message}"
+            )
+        
+        thread.progress.connect(on_progress)
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        progress.canceled.connect(thread.cancel)
+        thread.start()
+    
     def action_export_stats(self):
         """Экспорт статистики в PNG."""
-        if (not self.current_user or
-                get_user(self.current_user).get("role") != "admin"):
+        if self.session is None or not self.session.is_admin:
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Только администратор может экспортировать статистику."
@@ -417,7 +538,7 @@ class MainWindow(QMainWindow):
             return
         
         try:
-            img_path = build_and_save_stats_chart()
+            png = charts.render_dashboard()
         except Exception as e:
             QMessageBox.warning(
                 self, "Ошибка",
@@ -432,7 +553,7 @@ class MainWindow(QMainWindow):
         
         if save_to:
             try:
-                shutil.copy(img_path, save_to)
+                charts.save_png(png, save_to)
                 QMessageBox.information(
                     self, "Экспорт статистики",
                     f"График сохранён: {save_to}"
@@ -445,24 +566,158 @@ class MainWindow(QMainWindow):
         else:
             dlg = QDialog(self)
             dlg.setWindowTitle("График статистики")
+            dlg.resize(700, 600)
             v = QVBoxLayout(dlg)
             lbl = QLabel()
-            pix = QPixmap(img_path)
+            pix = charts.to_pixmap(png)
             lbl.setPixmap(
                 pix.scaledToWidth(
                     640, Qt.TransformationMode.SmoothTransformation
                 )
             )
-            v.addWidget(lbl)
+            scroll = QScrollArea()
+            scroll.setWidget(lbl)
+            v.addWidget(scroll)
             btn = QPushButton("Закрыть")
             btn.clicked.connect(dlg.accept)
             v.addWidget(btn)
             dlg.exec()
+    
+    def action_drain_pending(self):
+        """Отправляет ожидающие вопросы в RAG и сохраняет уверенные ответы."""
+        if self.session is None or not self.session.is_admin:
+            QMessageBox.warning(
+                self, "Доступ запрещён",
+                "Только администратор может разбирать очередь."
+            )
+            return
         
-        try:
-            os.unlink(img_path)
-        except Exception:
-            pass
+        from drain import format_report
+        from drain_watch import DrainThread
+        
+        progress = QProgressDialog(
+            "Проверка RAG API...", "Отмена", 0, 100, self
+        )
+        progress.setWindowTitle("Разбор очереди")
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setValue(0)
+        
+        # Вручную — все ожидающие, в том числе уже разобранные раньше
+        thread = DrainThread(self.api_url_default, retry=True)
+        self.drain_thread = thread
+        
+        def on_progress(done, total):
+            progress.setValue(int(done * 100 / total) if total else 100)
+            progress.setLabelText(f"Отправлено в RAG: {done} из {total}")
+        
+        def on_finished(report):
+            progress.close()
+            QMessageBox.information(
+                self, "Разбор очереди", format_report(report)
+            )
+        
+        def on_error(message):
+            progress.close()
+            QMessageBox.warning(
+                self, "Ошибка",
+                f"Не удалось разобрать очередь: {message}"
+            )
+        
+        thread.progress.connect(on_progress)
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        progress.canceled.connect(thread.cancel)
+        thread.start()
+    
+    def action_archive_questions(self):
+        """Перенос старых отвеченных вопросов в архивную базу."""
+        if self.session is None or not self.session.is_admin:
+            QMessageBox.warning(
+                self, "Доступ запрещён",
+                "Только администратор может архивировать вопросы."
+            )
+            return
+        
+        from archive import (
+            ARCHIVE_AFTER_DAYS, ArchiveThread, count_archivable, format_report
+        )
+        
+        days, ok = QInputDialog.getInt(
+            self, "Архивирование вопросов",
+            "Перенести в архив вопросы, отвеченные раньше (дней назад):",
+            ARCHIVE_AFTER_DAYS, 1, 3650
+        )
+        if not ok:
+            return
+        
+        n = count_archivable(days)
+        if n == 0:
+            QMessageBox.information(
+                self, "Архивирование вопросов",
+                "Нет вопросов для переноса в архив."
+            )
+            return
+        
+        progress = QProgressDialog(
+            f"Перенос в архив: {n} вопросов...", "Отмена", 0, 100, self
+        )
+        progress.setWindowTitle("Архивирование вопросов")
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setValue(0)
+        
+        thread = ArchiveThread(days)
+        self.archive_thread = thread
+        
+        def on_progress(done, total):
+            progress.setValue(int(done * 100 / total) if total else 100)
+            progress.setLabelText(f"Перенесено: {done} из {total}")
+        
+        def on_finished(report):
+            progress.close()
+            QMessageBox.information(
+                self, "Архивирование вопросов", format_report(report)
+            )
+        
+        def on_error(message):
+            progress.close()
+            QMessageBox.warning(
+                self, "Ошибка",
+                f"Не удалось перенести вопросы в архив: {message}"
+            )
+        
+        thread.progress.connect(on_progress)
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        progress.canceled.connect(thread.cancel)
+        thread.start()
+    
+    def action_maintenance(self):
+        if self.session is None or not self.session.is_admin:
+            QMessageBox.warning(
+                self, "Доступ запрещён",
+                "Только администратор может обслуживать базу."
+            )
+            return
+        
+        from widgets import MaintenanceDialog
+        
+        dlg = MaintenanceDialog(self.maintenance, self)
+        dlg.exec()
+    
+    def action_performance(self):
+        if self.session is None or not self.session.is_admin:
+            QMessageBox.warning(
+                self, "Доступ запрещён",
+                "Только администратор может просматривать замеры."
+            )
+            return
+        
+        from widgets import PerformanceDialog
+        
+        dlg = PerformanceDialog(self)
+        dlg.exec()
     
     def action_help(self):
         text = (
@@ -488,15 +743,14 @@ class MainWindow(QMainWindow):
         QMessageBox.information(self, "О программе InfoDesk", about_text)
     
     def show_questions_dialog(self, filter_mode="all"):
-        if not self.current_user:
+        if self.session is None:
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Войдите в систему."
             )
             return
         
-        role = get_user(self.current_user).get("role")
-        if role not in ("admin", "operator"):
+        if not (self.session.is_admin or self.session.is_operator):
             QMessageBox.warning(
                 self, "Доступ запрещён",
                 "Только оператор или админ могут просматривать этот список."
@@ -534,11 +788,10 @@ class MainWindow(QMainWindow):
         v.addWidget(table)
         
         btns = QHBoxLayout()
-        export_btn = QPushButton("Экспорт выбранных в TXT")
+        export_btn = QPushButton("Экспорт выбранных...")
         
         def export_selected():
-            if (not self.current_user or
-                    get_user(self.current_user).get("role") != "admin"):
+            if self.session is None or not self.session.is_admin:
                 QMessageBox.warning(
                     self, "Доступ запрещён",
                     "Только администратор может экспортировать вопросы."
@@ -553,43 +806,9 @@ class MainWindow(QMainWindow):
                 )
                 return
             
-            save_to, _ = QFileDialog.getSaveFileName(
-                self, "Сохранить вопросы в TXT",
-                "questions_selected.txt", "Text Files (*.txt)"
-            )
-            
-            if save_to:
-                try:
-                    with open(save_to, "w", encoding="utf-8") as fh:
-                        for idx in selected:
-                            row = idx.row()
-                            qid = table.item(row, 0).text()
-                            user = table.item(row, 1).text()
-                            question = table.item(row, 2).text()
-                            answer = table.item(row, 3).text()
-                            status = table.item(row, 4).text()
-                            operator = table.item(row, 5).text()
-                            
-                            fh.write(
-                                f"ID: {qid}\n"
-                                f"Пользователь: {user}\n"
-                                f"Статус: {status}\n"
-                                f"Оператор: {operator}\n"
-                                f"Вопрос:\n{question}\n"
-                            )
-                            if answer:
-                                fh.write(f"Ответ:\n{answer}\n")
-                            fh.write("-" * 40 + "\n")
-                    
-                    QMessageBox.information(
-                        self, "Экспорт",
-                        f"Экспорт выбранных завершён: {save_to}"
-                    )
-                except Exception as e:
-                    QMessageBox.warning(
-                        self, "Ошибка",
-                        f"Не удалось сохранить файл: {e}"
-                    )
+            # Номера берутся из таблицы, тексты — из базы целиком
+            ids = [int(table.item(idx.row(), 0).text()) for idx in selected]
+            self.start_export("questions_selected", ids=ids)
         
         export_btn.clicked.connect(export_selected)
         btns.addWidget(export_btn)
@@ -650,51 +869,52 @@ class MainWindow(QMainWindow):
         gif_label.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter)
         gif_label.setScaledContents(True)
         
+        # GIF загружается после первой отрисовки окна входа
+        gif_label.setVisible(False)
+        QTimer.singleShot(0, lambda: self._load_login_gif(gif_label))
+        
+        # Добавляем GIF с растяжением, чтобы он занимал все оставшееся пространство
+        layout.addWidget(gif_label, 1, Qt.AlignmentFlag.AlignHCenter)
+        
+        return w
+    
+    def _load_login_gif(self, gif_label):
         # Пытаемся загрузить GIF файл
         gif_paths = ["GIF.gif"]
-        gif_loaded = False
         
         for gif_path in gif_paths:
             if os.path.exists(gif_path):
-                movie = QMovie(gif_path)
+                movie = QMovie(gif_path, parent=gif_label)
                 gif_label.setMovie(movie)
                 # Растягиваем GIF на весь доступный экран
                 gif_label.setSizePolicy(
                     QSizePolicy.Policy.Expanding, 
                     QSizePolicy.Policy.Expanding
                 )
+                gif_label.setVisible(True)
                 movie.start()
-                gif_loaded = True
                 break
-        
-        if not gif_loaded:
-            # Если GIF не найден, скрываем виджет
-            gif_label.setVisible(False)
-        
-        # Добавляем GIF с растяжением, чтобы он занимал все оставшееся пространство
-        layout.addWidget(gif_label, 1, Qt.AlignmentFlag.AlignHCenter)
-        
-        return w
     
     def try_login(self):
         login = self.login_input.text().strip()
         pw = self.pw_input.text().strip()
-        user = get_user(login)
+        session = UserSession.login_with_password(login, pw)
         
-        if not user or user.get("password") != pw:
+        if session is None:
             QMessageBox.warning(
                 self, "Ошибка",
                 "Неверный логин или пароль."
             )
             return
         
+        self.session = session
         self.current_user = login
         
         # Показать меню и обновить видимость в соответствии с ролью
         self.update_menu_visibility()
         
         # Открыть пользовательский интерфейс для конкретной роли
-        self.open_role_ui(user.get("role", "user"))
+        self.open_role_ui(session.role)
     
     def open_role_ui(self, role):
         container = QWidget()
@@ -721,6 +941,8 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(top_bar)
         
+        from widgets import AdminWidget, OperatorWidget, UserWidget
+        
         if role == "admin":
             layout.addWidget(AdminWidget())
         elif role == "operator":
@@ -737,51 +959,47 @@ class MainWindow(QMainWindow):
         self.stack.addWidget(container)
         self.stack.setCurrentWidget(container)
         self.apply_theme()
+        
+        if role in ("admin", "operator"):
+            if self.kb_sync is None:
+                from kb_sync import KnowledgeSync
+                self.kb_sync = KnowledgeSync(
+                    lambda: self.api_url_default, parent=self
+                )
+            self.kb_sync.start()
+            # При работе через сервер базы очередь разбирает backend.py
+            if self.pending_drain is None and not database.BACKEND_URL:
+                from drain_watch import PendingDrain
+                self.pending_drain = PendingDrain(
+                    lambda: self.api_url_default, parent=self
+                )
+            if self.pending_drain is not None:
+                self.pending_drain.start()
     
     def open_profile(self):
-        dlg = ProfileDialog(self.current_user, parent=self)
-        dlg.exec()
+        from widgets import ProfileDialog
+        
+        dlg = ProfileDialog(
+            self.current_user, parent=self, user=self.session.user
+        )
+        if dlg.exec():
+            # Имя могло измениться — перечитать запись при следующем обращении
+            self.session.invalidate()
     
     def apply_theme(self):
-        user = get_user(self.current_user) or {"theme": "light"}
-        theme = user.get("theme", "light")
-        
-        if theme == "dark":
-            self.setStyleSheet(get_dark_theme())
-        elif theme == "light":
-            self.setStyleSheet(get_light_theme())
-        else:
-            # Попытка распарсить кастомную тему (JSON)
-            try:
-                theme_data = json.loads(theme)
-                if isinstance(theme_data, dict) and theme_data.get("type") == "custom":
-                    colors = theme_data.get("colors", {})
-                    custom_theme = get_custom_theme(
-                        colors.get("bg", "#f5f5f5"),
-                        colors.get("text", "#333333"),
-                        colors.get("input_bg", "#ffffff"),
-                        colors.get("input_border", "#e0e0e0"),
-                        colors.get("button", "#4CAF50"),
-                        colors.get("button_text", "white"),
-                        colors.get("menubar", "#eeeeee")
-                    )
-                    self.setStyleSheet(custom_theme)
-                else:
-                    self.setStyleSheet(get_light_theme())
-            except (json.JSONDecodeError, TypeError):
-                # Если не JSON, значит старая тема
-                self.setStyleSheet(get_light_theme())
+        theme = self.session.theme if self.session is not None else "light"
+        self.theme_engine.apply(theme)
     
     def show_theme_dialog(self):
         """Открывает диалог выбора темы с опциями: светлая, темная, и палитра."""
-        user = get_user(self.current_user) or {"theme": "light"}
-        current_theme = user.get("theme", "light")
+        current_theme = self.session.theme
         
         dlg = ThemeDialog(
             self,
             current_theme,
-            update_user_theme,
-            self.apply_theme
+            lambda login, theme: self.session.set_theme(theme),
+            self.apply_theme,
+            engine=self.theme_engine
         )
         dlg.set_current_user(self.current_user)
         dlg.exec()
@@ -797,20 +1015,54 @@ class MainWindow(QMainWindow):
             widget.deleteLater()
         
         self.current_user = None
-        self.setStyleSheet(get_light_theme())
+        self.session = None
+        if self.kb_sync is not None:
+            self.kb_sync.stop()
+        if self.pending_drain is not None:
+            self.pending_drain.stop()
+        if database.BACKEND_URL:
+            import backend_client
+            backend_client.logout()
+        self.theme_engine.apply("light")
         
         # Скрыть меню при выходе из системы
         self.menu_bar.setVisible(False)
 
 
+def _ms_since_start():
+    return round((time.perf_counter() - _STARTED) * 1000, 1)
+
+
+def _startup_probe(app, marks):
+    """Печатает замеры запуска и закрывает приложение (benchmarks.bench_startup)."""
+    marks["login_ready_ms"] = _ms_since_start()
+    print("STARTUP " + json.dumps(marks), flush=True)
+    app.quit()
+
+
 def main():
+    marks = {"imports_ms": _ms_since_start()}
+    
+    # --profile[=sample] или INFODESK_PROFILE включают профилирование сессии
+    profile_mode, argv = parse_profile_flag(sys.argv)
+    profiler = ProfilingSession(profile_mode).start() if profile_mode else None
+
     QApplication.setAttribute(
         Qt.ApplicationAttribute.AA_DontUseNativeMenuBar, True
     )
     
-    app = QApplication(sys.argv)
+    app = QApplication(argv)
+    marks["qapplication_ms"] = _ms_since_start()
+    if profiler is not None:
+        app.aboutToQuit.connect(profiler.stop)
     mw = MainWindow()
+    marks["main_window_ms"] = _ms_since_start()
     mw.show()
+    marks["shown_ms"] = _ms_since_start()
+    
+    # Отложенные init_db и загрузка GIF выполнятся раньше этого таймера
+    if os.environ.get("INFODESK_STARTUP_PROBE"):
+        QTimer.singleShot(0, lambda: _startup_probe(app, marks))
     sys.exit(app.exec())
 
 
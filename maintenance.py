@@ -0,0 +1,437 @@
+"""Резервные копии и обслуживание базы data.db.
+
+Копия снимается онлайн через sqlite3 backup API порциями по BACKUP_PAGES
+страниц: между порциями блокировка отпускается, и клиенты продолжают
+писать. Копия пишется в <имя>.part, проверяется PRAGMA quick_check и
+только потом переименовывается; хранятся последние BACKUP_KEEP копий.
+
+PRAGMA optimize, ANALYZE, incremental_vacuum и копия выполняются по
+расписанию (TASK_INTERVALS), когда пользователь какое-то время ничего не
+делает в приложении (MaintenanceScheduler). Время последнего запуска
+хранится в таблице maintenance_log, общей для всех клиентов базы.
+
+Запуск из командной строки:
+    python maintenance.py              # отчёт о размере и фрагментации
+    python maintenance.py --backup
+    python maintenance.py --run optimize,analyze
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+from PyQt6.QtCore import (
+    QObject, QThread, QTimer, QEvent, QCoreApplication, pyqtSignal
+)
+
+import database
+from database import db_connect, archive_db_path
+from instrumentation import instrumented
+
+BACKUP_DIR = os.environ.get("INFODESK_BACKUP_DIR")
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.01
+BACKUP_KEEP = 7
+
+# Сколько страниц освобождать за один запуск incremental_vacuum
+VACUUM_PAGES = 2000
+
+# Интервалы задач в секундах, в порядке запуска
+TASK_INTERVALS = {
+    "optimize": 3600,
+    "incremental_vacuum": 6 * 3600,
+    "analyze": 24 * 3600,
+    "backup": 24 * 3600,
+}
+
+# Обслуживание начинается после IDLE_SECONDS без ввода пользователя
+IDLE_SECONDS = 120
+CHECK_INTERVAL_MS = 60 * 1000
+
+_INPUT_EVENTS = {
+    QEvent.Type.KeyPress, QEvent.Type.MouseButtonPress,
+    QEvent.Type.MouseMove, QEvent.Type.Wheel,
+}
+
+
+def backup_dir():
+    if BACKUP_DIR:
+        return BACKUP_DIR
+    return os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)),
+                        "backups")
+
+
+def _backup_file(src_path, path, pages, sleep, progress_cb):
+    tmp = path + ".part"
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(tmp)
+    try:
+        def on_progress(status, remaining, total):
+            if progress_cb:
+                progress_cb(os.path.basename(src_path), total - remaining, total)
+
+        src.backup(dst, pages=pages, progress=on_progress, sleep=sleep)
+        check = dst.execute("PRAGMA quick_check").fetchone()[0]
+    except BaseException:
+        dst.close()
+        src.close()
+        os.unlink(tmp)
+        raise
+    dst.close()
+    src.close()
+    if check != "ok":
+        os.unlink(tmp)
+        raise RuntimeError(f"Копия {path} не прошла проверку: {check}")
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def _rotate(dest_dir, prefix, keep):
+    names = sorted(
+        n for n in os.listdir(dest_dir)
+        if n.startswith(prefix + "-") and n.endswith(".db")
+    )
+    for name in (names[:-keep] if keep else []):
+        os.unlink(os.path.join(dest_dir, name))
+
+
+@instrumented("maintenance.backup")
+def backup(dest_dir=None, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP,
+           keep=BACKUP_KEEP, progress_cb=None):
+    """Онлайн-копия основной базы и архива (если он есть).
+
+    progress_cb(файл, скопировано_страниц, всего_страниц). Возвращает
+    {"files": [{"path", "bytes"}], "seconds"}.
+    """
+    t0 = time.perf_counter()
+    dest_dir = dest_dir or backup_dir()
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+
+    sources = [database.DB_PATH]
+    if os.path.exists(archive_db_path()):
+        sources.append(archive_db_path())
+
+    files = []
+    for src_path in sources:
+        prefix = os.path.splitext(os.path.basename(src_path))[0]
+        path = os.path.join(dest_dir, f"{prefix}-{stamp}.db")
+        size = _backup_file(src_path, path, pages, sleep, progress_cb)
+        files.append({"path": path, "bytes": size})
+        _rotate(dest_dir, prefix, keep)
+    return {"files": files, "seconds": round(time.perf_counter() - t0, 2)}
+
+
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+@instrumented("maintenance.optimize")
+def run_optimize():
+    conn = db_connect()
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    return {}
+
+
+@instrumented("maintenance.analyze")
+def run_analyze():
+    conn = db_connect()
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return {}
+
+
+@instrumented("maintenance.incremental_vacuum")
+def run_incremental_vacuum(pages=VACUUM_PAGES):
+    """Возвращает системе до pages свободных страниц.
+
+    Работает, только если у базы auto_vacuum = INCREMENTAL: новые базы
+    создаются так сразу, старые переходят на этот режим после первого
+    полного VACUUM (enable_incremental_vacuum).
+    """
+    conn = db_connect()
+    if _pragma(conn, "auto_vacuum") != 2:
+        conn.close()
+        return {"skipped": "auto_vacuum не INCREMENTAL"}
+    before = _pragma(conn, "freelist_count")
+    # execute() делает один шаг и освобождает одну страницу,
+    # executescript() выполняет прагму до конца
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    freed = before - _pragma(conn, "freelist_count")
+    page_size = _pragma(conn, "page_size")
+    conn.close()
+    return {"freed_pages": freed, "freed_bytes": freed * page_size}
+
+
+def enable_incremental_vacuum():
+    """Переводит базу на auto_vacuum = INCREMENTAL (полный VACUUM)."""
+    conn = db_connect()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    mode = _pragma(conn, "auto_vacuum")
+    conn.close()
+    return {"auto_vacuum": mode}
+
+
+TASKS = {
+    "optimize": run_optimize,
+    "incremental_vacuum": run_incremental_vacuum,
+    "analyze": run_analyze,
+    "backup": backup,
+}
+
+
+def last_runs():
+    """{задача: {"last_run", "seconds", "result"}} из maintenance_log."""
+    conn = db_connect()
+    rows = conn.execute(
+        "SELECT task, last_run, seconds, result FROM maintenance_log"
+    ).fetchall()
+    conn.close()
+    return {
+        task: {"last_run": last_run, "seconds": seconds,
+               "result": json.loads(result) if result else None}
+        for task, last_run, seconds, result in rows
+    }
+
+
+def due_tasks(now=None):
+    now = now or time.time()
+    runs = last_runs()
+    due = []
+    for task, interval in TASK_INTERVALS.items():
+        last = runs.get(task, {}).get("last_run")
+        if last is None or now - time.mktime(
+                time.strptime(last, "%Y-%m-%d %H:%M:%S")) >= interval:
+            due.append(task)
+    return due
+
+
+def run_task(task):
+    t0 = time.perf_counter()
+    result = TASKS[task]()
+    seconds = round(time.perf_counter() - t0, 3)
+    conn = db_connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO maintenance_log(task, last_run, seconds, result) "
+        "VALUES(?,?,?,?)",
+        (task, database._now(), seconds, json.dumps(result, ensure_ascii=False))
+    )
+    conn.commit()
+    conn.close()
+    return {"task": task, "seconds": seconds, "result": result}
+
+
+def run_due(tasks=None, is_idle=None):
+    """Выполняет задачи, у которых подошёл срок (или tasks), по одной.
+
+    Перед каждой задачей проверяет is_idle() и прекращает работу, если
+    пользователь вернулся к приложению.
+    """
+    done = []
+    for task in tasks if tasks is not None else due_tasks():
+        if is_idle and not is_idle():
+            break
+        done.append(run_task(task))
+    return done
+
+
+def db_report():
+    """Размер базы, свободные страницы и заполненность страниц таблиц."""
+    conn = db_connect()
+    page_size = _pragma(conn, "page_size")
+    page_count = _pragma(conn, "page_count")
+    freelist = _pragma(conn, "freelist_count")
+    report = {
+        "path": os.path.abspath(database.DB_PATH),
+        "file_bytes": os.path.getsize(database.DB_PATH),
+        "page_size": page_size,
+        "page_count": page_count,
+        "free_pages": freelist,
+        "free_ratio": round(freelist / page_count, 4) if page_count else 0.0,
+        "auto_vacuum": {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}.get(
+            _pragma(conn, "auto_vacuum")),
+        "journal_mode": _pragma(conn, "journal_mode"),
+        "tables": None,
+    }
+    # dbstat есть не во всех сборках SQLite
+    try:
+        rows = conn.execute(
+            "SELECT name, COUNT(1), SUM(pgsize), SUM(unused) FROM dbstat "
+            "GROUP BY name ORDER BY SUM(pgsize) DESC"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = None
+    conn.close()
+
+    if rows is not None:
+        report["tables"] = [
+            {"name": name, "pages": pages, "bytes": size,
+             "unused_ratio": round(unused / size, 4) if size else 0.0}
+            for name, pages, size, unused in rows
+        ]
+    path = archive_db_path()
+    report["archive_bytes"] = os.path.getsize(path) if os.path.exists(path) else 0
+    report["last_runs"] = last_runs()
+    return report
+
+
+def _kb(n):
+    return f"{n / 1024:.1f} КБ"
+
+
+def format_report(report):
+    lines = [
+        f"База: {report['path']}",
+        f"Размер: {_kb(report['file_bytes'])} "
+        f"({report['page_count']} стр. по {report['page_size']} байт)",
+        f"Свободных страниц: {report['free_pages']} "
+        f"({report['free_ratio'] * 100:.1f}%), "
+        f"auto_vacuum: {report['auto_vacuum']}, "
+        f"журнал: {report['journal_mode']}",
+    ]
+    if report["archive_bytes"]:
+        lines.append(f"Архив: {_kb(report['archive_bytes'])}")
+    if report["tables"]:
+        lines.append("")
+        lines.append("Таблицы и индексы (размер, не занято внутри страниц):")
+        for t in report["tables"]:
+            lines.append(
+                f"  {t['name']}: {_kb(t['bytes'])}, "
+                f"{t['unused_ratio'] * 100:.1f}%"
+            )
+    lines.append("")
+    lines.append("Обслуживание:")
+    for task in TASK_INTERVALS:
+        run = report["last_runs"].get(task)
+        lines.append(
+            f"  {task}: {run['last_run']} ({run['seconds']} с)" if run
+            else f"  {task}: не выполнялось"
+        )
+    return "\n".join(lines)
+
+
+class MaintenanceThread(QThread):
+
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(list)
+    error = pyqtSignal(str)
+
+    def __init__(self, tasks=None, is_idle=None):
+        super().__init__()
+        self.tasks = tasks
+        self.is_idle = is_idle
+
+    def run(self):
+        try:
+            done = run_due(self.tasks, self.is_idle)
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(done)
+
+
+class MaintenanceScheduler(QObject):
+    """Раз в CHECK_INTERVAL_MS запускает просроченные задачи в фоне,
+    если пользователь не трогал мышь и клавиатуру IDLE_SECONDS."""
+
+    def __init__(self, parent=None, idle_seconds=IDLE_SECONDS,
+                 check_ms=CHECK_INTERVAL_MS):
+        super().__init__(parent)
+        self.idle_seconds = idle_seconds
+        self.last_input = time.monotonic()
+        self.thread = None
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.installEventFilter(self)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.timer.start(check_ms)
+
+    def eventFilter(self, obj, event):
+        if event.type() in _INPUT_EVENTS:
+            self.last_input = time.monotonic()
+        return False
+
+    def is_idle(self):
+        return time.monotonic() - self.last_input >= self.idle_seconds
+
+    def is_running(self):
+        return self.thread is not None and self.thread.isRunning()
+
+    def check(self):
+        if self.is_running() or not self.is_idle():
+            return
+        try:
+            if not due_tasks():
+                return
+        except sqlite3.Error:
+            return
+        self.start()
+
+    def start(self, tasks=None, on_finished=None, on_error=None):
+        """Запускает задачи в фоне; tasks=None — только просроченные.
+
+        on_finished и on_error подключаются до запуска потока, чтобы не
+        пропустить сигнал быстрой задачи.
+        """
+        if self.is_running():
+            return None
+        self.thread = MaintenanceThread(
+            tasks, is_idle=self.is_idle if tasks is None else None
+        )
+        if on_finished is not None:
+            self.thread.finished.connect(on_finished)
+        if on_error is not None:
+            self.thread.error.connect(on_error)
+        self.thread.start()
+        return self.thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--backup", action="store_true",
+                        help="снять резервную копию")
+    parser.add_argument("--dest", help="папка для копий")
+    parser.add_argument("--run", help="задачи через запятую: "
+                        + ",".join(TASK_INTERVALS) + "; due — просроченные")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="перевести базу на auto_vacuum = INCREMENTAL")
+    parser.add_argument("--json", action="store_true",
+                        help="отчёт в формате JSON")
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    database.init_db()
+
+    if args.enable_incremental_vacuum:
+        print(enable_incremental_vacuum())
+    if args.backup:
+        for f in backup(args.dest)["files"]:
+            print(f"Копия: {f['path']} ({_kb(f['bytes'])})")
+    if args.run:
+        tasks = None if args.run == "due" else [
+            t for t in args.run.split(",") if t
+        ]
+        unknown = set(tasks or ()) - set(TASKS)
+        if unknown:
+            parser.error(f"неизвестные задачи: {', '.join(sorted(unknown))}")
+        for done in run_due(tasks):
+            print(f"{done['task']}: {done['seconds']} с {done['result']}")
+
+    report = db_report()
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
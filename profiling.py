@@ -0,0 +1,182 @@
+"""Режим профилирования настольного приложения.
+
+Включается флагом --profile (или --profile=sample) при запуске main.py,
+либо переменной окружения INFODESK_PROFILE=cprofile|sample. На время
+сессии работает cProfile (детерминированно, только главный поток Qt) или
+сэмплирующий профилировщик стеков главного потока, а tracemalloc следит
+за памятью. При выходе отчёты складываются в profiles/<время>-<pid>/.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from collections import Counter
+
+PROFILE_DIR = os.environ.get("INFODESK_PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 10
+TOP_N = 50
+
+MODES = ("cprofile", "sample")
+
+
+def parse_profile_flag(argv):
+    """Достаёт --profile[=режим] из argv. Возвращает (режим или None, argv без флага)."""
+    mode = None
+    rest = []
+    for arg in argv:
+        if arg == "--profile":
+            mode = "cprofile"
+        elif arg.startswith("--profile="):
+            mode = arg.split("=", 1)[1] or "cprofile"
+        else:
+            rest.append(arg)
+
+    if mode is None:
+        env = os.environ.get("INFODESK_PROFILE", "").strip().lower()
+        if env in ("1", "true", "yes"):
+            mode = "cprofile"
+        elif env:
+            mode = env
+
+    if mode is not None and mode not in MODES:
+        raise ValueError(
+            f"Неизвестный режим профилирования: {mode} (ожидается {', '.join(MODES)})"
+        )
+    return mode, rest
+
+
+class _StackSampler(threading.Thread):
+    """Периодически снимает стек главного потока и считает одинаковые стеки."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                stack.append(f"{module}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+class ProfilingSession:
+
+    def __init__(self, mode="cprofile", out_dir=PROFILE_DIR):
+        self.mode = mode
+        self.out_dir = out_dir
+        self.profiler = None
+        self.sampler = None
+        self.started = None
+        self.stopped = False
+
+    def start(self):
+        self.started = time.time()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        if self.mode == "sample":
+            self.sampler = _StackSampler(threading.main_thread().ident)
+            self.sampler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        # Если приложение завершится без aboutToQuit, отчёт всё равно сохранится
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Останавливает профилирование и пишет отчёты. Возвращает папку."""
+        if self.stopped or self.started is None:
+            return None
+        self.stopped = True
+
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        session_dir = os.path.join(self.out_dir, f"{stamp}-{os.getpid()}")
+        os.makedirs(session_dir, exist_ok=True)
+
+        summary = {
+            "mode": self.mode,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "duration_s": round(time.time() - self.started, 2),
+            "memory_current_kb": round(current / 1024, 1),
+            "memory_peak_kb": round(peak / 1024, 1),
+        }
+
+        if self.profiler is not None:
+            self._dump_cprofile(session_dir)
+        if self.sampler is not None:
+            summary["samples"] = self.sampler.samples
+            self._dump_samples(session_dir)
+        self._dump_memory(session_dir, snapshot)
+
+        with open(os.path.join(session_dir, "summary.json"), "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, ensure_ascii=False, indent=2)
+        return session_dir
+
+    def _dump_cprofile(self, session_dir):
+        # .pstats открывается snakeviz / python -m pstats
+        self.profiler.dump_stats(os.path.join(session_dir, "cprofile.pstats"))
+        with open(os.path.join(session_dir, "cprofile.txt"), "w", encoding="utf-8") as fh:
+            stats = pstats.Stats(self.profiler, stream=fh)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(TOP_N)
+            stats.sort_stats("tottime").print_stats(TOP_N)
+
+    def _dump_samples(self, session_dir):
+        # Формат «свёрнутых стеков» для flamegraph.pl / speedscope
+        with open(os.path.join(session_dir, "samples.folded"), "w", encoding="utf-8") as fh:
+            for stack, count in self.sampler.stacks.most_common():
+                fh.write(f"{stack} {count}\n")
+
+        # Функции, на которых главный поток провёл больше всего времени
+        own = Counter()
+        for stack, count in self.sampler.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        total = self.sampler.samples or 1
+        with open(os.path.join(session_dir, "samples.txt"), "w", encoding="utf-8") as fh:
+            fh.write(f"Сэмплов: {self.sampler.samples}, интервал {SAMPLE_INTERVAL * 1000:.0f} мс\n\n")
+            for frame, count in own.most_common(TOP_N):
+                fh.write(f"{count / total * 100:6.2f}%  {count:7d}  {frame}\n")
+
+    def _dump_memory(self, session_dir, snapshot):
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with open(os.path.join(session_dir, "memory.txt"), "w", encoding="utf-8") as fh:
+            fh.write("Крупнейшие выделения памяти (по строкам):\n")
+            for stat in snapshot.statistics("lineno")[:TOP_N]:
+                fh.write(f"{stat}\n")
+            fh.write("\nКрупнейшие выделения памяти (по стеку, топ-10):\n")
+            for stat in snapshot.statistics("traceback")[:10]:
+                fh.write(f"\n{stat.count} блоков, {stat.size / 1024:.1f} KiB\n")
+                for line in stat.traceback.format():
+                    fh.write(f"{line}\n")
@@ -1,36 +1,94 @@
+import re
+
 import requests
-from PyQt6.QtCore import QThread, pyqtSignal
+
+from instrumentation import instrumented, timed
 
 DEFAULT_API_URL = "Token_api"
 
+# Маркеры, означающие, что RAG не нашел информацию
+FAIL_MARKERS = (
+    "не знаю", "не найден", "не могу ответить",
+    "перевожу на оператора", "обратитесь к специалисту",
+)
+
+
+class RagApiError(Exception):
+    """RAG API ответил кодом, отличным от 200."""
+
+    def __init__(self, status_code):
+        super().__init__(f"Ошибка API: {status_code}")
+        self.status_code = status_code
+
+
+def clean_text(text):
+    if not text: return ""
+    return re.sub(
+        r'\s+', ' ',
+        text.replace('&nbsp;', ' ')
+    ).strip()
+
+
+def is_failed_answer(answer):
+    """True, если ответ пустой или RAG не нашёл информацию."""
+    cleaned = clean_text(answer or "")
+    return not cleaned or any(marker in cleaned.lower() for marker in FAIL_MARKERS)
+
+
+def api_endpoint(api_url, path):
+    """URL другого метода RAG API по адресу /ask (например, /index)."""
+    base = (api_url or "").rstrip("/")
+    if base.endswith("/ask"):
+        base = base[:-len("/ask")]
+    return f"{base}/{path.lstrip('/')}"
+
+
+@instrumented("rag.index")
+def post_passages(api_url, passages, timeout=120):
+    """Отправляет фрагменты документов в индекс RAG. Возвращает число новых."""
+    response = requests.post(
+        api_endpoint(api_url, "index"),
+        json={"passages": passages},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return int(response.json().get("added", 0))
+
+
+def ask(api_url, question, timeout=60):
+    """Запрос к /ask. Возвращает ответ сервера целиком.
+
+    Словарь с ключом "answer" (строка, может быть пустой) и, если сервер
+    их прислал, "route" и "distance" — насколько уверенно найден ответ.
+    """
+    with timed("rag.ask"):
+        response = requests.post(
+            api_url,
+            json={"question": question},
+            timeout=timeout
+        )
+
+    if response.status_code != 200:
+        raise RagApiError(response.status_code)
+    try:
+        data = response.json()
+        if not isinstance(data, dict):
+            data = {"answer": str(data)}
+    except Exception:
+        data = {"answer": response.text or ""}
+    data["answer"] = data.get("answer") or ""
+    return data
+
+
+def ask_question(api_url, question, timeout=60):
+    """Синхронный запрос к /ask. Возвращает текст ответа (может быть пустым)."""
+    return ask(api_url, question, timeout)["answer"]
 
-class RequestThread(QThread):
-    
-    finished = pyqtSignal(str)
-    error = pyqtSignal(str)
-    
-    def __init__(self, api_url, question):
-        super().__init__()
-        self.api_url = api_url
-        self.question = question
-    
-    def run(self):
-        try:
-            response = requests.post(
-                self.api_url,
-                json={"question": self.question},
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    ans = data.get("answer", "")
-                except Exception:
-                    ans = response.text or ""
-                self.finished.emit(ans or "")
-            else:
-                self.error.emit(f"Ошибка API: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            self.error.emit(f"Ошибка соединения с API:\n{e}")
 
+def check_health(api_url, timeout=5):
+    """True, если RAG API отвечает на /health."""
+    try:
+        response = requests.get(api_endpoint(api_url, "health"), timeout=timeout)
+    except requests.exceptions.RequestException:
+        return False
+    return response.status_code == 200
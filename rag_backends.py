@@ -0,0 +1,174 @@
+"""Бэкенды инференса для RAG-сервера: PyTorch или ONNX Runtime (int8)."""
+import os
+import glob
+import shutil
+
+import numpy as np
+
+EMBEDDER_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDER_REPO = "sentence-transformers/" + EMBEDDER_MODEL
+GENERATOR_MODEL = "ai-forever/rugpt3small_based_on_gpt2"
+
+# torch | onnx
+INFERENCE_BACKEND = os.environ.get("INFODESK_INFERENCE_BACKEND", "torch")
+ONNX_DIR = os.environ.get("INFODESK_ONNX_DIR", os.path.join("models", "onnx"))
+ONNX_THREADS = int(os.environ.get("INFODESK_ONNX_THREADS", "0"))
+
+
+# ------------- PyTorch --------------
+def load_torch_models():
+    from sentence_transformers import SentenceTransformer
+    from transformers import pipeline
+
+    embedder = SentenceTransformer(EMBEDDER_MODEL)
+    generator = pipeline("text-generation", model=GENERATOR_MODEL)
+    return embedder, generator
+
+
+# ------------- ONNX Runtime --------------
+def _quantization_config():
+    import platform
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+
+def _session_options():
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_THREADS:
+        opts.intra_op_num_threads = ONNX_THREADS
+    return opts
+
+
+def export_quantized(model_id, model_cls, out_dir):
+    """Экспортирует модель в ONNX и квантует веса в int8 (динамически).
+
+    Результат кэшируется в out_dir, повторный вызов ничего не делает.
+    """
+    from optimum.onnxruntime import ORTQuantizer
+    from transformers import AutoTokenizer
+
+    quant_dir = out_dir + "-int8"
+    if glob.glob(os.path.join(quant_dir, "*.onnx")):
+        return quant_dir
+
+    model = model_cls.from_pretrained(model_id, export=True)
+    model.save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(out_dir)
+
+    for onnx_path in sorted(glob.glob(os.path.join(out_dir, "*.onnx"))):
+        quantizer = ORTQuantizer.from_pretrained(
+            out_dir, file_name=os.path.basename(onnx_path)
+        )
+        quantizer.quantize(
+            save_dir=quant_dir, quantization_config=_quantization_config()
+        )
+
+    # Конфиги и токенизатор нужны рядом с квантованными весами
+    for path in glob.glob(os.path.join(out_dir, "*")):
+        if not path.endswith(".onnx"):
+            dst = os.path.join(quant_dir, os.path.basename(path))
+            if os.path.isfile(path) and not os.path.exists(dst):
+                shutil.copy2(path, dst)
+    return quant_dir
+
+
+def _quantized_file(model_dir):
+    files = sorted(glob.glob(os.path.join(model_dir, "*_quantized.onnx")))
+    return os.path.basename(files[0]) if files else None
+
+
+class OnnxSentenceEmbedder:
+    """Замена SentenceTransformer.encode поверх ONNX Runtime.
+
+    MiniLM-paraphrase использует mean pooling по маске внимания.
+    """
+
+    def __init__(self, model_dir, batch_size=32):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=_quantized_file(model_dir),
+            session_options=_session_options()
+        )
+        self.batch_size = batch_size
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            chunk = list(texts[start:start + self.batch_size])
+            enc = self.tokenizer(
+                chunk, padding=True, truncation=True, max_length=128,
+                return_tensors="np"
+            )
+            hidden = self.model(**enc).last_hidden_state
+            hidden = np.asarray(hidden)
+            mask = enc["attention_mask"][..., None].astype(hidden.dtype)
+            summed = (hidden * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append((summed / counts).astype(np.float32))
+        return np.vstack(out)
+
+
+def load_onnx_models(onnx_dir=ONNX_DIR):
+    from optimum.onnxruntime import (
+        ORTModelForFeatureExtraction, ORTModelForCausalLM
+    )
+    from transformers import AutoTokenizer, pipeline
+
+    emb_dir = export_quantized(
+        EMBEDDER_REPO, ORTModelForFeatureExtraction,
+        os.path.join(onnx_dir, "embedder")
+    )
+    gen_dir = export_quantized(
+        GENERATOR_MODEL, ORTModelForCausalLM,
+        os.path.join(onnx_dir, "generator")
+    )
+
+    embedder = OnnxSentenceEmbedder(emb_dir)
+    gen_model = ORTModelForCausalLM.from_pretrained(
+        gen_dir,
+        file_name=_quantized_file(gen_dir),
+        session_options=_session_options()
+    )
+    generator = pipeline(
+        "text-generation",
+        model=gen_model,
+        tokenizer=AutoTokenizer.from_pretrained(gen_dir)
+    )
+    return embedder, generator
+
+
+def load_embedder(backend=None):
+    """Только модель эмбеддингов (для бенчмарков поиска)."""
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDER_MODEL)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        return OnnxSentenceEmbedder(export_quantized(
+            EMBEDDER_REPO, ORTModelForFeatureExtraction,
+            os.path.join(ONNX_DIR, "embedder")
+        ))
+    raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
+
+
+def load_models(backend=None):
+    """Возвращает (embedder, generator) для выбранного бэкенда."""
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if backend == "torch":
+        return load_torch_models()
+    if backend == "onnx":
+        return load_onnx_models()
+    raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
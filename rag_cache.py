@@ -0,0 +1,346 @@
+"""Кэши RAG-сервера."""
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import faiss
+
+try:
+    import fcntl
+except ImportError:  # Windows: сервер работает в одном процессе
+    fcntl = None
+
+EMBEDDING_CACHE_SIZE = 2048
+
+SEMANTIC_CACHE_SIZE = 5000
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL = 7 * 24 * 3600
+
+
+class EmbeddingCache:
+    """LRU-кэш: обработанный запрос -> эмбеддинг и результат поиска.
+
+    preprocess_text сводит разные формулировки к одному «мешку» лемм,
+    поэтому ключом служит уже обработанная строка. Результат поиска
+    хранится вместе с версией индекса и считается устаревшим, если
+    индекс с тех пор пополнялся; эмбеддинг при этом остаётся годным.
+    """
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.search_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_embedding(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry["embedding"]
+
+    def put_embedding(self, key, embedding):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                entry["embedding"] = embedding
+                self._items.move_to_end(key)
+                return
+            self._items[key] = {
+                "embedding": embedding,
+                "search": None,
+            }
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def get_search(self, key, k, version):
+        """(D, I) для top-k, если они посчитаны на текущей версии индекса."""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry["search"] is None:
+                return None
+            s_version, s_k, D, I = entry["search"]
+            if s_version != version or s_k < k:
+                return None
+            self.search_hits += 1
+            return D[:, :k], I[:, :k]
+
+    def put_search(self, key, k, version, D, I):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                entry["search"] = (version, k, D, I)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "search_hits": self.search_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SemanticCache:
+    """Кэш сгенерированных ответов по близости эмбеддингов запросов.
+
+    Эмбеддинги нормируются и хранятся в FAISS IndexFlatIP, так что
+    скалярное произведение равно косинусной близости. Записи вытесняются
+    по LRU при переполнении и по TTL при обращении, кэш сохраняется на
+    диск (индекс + JSON с ответами) и загружается при старте.
+
+    Каждая запись помнит version — версию базы знаний, по которой ответ
+    сгенерирован (см. set_version); записи другой версии не отдаются.
+
+    Под rag_serve.py у каждого рабочего процесса свой кэш, а файл на диске
+    один: сохраняет его только процесс, захвативший <path>.lock, и только
+    если с последней загрузки или сохранения появились новые ответы. Ответы,
+    закэшированные другими процессами, на диск не попадают и теряются при
+    перезапуске — после него их придётся сгенерировать заново.
+    """
+
+    def __init__(self, dim, max_size=SEMANTIC_CACHE_SIZE,
+                 threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 path=None):
+        self.dim = dim
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self.path = path
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self._entries = OrderedDict()   # id -> {answer, created, distance, version}
+        self.version = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._writer_fd = None
+        self._writer_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _remove(self, ids):
+        if ids:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+            for entry_id in ids:
+                self._entries.pop(entry_id, None)
+
+    def lookup(self, embedding):
+        """Возвращает (ответ, близость, расстояние) или None.
+
+        Расстояние — то, с которым ответ был сгенерирован (None для
+        записей, сохранённых без него).
+        """
+        if not self.max_size:
+            return None
+        vec = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            sims, ids = self.index.search(vec, 1)
+            entry_id, sim = int(ids[0][0]), float(sims[0][0])
+            entry = self._entries.get(entry_id)
+            if entry is not None and now - entry["created"] > self.ttl:
+                self._remove([entry_id])
+                self.expirations += 1
+                entry = None
+            if entry is None or sim < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry["answer"], sim, entry.get("distance")
+
+    def store(self, embedding, answer, distance=None):
+        if not self.max_size:
+            return
+        vec = self._normalize(embedding)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(vec, np.asarray([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "answer": answer,
+                "created": time.time(),
+                "distance": None if distance is None else float(distance),
+                "version": self.version,
+            }
+            self.stores += 1
+            self._dirty = True
+
+            overflow = len(self._entries) - self.max_size
+            if overflow > 0:
+                old = list(self._entries.keys())[:overflow]
+                self._remove(old)
+                self.evictions += overflow
+
+    def _drop_stale(self):
+        stale = [
+            k for k, v in self._entries.items()
+            if v.get("version") != self.version
+        ]
+        self._remove(stale)
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def set_version(self, version):
+        """Меняет версию базы знаний; ответы по прежней версии удаляются."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            if self._drop_stale():
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.index.reset()
+            self._entries.clear()
+
+    def _is_writer(self, path):
+        """Захватывает <path>.lock на всё время жизни процесса.
+
+        После fork блокировка родителя не наследуется как своя: каждый
+        процесс открывает файл заново.
+        """
+        if fcntl is None:
+            return True
+        pid = os.getpid()
+        if self._writer_pid == pid:
+            return self._writer_fd is not None
+        self._writer_pid = pid
+        self._writer_fd = None
+        fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._writer_fd = fd
+        return True
+
+    @staticmethod
+    def _write_atomic(path, write):
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(path) or ".",
+            prefix=os.path.basename(path) + ".", suffix=".tmp"
+        )
+        try:
+            os.close(fd)
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def save(self, path=None):
+        """Сохраняет кэш атомарно: <path>.index и <path>.json.
+
+        Возвращает True, если файлы записаны; False — нечего сохранять или
+        сохраняет другой процесс.
+        """
+        path = path or self.path
+        if not path or not self._dirty:
+            return False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            if not self._is_writer(path):
+                return False
+            meta = {
+                "dim": self.dim,
+                "next_id": self._next_id,
+                "entries": [[k, v] for k, v in self._entries.items()],
+            }
+
+            def write_meta(tmp):
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump(meta, fh, ensure_ascii=False)
+
+            self._write_atomic(
+                path + ".index", lambda tmp: faiss.write_index(self.index, tmp)
+            )
+            self._write_atomic(path + ".json", write_meta)
+            self._dirty = False
+        return True
+
+    def load(self, path=None):
+        path = path or self.path
+        if not path or not os.path.exists(path + ".json"):
+            return 0
+        with open(path + ".json", "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("dim") != self.dim or not os.path.exists(path + ".index"):
+            return 0
+
+        index = faiss.read_index(path + ".index")
+        entries = OrderedDict(
+            (int(k), v) for k, v in meta.get("entries", [])
+        )
+        # Индекс и JSON от разных сохранений — id не совпадут
+        if index.ntotal != len(entries):
+            return 0
+
+        with self._lock:
+            self.index = index
+            self._entries = entries
+            self._dirty = False
+            self._next_id = int(meta.get("next_id", 1))
+            now = time.time()
+            expired = [
+                k for k, v in self._entries.items()
+                if now - v["created"] > self.ttl
+            ]
+            self._remove(expired)
+            self.expirations += len(expired)
+            # База знаний могла измениться, пока сервер не работал
+            if self._drop_stale():
+                self._dirty = True
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,167 @@
+"""Запуск RAG API в нескольких процессах (gunicorn, только Linux/macOS).
+
+Модели, база знаний и FAISS индекс загружаются один раз в главном
+процессе, после чего gunicorn делает fork рабочих процессов. Веса и
+индекс только читаются, поэтому страницы памяти остаются общими
+(copy-on-write), а не копируются в каждый процесс. Документы, добавленные
+через /index, пишутся в общий журнал и подтягиваются каждым процессом.
+
+    python rag_serve.py --workers 4 --port 5000
+
+Каждый процесс обслуживает не больше --concurrency запросов /ask
+одновременно, ещё --queue ждут своей очереди; остальным сразу
+отвечаем 503 с Retry-After, чтобы клиент не висел минутами.
+"""
+import os
+import gc
+import argparse
+import threading
+
+from flask import request, jsonify, g
+
+import rag_server
+
+SPOOL_FILE = os.path.join(rag_server.DOCS_DIR, "_api.passages.jsonl")
+
+QUEUED_PATHS = ("/ask", "/index")
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1))
+
+
+def freeze_models():
+    """Переводит модели в режим только-чтения перед fork."""
+    try:
+        import torch
+    except ImportError:
+        return
+    for obj in (rag_server.embedder, getattr(rag_server.generator, "model", None)):
+        if isinstance(obj, torch.nn.Module):
+            obj.eval()
+            for param in obj.parameters():
+                param.requires_grad_(False)
+
+
+def install_admission(app, concurrency, queue, wait_timeout):
+    """Ограничивает число одновременных запросов в процессе.
+
+    Семафор создаётся заново в каждом процессе после fork.
+    """
+    state = {}
+
+    def slots():
+        pid = os.getpid()
+        if state.get("pid") != pid:
+            state["pid"] = pid
+            state["slots"] = threading.BoundedSemaphore(concurrency)
+            state["admitted"] = 0
+            state["lock"] = threading.Lock()
+        return state
+
+    @app.before_request
+    def admit():
+        if request.path not in QUEUED_PATHS:
+            return None
+        st = slots()
+        with st["lock"]:
+            if st["admitted"] >= queue + concurrency:
+                return busy()
+            st["admitted"] += 1
+        if not st["slots"].acquire(timeout=wait_timeout):
+            with st["lock"]:
+                st["admitted"] -= 1
+            return busy()
+        g.rag_slot = True
+        return None
+
+    @app.teardown_request
+    def release(exc):
+        if g.pop("rag_slot", False):
+            st = slots()
+            st["slots"].release()
+            with st["lock"]:
+                st["admitted"] -= 1
+
+    def busy():
+        resp = jsonify({'error': 'Сервер перегружен, повторите позже'})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(max(1, int(wait_timeout)))
+        return resp
+
+
+def serve(host, port, workers, concurrency, queue, wait_timeout, torch_threads):
+    from gunicorn.app.base import BaseApplication
+
+    class RagApplication(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    def post_fork(server, worker):
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "gthread",
+        # Потоки = выполняющиеся + ожидающие в очереди запросы
+        "threads": concurrency + queue,
+        # Очередь соединений ядра тоже ограничена
+        "backlog": max(64, workers * (concurrency + queue)),
+        "preload_app": True,
+        "timeout": 300,
+        "post_fork": post_fork,
+    }
+    RagApplication(rag_server.app, options).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RAG API (несколько процессов)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="одновременных запросов на процесс")
+    parser.add_argument("--queue", type=int, default=4,
+                        help="ожидающих запросов на процесс")
+    parser.add_argument("--wait-timeout", type=float, default=30.0,
+                        help="сколько секунд запрос может ждать в очереди")
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="потоков torch на процесс (0 — ядра / процессы)")
+    args = parser.parse_args(argv)
+
+    torch_threads = args.torch_threads or max(
+        1, (os.cpu_count() or 1) // args.workers
+    )
+
+    rag_server.init()
+    rag_server.enable_spool(SPOOL_FILE)
+    freeze_models()
+    install_admission(
+        rag_server.app, args.concurrency, args.queue, args.wait_timeout
+    )
+
+    # Всё, что загружено до fork, не должно трогаться сборщиком мусора,
+    # иначе он «пачкает» общие страницы памяти в каждом процессе
+    gc.collect()
+    gc.freeze()
+
+    serve(args.host, args.port, args.workers, args.concurrency, args.queue,
+          args.wait_timeout, torch_threads)
+
+
+if __name__ == "__main__":
+    main()
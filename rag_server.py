@@ -0,0 +1,637 @@
+"""RAG API сервер InfoDesk (Flask)."""
+import os
+import re
+import glob
+import json
+import difflib
+import time
+import atexit
+import hashlib
+import logging
+import threading
+
+import pandas as pd
+import faiss
+import nltk
+from nltk.corpus import stopwords
+import pymorphy3
+from flask import Flask, request, jsonify
+
+import rag_backends
+from metrics import REGISTRY, StageTimer
+from bm25 import BM25Index, reciprocal_rank_fusion
+from rag_cache import (
+    EmbeddingCache, SemanticCache, EMBEDDING_CACHE_SIZE,
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL
+)
+
+DATA_DIR = os.environ.get("INFODESK_DATA_DIR", "data")
+PREFERRED = "lx.xlsx"
+DOCS_DIR = os.environ.get("INFODESK_DOCS_DIR", "docs")
+
+# torch | onnx (см. rag_backends.py)
+INFERENCE_BACKEND = rag_backends.INFERENCE_BACKEND
+
+# Режим ответа:
+#   generate  — всегда генерировать (исходное поведение);
+#   retrieval — возвращать найденный текст без генерации;
+#   gated     — при уверенном совпадении (D <= HIGH_CONFIDENCE_DISTANCE)
+#               отдавать найденный текст, генерировать только в полосе
+#               HIGH_CONFIDENCE_DISTANCE < D <= DISTANCE_THRESHOLD.
+RESPONSE_MODE = os.environ.get("INFODESK_RESPONSE_MODE", "gated")
+HIGH_CONFIDENCE_DISTANCE = float(
+    os.environ.get("INFODESK_HIGH_CONFIDENCE_DISTANCE", "0.2")
+)
+DISTANCE_THRESHOLD = float(os.environ.get("INFODESK_DISTANCE_THRESHOLD", "0.5"))
+MAX_NEW_TOKENS = 200
+OPERATOR_ANSWER = "Перевожу на оператора"
+DOCS_CATEGORY = "документация"
+# Гибридный поиск: FAISS + BM25 со слиянием рангов (RRF)
+HYBRID_RETRIEVAL = os.environ.get("INFODESK_HYBRID_RETRIEVAL", "1") != "0"
+HYBRID_CANDIDATES = 10
+# Запись, найденная BM25 по большинству терминов запроса, считается
+# совпадением средней уверенности, даже если плотный поиск её не нашёл
+BM25_MIN_COVERAGE = float(os.environ.get("INFODESK_BM25_MIN_COVERAGE", "0.75"))
+EMBEDDING_CACHE_SIZE = int(
+    os.environ.get("INFODESK_EMBEDDING_CACHE_SIZE", EMBEDDING_CACHE_SIZE)
+)
+
+# Семантический кэш сгенерированных ответов (0 в размере — выключен)
+SEMANTIC_CACHE_SIZE = int(
+    os.environ.get("INFODESK_SEMANTIC_CACHE_SIZE", SEMANTIC_CACHE_SIZE)
+)
+SEMANTIC_CACHE_THRESHOLD = float(
+    os.environ.get("INFODESK_SEMANTIC_CACHE_THRESHOLD", SEMANTIC_CACHE_THRESHOLD)
+)
+SEMANTIC_CACHE_TTL = int(
+    os.environ.get("INFODESK_SEMANTIC_CACHE_TTL", SEMANTIC_CACHE_TTL)
+)
+SEMANTIC_CACHE_PATH = os.environ.get(
+    "INFODESK_SEMANTIC_CACHE_PATH", os.path.join("models", "semantic_cache")
+)
+# Сохранять кэш на диск после каждых N новых ответов
+SEMANTIC_CACHE_SAVE_EVERY = 20
+
+# Краткие названия с расшифровкой
+abbreviations = {
+    'лк': 'личный кабинет',
+    'БиР': 'Беременность и роды',
+    'зп': 'заработная плата',
+    'НДФЛ': 'Налог на доходы физических лиц',
+    'СТД': 'срочный трудовой договор',
+    'ТК': 'трудовой договор',
+    'АО': 'авансовый отчет',
+    'SLA': 'сроки',
+    'ЭЦП': 'электронная цифровая подпись',
+    'КР': 'кадровый резерв',
+}
+
+# Состояние сервера (заполняется в init())
+questions = []
+contents = []
+categories = []
+vocabulary = set()
+stop_words = set()
+morph = None
+embedder = None
+generator = None
+index = None
+bm25_index = BM25Index()
+
+# Защищает index/contents при добавлении документов во время работы
+index_lock = threading.Lock()
+_content_hashes = set()
+
+# Увеличивается при каждом изменении индекса (для кэша поиска)
+index_version = 0
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE)
+semantic_cache = None
+
+# Общий журнал /index для режима нескольких процессов (см. rag_serve.py):
+# каждый процесс дописывает в него фрагменты и подтягивает чужие
+INDEX_SPOOL = None
+_spool_offset = 0
+_spool_lock = threading.Lock()
+
+# Метрики (/metrics): этапы /ask и итог по способу ответа
+# (cached / retrieval / generated / operator)
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Длительность этапов обработки /ask", ("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_request_seconds", "Полное время обработки /ask", ("route",)
+)
+REQUEST_ERRORS = REGISTRY.counter(
+    "rag_request_errors_total", "Необработанные ошибки /ask"
+)
+
+# Структурный журнал задержек (JSON на строку) для офлайн-анализа
+TIMING_LOG = os.environ.get(
+    "INFODESK_TIMING_LOG", os.path.join("logs", "rag_timing.jsonl")
+)
+timing_logger = logging.getLogger("infodesk.rag.timing")
+logger = logging.getLogger("infodesk.rag")
+
+
+# ------------- NLP подготовка --------------
+def init_nlp():
+    global stop_words, morph
+    try:
+        _ = stopwords.words('russian')
+    except LookupError:
+        nltk.download('stopwords')
+
+    stop_words = set(stopwords.words('russian'))
+    morph = pymorphy3.MorphAnalyzer()
+
+
+def collect_vocabulary(texts):
+    vocab = set()
+    for text in texts:
+        for word in re.findall(r'\b\w+\b', str(text).lower()):
+            parsed = morph.parse(word)[0]
+            vocab.add(parsed.normal_form)
+    return vocab
+
+
+def preprocess_text(text: str) -> str:
+    text = str(text).lower()
+    for abbr, desc in abbreviations.items():
+        text = re.sub(r'\b' + re.escape(abbr) + r'\b', desc, text, flags=re.IGNORECASE)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    corrected = []
+    for word in text.split():
+        if word not in vocabulary:
+            match = difflib.get_close_matches(word, vocabulary, n=1, cutoff=0.8)
+            if match:
+                word = match[0]
+        normal = morph.parse(word)[0].normal_form
+        if normal not in stop_words:
+            corrected.append(normal)
+    # Порядок set() зависит от процесса; отсортированные леммы дают
+    # одинаковую строку, а значит, и ключ кэша эмбеддингов
+    return ' '.join(sorted(set(corrected)))
+
+
+def lemmatize_text(text: str) -> str:
+    """Облегчённый preprocess_text без исправления опечаток (для BM25 по текстам)."""
+    text = str(text).lower()
+    for abbr, desc in abbreviations.items():
+        text = re.sub(r'\b' + re.escape(abbr) + r'\b', desc, text, flags=re.IGNORECASE)
+    lemmas = []
+    for word in re.findall(r'\w+', text):
+        normal = morph.parse(word)[0].normal_form
+        if normal not in stop_words:
+            lemmas.append(normal)
+    return ' '.join(lemmas)
+
+
+def _content_hash(text):
+    norm = re.sub(r'\s+', ' ', str(text)).strip().lower()
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+
+def kb_version():
+    """Версия содержимого базы знаний для семантического кэша.
+
+    Одинакова у всех процессов и между перезапусками, пока в индексе те
+    же записи.
+    """
+    return hashlib.sha1(
+        "\n".join(sorted(_content_hashes)).encode("ascii")
+    ).hexdigest()
+
+
+# ------------- Загрузка данных --------------
+def load_knowledge_base(data_dir=DATA_DIR):
+    global questions, contents, categories, vocabulary
+
+    xlsx_path = os.path.join(data_dir, PREFERRED)
+    if not os.path.isfile(xlsx_path):
+        cands = sorted(glob.glob(os.path.join(data_dir, '*.xlsx')))
+        if not cands:
+            raise Exception("Файл не найден")
+        xlsx_path = cands[0]
+
+    df = pd.read_excel(xlsx_path)
+    questions = df['question'].fillna('').tolist()
+    contents = df['content'].fillna('').tolist()
+    categories = df['category'].fillna('прочее').tolist()
+
+    vocabulary = collect_vocabulary(questions + contents)
+    _content_hashes.clear()
+    _content_hashes.update(_content_hash(c) for c in contents)
+
+
+def load_models(backend=None):
+    global embedder, generator
+    embedder, generator = rag_backends.load_models(backend or INFERENCE_BACKEND)
+
+
+def build_index():
+    global index, bm25_index, index_version
+    processed_questions = [preprocess_text(q) for q in questions]
+    embeddings = embedder.encode(processed_questions, convert_to_numpy=True)
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+
+    # Номера документов BM25 совпадают с номерами в FAISS
+    bm25_index = BM25Index()
+    bm25_index.add(
+        pq + ' ' + lemmatize_text(c)
+        for pq, c in zip(processed_questions, contents)
+    )
+    index_version += 1
+
+
+def add_passages(passages):
+    """Добавляет фрагменты документов в индекс. Возвращает число новых.
+
+    Фрагмент — {"text": ...}; если указан "question" (ответ оператора),
+    в индекс попадает эмбеддинг вопроса, как у записей базы знаний.
+    """
+    global index_version
+    fresh = []
+    with index_lock:
+        for p in passages:
+            text = str(p.get("text", "")).strip()
+            if not text:
+                continue
+            question = str(p.get("question") or "").strip()
+            h = _content_hash(question + "\n" + text if question else text)
+            if h in _content_hashes:
+                continue
+            _content_hashes.add(h)
+            fresh.append((p, question, text))
+
+        if not fresh:
+            return 0
+
+        processed = [preprocess_text(q or t) for _, q, t in fresh]
+        emb = embedder.encode(processed, convert_to_numpy=True)
+        index.add(emb)
+        bm25_index.add(
+            (pq + ' ' if q else '') + lemmatize_text(t)
+            for pq, (_, q, t) in zip(processed, fresh)
+        )
+        index_version += 1
+
+        for p, question, text in fresh:
+            questions.append(question or p.get("title") or text[:120])
+            contents.append(text)
+            categories.append(p.get("category") or DOCS_CATEGORY)
+
+        # Закэшированные ответы сгенерированы без новых записей
+        if semantic_cache is not None:
+            semantic_cache.set_version(kb_version())
+
+    return len(fresh)
+
+
+def load_documents(docs_dir=DOCS_DIR):
+    """Подгружает фрагменты, сохранённые клиентом в docs/*.passages.jsonl."""
+    added = 0
+    for path in sorted(glob.glob(os.path.join(docs_dir, "*.passages.jsonl"))):
+        batch = []
+        with open(path, "r", encoding="utf-8") as fh:
+            for ln in fh:
+                ln = ln.strip()
+                if not ln:
+                    continue
+                try:
+                    batch.append(json.loads(ln))
+                except ValueError:
+                    continue
+                if len(batch) >= 256:
+                    added += add_passages(batch)
+                    batch = []
+        if batch:
+            added += add_passages(batch)
+    return added
+
+
+def spool_passages(passages):
+    """Дописывает фрагменты в общий журнал одной операцией записи."""
+    data = "".join(json.dumps(p, ensure_ascii=False) + "\n" for p in passages)
+    fd = os.open(INDEX_SPOOL, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def sync_spool():
+    """Добавляет в индекс фрагменты, записанные в журнал другими процессами."""
+    global _spool_offset
+    if not INDEX_SPOOL:
+        return 0
+
+    with _spool_lock:
+        try:
+            size = os.path.getsize(INDEX_SPOOL)
+        except OSError:
+            return 0
+        if size <= _spool_offset:
+            return 0
+
+        batch = []
+        with open(INDEX_SPOOL, "rb") as fh:
+            fh.seek(_spool_offset)
+            for raw in fh:
+                if not raw.endswith(b"\n"):
+                    break  # запись ещё не дописана
+                _spool_offset += len(raw)
+                try:
+                    batch.append(json.loads(raw))
+                except ValueError:
+                    continue
+        return add_passages(batch) if batch else 0
+
+
+def enable_spool(path):
+    """Включает общий журнал; уже загруженная его часть пропускается."""
+    global INDEX_SPOOL, _spool_offset
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    INDEX_SPOOL = path
+    _spool_offset = os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def init_semantic_cache():
+    global semantic_cache
+    semantic_cache = SemanticCache(
+        index.d,
+        max_size=SEMANTIC_CACHE_SIZE,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        ttl=SEMANTIC_CACHE_TTL,
+        path=SEMANTIC_CACHE_PATH
+    )
+    semantic_cache.version = kb_version()
+    if SEMANTIC_CACHE_SIZE:
+        semantic_cache.load()
+        atexit.register(save_semantic_cache)
+
+
+def save_semantic_cache():
+    """Сохраняет семантический кэш; ошибка записи не должна ронять /ask."""
+    try:
+        semantic_cache.save()
+    except Exception:
+        logger.warning("Не удалось сохранить семантический кэш", exc_info=True)
+
+
+def init(data_dir=DATA_DIR, docs_dir=DOCS_DIR):
+    init_nlp()
+    load_knowledge_base(data_dir)
+    load_models()
+    build_index()
+    if os.path.isdir(docs_dir):
+        load_documents(docs_dir)
+    init_semantic_cache()
+    init_metrics()
+    print('RAG готов к работе!')
+
+
+# ------------- Поиск --------------
+def embed_query(proc_q):
+    """Эмбеддинг обработанного запроса; популярные берутся из кэша."""
+    emb = embedding_cache.get_embedding(proc_q)
+    if emb is None:
+        emb = embedder.encode([proc_q], convert_to_numpy=True)
+        embedding_cache.put_embedding(proc_q, emb)
+    return emb
+
+
+def search(proc_q, k=1):
+    """Возвращает (D, I) ближайших k записей для обработанного запроса."""
+    q_emb = embed_query(proc_q)
+    with index_lock:
+        cached = embedding_cache.get_search(proc_q, k, index_version)
+        if cached is not None:
+            return cached
+        D, I = index.search(q_emb, k)
+        embedding_cache.put_search(proc_q, k, index_version, D, I)
+    return D, I
+
+
+def retrieve(proc_q, k=1):
+    """Лучшие k записей: [(номер, расстояние)].
+
+    Уверенное совпадение плотного поиска возвращается сразу. Иначе
+    результаты FAISS и BM25 сливаются через RRF; записи, найденной BM25
+    по большей части терминов запроса, назначается расстояние не больше
+    DISTANCE_THRESHOLD, чтобы вопрос из сокращений не уходил оператору.
+    """
+    n_cand = max(k, HYBRID_CANDIDATES) if HYBRID_RETRIEVAL else k
+    D, I = search(proc_q, n_cand)
+    dense = [(int(i), float(d)) for d, i in zip(D[0], I[0]) if i >= 0]
+
+    if (not HYBRID_RETRIEVAL or not dense
+            or dense[0][1] <= HIGH_CONFIDENCE_DISTANCE):
+        return dense[:k]
+
+    sparse, coverage = bm25_index.search(proc_q, n_cand)
+    dense_dist = dict(dense)
+    fused = reciprocal_rank_fusion(
+        [[doc for doc, _ in dense], [doc for doc, _ in sparse]], limit=k
+    )
+
+    result = []
+    for doc_id, _ in fused:
+        distance = dense_dist.get(doc_id, float("inf"))
+        if sparse and doc_id == sparse[0][0] and coverage >= BM25_MIN_COVERAGE:
+            distance = min(distance, DISTANCE_THRESHOLD)
+        result.append((doc_id, distance))
+    return result
+
+
+def choose_route(distance, mode=None):
+    """Как отвечать при данном расстоянии до ближайшей записи."""
+    mode = mode or RESPONSE_MODE
+    if distance > DISTANCE_THRESHOLD:
+        # В режиме generate сохраняем прежнее поведение
+        return "generated" if mode == "generate" else "operator"
+    if mode == "retrieval":
+        return "retrieval"
+    if mode == "gated" and distance <= HIGH_CONFIDENCE_DISTANCE:
+        return "retrieval"
+    return "generated"
+
+
+def record_request(timer, route, question_len):
+    total_ms = timer.total_ms()
+    REQUEST_SECONDS.observe(total_ms / 1000, route=route)
+    if timing_logger.handlers:
+        timing_logger.info(json.dumps({
+            "ts": round(time.time(), 3),
+            "pid": os.getpid(),
+            "route": route,
+            "question_len": question_len,
+            "total_ms": round(total_ms, 3),
+            "stages": timer.as_dict(),
+        }, ensure_ascii=False))
+    return total_ms
+
+
+def route_stats():
+    return {
+        key[0]: {
+            "count": st["count"],
+            "avg_ms": round(st["avg"] * 1000, 2),
+            "p50_ms": round(st["p50"] * 1000, 2),
+            "p95_ms": round(st["p95"] * 1000, 2),
+            "max_ms": round(st["max"] * 1000, 2),
+        }
+        for key, st in REQUEST_SECONDS.summary().items()
+    }
+
+
+def init_metrics():
+    REGISTRY.gauge(
+        "rag_index_entries", "Записей в индексе", lambda: len(contents)
+    )
+    REGISTRY.gauge(
+        "rag_cache_hits", "Попадания в кэши", lambda: {
+            "embedding": embedding_cache.hits,
+            "semantic": semantic_cache.hits if semantic_cache else 0,
+        }, ("cache",)
+    )
+    REGISTRY.gauge(
+        "rag_cache_misses", "Промахи кэшей", lambda: {
+            "embedding": embedding_cache.misses,
+            "semantic": semantic_cache.misses if semantic_cache else 0,
+        }, ("cache",)
+    )
+
+    if TIMING_LOG and not timing_logger.handlers:
+        os.makedirs(os.path.dirname(TIMING_LOG) or ".", exist_ok=True)
+        handler = logging.FileHandler(TIMING_LOG, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        timing_logger.addHandler(handler)
+        timing_logger.setLevel(logging.INFO)
+        timing_logger.propagate = False
+
+
+# ------------- Flask API --------------
+app = Flask(__name__)
+
+
+@app.route('/ask', methods=['POST'])
+def ask():
+    timer = StageTimer(STAGE_SECONDS)
+    data = request.json or {}
+    question = data.get('question', '')
+    want_timing = bool(data.get('timing')) or request.args.get('timing') == '1'
+
+    try:
+        with timer.stage("sync"):
+            sync_spool()
+
+        with timer.stage("preprocess"):
+            proc_q = preprocess_text(question)
+
+        with timer.stage("embed"):
+            q_emb = embed_query(proc_q)
+
+        result = None
+
+        # Перефразировка уже заданного вопроса: ответ из семантического кэша
+        if semantic_cache is not None:
+            with timer.stage("semantic_cache"):
+                cached = semantic_cache.lookup(q_emb)
+            if cached is not None:
+                answer, similarity, distance = cached
+                route = "cached"
+                result = {
+                    'answer': answer,
+                    'route': route,
+                    'similarity': similarity,
+                    'distance': distance,
+                }
+
+        if result is None:
+            # Поиск ближайшего документа
+            with timer.stage("search"):
+                doc_id, distance = retrieve(proc_q, k=1)[0]
+            route = choose_route(distance)
+
+            if route == "operator":
+                answer = OPERATOR_ANSWER
+            elif route == "retrieval":
+                # Уверенное совпадение: найденный текст и есть ответ
+                answer = contents[doc_id]
+            else:
+                context = contents[doc_id]
+                if distance > DISTANCE_THRESHOLD:
+                    context = OPERATOR_ANSWER
+                with timer.stage("generate"):
+                    answer = generator(context, max_new_tokens=MAX_NEW_TOKENS)[0]['generated_text']
+                if semantic_cache is not None and distance <= DISTANCE_THRESHOLD:
+                    semantic_cache.store(q_emb, answer, distance)
+                    if semantic_cache.stores % SEMANTIC_CACHE_SAVE_EVERY == 0:
+                        save_semantic_cache()
+
+            result = {
+                'answer': answer,
+                'route': route,
+                'distance': distance if distance != float("inf") else None,
+            }
+    except Exception:
+        REQUEST_ERRORS.inc()
+        raise
+
+    total_ms = record_request(timer, route, len(question))
+    if want_timing:
+        result['timing'] = dict(timer.as_dict(), total=round(total_ms, 3))
+    return jsonify(result)
+
+
+@app.route('/index', methods=['POST'])
+def index_passages():
+    data = request.json or {}
+    passages = data.get('passages') or []
+    if not isinstance(passages, list):
+        return jsonify({'error': 'passages должен быть списком'}), 400
+    passages = [p for p in passages if isinstance(p, dict)]
+
+    if INDEX_SPOOL:
+        spool_passages(passages)
+        added = sync_spool()
+    else:
+        added = add_passages(passages)
+    return jsonify({'added': added, 'total': len(contents)})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return REGISTRY.render(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+    }
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok', 'entries': len(contents), 'pid': os.getpid()})
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = {'embedding': embedding_cache.stats()}
+    if semantic_cache is not None:
+        stats['semantic'] = semantic_cache.stats()
+    return jsonify(stats)
+
+
+@app.route('/stats/routes', methods=['GET'])
+def routes_stats():
+    return jsonify({
+        'mode': RESPONSE_MODE,
+        'high_confidence_distance': HIGH_CONFIDENCE_DISTANCE,
+        'distance_threshold': DISTANCE_THRESHOLD,
+        'routes': route_stats(),
+    })
+
+
+if __name__ == "__main__":
+    init()
+    app.run(port=5000)
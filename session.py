@@ -0,0 +1,67 @@
+"""Сессия вошедшего пользователя с кэшем записи из таблицы users."""
+from database import check_password, get_user, update_user_theme
+
+
+class UserSession:
+    """Создаётся при входе; роль, имя и тема читаются из кэша, а не из базы.
+
+    Изменения, сделанные через сессию (set_theme), сразу попадают и в базу,
+    и в кэш. После изменений в обход сессии (например, в ProfileDialog)
+    нужно вызвать invalidate() — запись перечитается при следующем
+    обращении.
+    """
+
+    def __init__(self, login, user=None):
+        self.login = login
+        self._user = self._strip(user) if user is not None else None
+
+    @staticmethod
+    def _strip(user):
+        # Пароль в памяти сессии не держим
+        return {k: v for k, v in user.items() if k != "password"}
+
+    @classmethod
+    def login_with_password(cls, login, password):
+        """Сессия для login, если пароль верен, иначе None."""
+        user = check_password(login, password)
+        if user is None:
+            return None
+        return cls(login, user)
+
+    @property
+    def user(self):
+        if self._user is None:
+            self.refresh()
+        return self._user
+
+    def refresh(self):
+        user = get_user(self.login)
+        self._user = self._strip(user) if user else {"login": self.login}
+        return self._user
+
+    def invalidate(self):
+        self._user = None
+
+    @property
+    def role(self):
+        return self.user.get("role", "user")
+
+    @property
+    def name(self):
+        return self.user.get("name", self.login)
+
+    @property
+    def theme(self):
+        return self.user.get("theme", "light")
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    @property
+    def is_operator(self):
+        return self.role == "operator"
+
+    def set_theme(self, theme):
+        update_user_theme(self.login, theme)
+        self.user["theme"] = theme
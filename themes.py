@@ -1,11 +1,23 @@
 import json
+import hashlib
 from PyQt6.QtWidgets import (
-    QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, QRadioButton,
-    QLabel, QPushButton, QColorDialog
+    QApplication, QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, QRadioButton,
+    QLabel, QPushButton, QColorDialog, QFrame, QLineEdit, QMenuBar
 )
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QColor
 
+# Цвета кастомной темы по умолчанию
+DEFAULT_CUSTOM_COLORS = {
+    "bg": "#f5f5f5",
+    "text": "#333333",
+    "input_bg": "#ffffff",
+    "input_border": "#e0e0e0",
+    "button": "#4CAF50",
+    "button_text": "white",
+    "menubar": "#eeeeee"
+}
+
 
 def get_light_theme():
     return """
@@ -107,12 +119,109 @@ def get_custom_theme(bg_color, text_color, input_bg_color, input_border_color,
     """
 
 
+def parse_custom_colors(theme):
+    """Цвета из JSON кастомной темы или None, если это не кастомная тема."""
+    if theme in ("light", "dark"):
+        return None
+    try:
+        theme_data = json.loads(theme)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if isinstance(theme_data, dict) and theme_data.get("type") == "custom":
+        return theme_data.get("colors", {})
+    return None
+
+
+def custom_theme_from_colors(colors):
+    c = dict(DEFAULT_CUSTOM_COLORS, **(colors or {}))
+    return get_custom_theme(
+        c["bg"], c["text"], c["input_bg"], c["input_border"],
+        c["button"], c["button_text"], c["menubar"]
+    )
+
+
+class ThemeEngine:
+    """Кэш готовых таблиц стилей и применение темы ко всему приложению.
+
+    Ключ кэша — хэш канонической записи темы (light, dark или JSON с
+    цветами, отсортированный по ключам), поэтому одинаковые палитры не
+    пересобираются. Стиль ставится на QApplication и только если он
+    отличается от уже применённого: повторный setStyleSheet заставляет
+    Qt заново полировать все виджеты.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._applied = None
+
+    @staticmethod
+    def theme_key(theme):
+        colors = parse_custom_colors(theme)
+        if colors is None:
+            canonical = theme if theme == "dark" else "light"
+        else:
+            canonical = json.dumps(
+                dict(DEFAULT_CUSTOM_COLORS, **colors), sort_keys=True
+            )
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def stylesheet(self, theme):
+        key = self.theme_key(theme)
+        qss = self._cache.get(key)
+        if qss is None:
+            colors = parse_custom_colors(theme)
+            if colors is not None:
+                qss = custom_theme_from_colors(colors)
+            elif theme == "dark":
+                qss = get_dark_theme()
+            else:
+                # Неизвестное значение (старая тема) — светлая
+                qss = get_light_theme()
+            self._cache[key] = qss
+        return qss
+
+    def apply(self, theme, app=None):
+        """Ставит тему на приложение. True, если стиль действительно сменился."""
+        app = app or QApplication.instance()
+        key = self.theme_key(theme)
+        if app is None or key == self._applied:
+            return False
+        app.setStyleSheet(self.stylesheet(theme))
+        self._applied = key
+        return True
+
+
+class ThemePreview(QFrame):
+    """Небольшой образец интерфейса, стиль которого меняется отдельно от окна."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(8, 8, 8, 8)
+        menu_bar = QMenuBar()
+        menu_bar.setNativeMenuBar(False)
+        menu_bar.addMenu("Файл")
+        menu_bar.addMenu("Справка")
+        layout.addWidget(menu_bar)
+        layout.addWidget(QLabel("Так будет выглядеть интерфейс"))
+        edit = QLineEdit()
+        edit.setPlaceholderText("Поле ввода")
+        layout.addWidget(edit)
+        layout.addWidget(QPushButton("Кнопка"))
+
+    def show_theme(self, stylesheet):
+        # Перерисовывается только этот фрейм, а не всё дерево окна
+        self.setStyleSheet(stylesheet)
+
+
 class ThemeDialog(QDialog):
-    def __init__(self, parent, current_theme, update_user_theme_callback, apply_theme_callback):
+    def __init__(self, parent, current_theme, update_user_theme_callback, apply_theme_callback,
+                 engine=None):
         super().__init__(parent)
         self.current_theme = current_theme
         self.update_user_theme = update_user_theme_callback
         self.apply_theme = apply_theme_callback
+        self.engine = engine or ThemeEngine()
         self.current_user = None
         self._build_ui()
     
@@ -211,31 +320,12 @@ class ThemeDialog(QDialog):
         palette_layout.setSpacing(8)
         palette_layout.setContentsMargins(12, 12, 12, 12)
         
-        # Загружаем сохраненные цвета кастомной темы, если есть
-        saved_colors = {}
-        if self.current_theme not in ("light", "dark"):
-            try:
-                theme_data = json.loads(self.current_theme)
-                if isinstance(theme_data, dict) and theme_data.get("type") == "custom":
-                    saved_colors = theme_data.get("colors", {})
-            except (json.JSONDecodeError, TypeError):
-                pass
-        
-        # Цвета по умолчанию
-        default_colors = {
-            "bg": "#f5f5f5",
-            "text": "#333333",
-            "input_bg": "#ffffff",
-            "input_border": "#e0e0e0",
-            "button": "#4CAF50",
-            "button_text": "white",
-            "menubar": "#eeeeee"
-        }
-        
-        # Объединяем сохраненные и дефолтные
-        for key in default_colors:
+        # Загружаем сохраненные цвета кастомной темы, если есть,
+        # и дополняем их цветами по умолчанию
+        saved_colors = dict(parse_custom_colors(self.current_theme) or {})
+        for key in DEFAULT_CUSTOM_COLORS:
             if key not in saved_colors:
-                saved_colors[key] = default_colors[key]
+                saved_colors[key] = DEFAULT_CUSTOM_COLORS[key]
         
         self.saved_colors = saved_colors
         self.color_buttons = {}
@@ -314,6 +404,7 @@ class ThemeDialog(QDialog):
                         }}
                         """
                         self.color_buttons[color_key].setStyleSheet(new_style)
+                        self.update_preview()
                 return choose_color
             
             color_btn.clicked.connect(make_color_handler(key))
@@ -322,9 +413,14 @@ class ThemeDialog(QDialog):
         
         layout.addWidget(self.palette_group)
         
+        # Предпросмотр выбранной темы
+        self.preview = ThemePreview()
+        layout.addWidget(self.preview)
+        
         # Функция для показа/скрытия палитры
         def update_palette_visibility():
             self.palette_group.setVisible(self.custom_radio.isChecked())
+            self.update_preview()
             # Подстраиваем размер окна после изменения видимости
             self.adjustSize()
         
@@ -380,18 +476,7 @@ class ThemeDialog(QDialog):
         """)
         
         def apply_theme():
-            if self.light_radio.isChecked():
-                self.update_user_theme(self.current_user, "light")
-            elif self.dark_radio.isChecked():
-                self.update_user_theme(self.current_user, "dark")
-            else:
-                # Сохраняем кастомную тему как JSON
-                theme_json = json.dumps({
-                    "type": "custom",
-                    "colors": self.saved_colors
-                })
-                self.update_user_theme(self.current_user, theme_json)
-            
+            self.update_user_theme(self.current_user, self.selected_theme())
             self.apply_theme()
             self.accept()
         
@@ -406,4 +491,17 @@ class ThemeDialog(QDialog):
         self.adjustSize()
         # Устанавливаем минимальный размер, чтобы не было пустого пространства
         self.setMinimumSize(self.size())
-
+    
+    def selected_theme(self):
+        if self.light_radio.isChecked():
+            return "light"
+        if self.dark_radio.isChecked():
+            return "dark"
+        # Кастомная тема хранится как JSON
+        return json.dumps({
+            "type": "custom",
+            "colors": self.saved_colors
+        })
+    
+    def update_preview(self):
+        self.preview.show_theme(self.engine.stylesheet(self.selected_theme()))
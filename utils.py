@@ -1,7 +1,9 @@
 import os
-import tempfile
-import matplotlib.pyplot as plt
-from database import db_connect
+import csv
+import json
+
+QUESTION_KEYS = ("question", "вопрос", "q")
+ANSWER_KEYS = ("answer", "ответ", "a")
 
 
 def parse_faq_file(path):
@@ -28,33 +30,70 @@ def parse_faq_file(path):
     return items
 
 
-def build_and_save_stats_chart(save_path=None):
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("SELECT status, COUNT(1) FROM questions GROUP BY status")
-    rows = cur.fetchall()
-    conn.close()
-    
-    if not rows:
-        statuses = ["pending", "answered"]
-        counts = [0, 0]
-    else:
-        statuses = [r[0] for r in rows]
-        counts = [r[1] for r in rows]
-    
-    plt.figure(figsize=(6, 4))
-    plt.bar(statuses, counts)
-    plt.title("Статус вопросов")
-    plt.xlabel("Статус")
-    plt.ylabel("Количество")
-    plt.tight_layout()
-    
-    if not save_path:
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        save_path = tmp.name
-        tmp.close()
-    
-    plt.savefig(save_path)
-    plt.close()
-    return save_path
+def _pick(record, keys):
+    for key in keys:
+        for field, value in record.items():
+            if field and field.strip().lower() == key:
+                return value
+    return None
+
+
+def parse_questions_file(path):
+    """Вопросы (и необязательные ответы) из TXT, CSV или JSONL.
+
+    TXT разбирается как parse_faq_file. В CSV и JSONL вопрос берётся из
+    поля question/вопрос, ответ — из answer/ответ; CSV без заголовка
+    читается по колонкам: вопрос;ответ.
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".jsonl":
+        items = []
+        with open(path, "r", encoding="utf-8") as f:
+            for n, ln in enumerate(f, 1):
+                ln = ln.strip()
+                if not ln:
+                    continue
+                try:
+                    record = json.loads(ln)
+                except ValueError as e:
+                    raise ValueError(f"строка {n}: {e}") from None
+                if isinstance(record, str):
+                    items.append((record.strip(), None))
+                    continue
+                q = _pick(record, QUESTION_KEYS)
+                a = _pick(record, ANSWER_KEYS)
+                if q and str(q).strip():
+                    items.append((str(q).strip(), str(a).strip() if a else None))
+        return items
+
+    if ext == ".csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;|\t")
+            except csv.Error:
+                dialect = csv.excel
+            rows = list(csv.reader(f, dialect))
+        if not rows:
+            return []
+
+        header = [h.strip().lower() for h in rows[0]]
+        q_col = next((header.index(k) for k in QUESTION_KEYS if k in header), None)
+        a_col = next((header.index(k) for k in ANSWER_KEYS if k in header), None)
+        if q_col is None:
+            q_col, a_col = 0, 1
+        else:
+            rows = rows[1:]
+
+        items = []
+        for row in rows:
+            if len(row) <= q_col or not row[q_col].strip():
+                continue
+            a = row[a_col].strip() if a_col is not None and len(row) > a_col else ""
+            items.append((row[q_col].strip(), a or None))
+        return items
+
+    return parse_faq_file(path)
 
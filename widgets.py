@@ -1,26 +1,28 @@
-import re
-
+import requests
 from PyQt6.QtWidgets import (
     QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout,
     QListWidget, QTextEdit, QMessageBox, QComboBox, QFormLayout, QDialog,
-    QInputDialog, QTableWidget, QTableWidgetItem
+    QInputDialog, QTableWidget, QTableWidgetItem, QCheckBox, QSpinBox,
+    QFileDialog
 )
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 
 from database import (
-    get_user, list_users, create_user, delete_user_db, update_user_name,
-    update_user_password, list_pending_questions, get_question_by_id,
-    set_answer, add_question, list_user_questions_all
+    get_user, check_password, list_users, create_user, delete_user_db,
+    update_user_name, update_user_password, list_pending_questions,
+    get_question_by_id, set_answer, add_question, list_user_questions_all
 )
-from rag import RequestThread
+from rag import RagApiError, ask_question, clean_text, is_failed_answer
+import database
+import instrumentation
 
 
 class ProfileDialog(QDialog):
-    def __init__(self, username, parent=None):
+    def __init__(self, username, parent=None, user=None):
         super().__init__(parent)
         self.setWindowTitle(f"Профиль — {username}")
         self.username = username
-        self.user = get_user(username) or {"name": username}
+        self.user = user or get_user(username) or {"name": username}
         self.init_ui()
     
     def init_ui(self):
@@ -52,8 +54,7 @@ class ProfileDialog(QDialog):
         if not ok1:
             return
         
-        fresh = get_user(self.username)
-        if not fresh or cur != fresh.get("password", ""):
+        if check_password(self.username, cur) is None:
             QMessageBox.warning(self, "Ошибка", "Текущий пароль неверен.")
             return
         
@@ -215,6 +216,12 @@ class OperatorWidget(QWidget):
         self.answer_edit.setPlaceholderText("Ответ...")
         layout.addWidget(self.answer_edit)
         
+        # Одобренные ответы выгружаются в базу знаний RAG (см. kb_sync.py).
+        # Одобрение — явное действие: флажок снимается после каждого ответа
+        self.kb_check = QCheckBox("Добавить ответ в базу знаний RAG")
+        self.kb_check.setChecked(False)
+        layout.addWidget(self.kb_check)
+        
         btns = QHBoxLayout()
         answer_btn = QPushButton("Отправить ответ")
         answer_btn.clicked.connect(self.send_answer)
@@ -227,10 +234,20 @@ class OperatorWidget(QWidget):
         self.pending_list.currentItemChanged.connect(self.show_selected_question)
         self.setLayout(layout)
         
-        # Автообновление каждые 5 секунд
+        # Автообновление каждые 5 секунд; при работе через сервер базы
+        # список обновляется по его событиям, а таймер лишь подстраховывает
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.refresh_pending)
-        self.timer.start(5000)
+        if database.BACKEND_URL:
+            import backend_client
+            backend_client.listener().changed.connect(self.on_backend_changed)
+            self.timer.start(60000)
+        else:
+            self.timer.start(5000)
+    
+    def on_backend_changed(self, events):
+        if any(e["topic"] in ("questions", "*") for e in events):
+            self.refresh_pending()
     
     def refresh_pending(self):
         current_selection = self.pending_list.currentItem()
@@ -278,14 +295,37 @@ class OperatorWidget(QWidget):
                 QMessageBox.warning(self, "Ошибка", "Введите ответ.")
                 return
             
-            set_answer(qid, ans, self.username)
+            set_answer(
+                qid, ans, self.username,
+                kb_approved=self.kb_check.isChecked()
+            )
             QMessageBox.information(self, "Готово", "Ответ отправлен.")
             self.answer_edit.clear()
+            self.kb_check.setChecked(False)
             self.refresh_pending()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось отправить ответ: {e}")
 
 
+class RequestThread(QThread):
+    
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+    
+    def __init__(self, api_url, question):
+        super().__init__()
+        self.api_url = api_url
+        self.question = question
+    
+    def run(self):
+        try:
+            self.finished.emit(ask_question(self.api_url, self.question))
+        except RagApiError as e:
+            self.error.emit(str(e))
+        except requests.exceptions.RequestException as e:
+            self.error.emit(f"Ошибка соединения с API:\n{e}")
+
+
 class RAGClientWidget(QWidget):
     def __init__(self, api_url, username=None):
         super().__init__()
@@ -315,13 +355,6 @@ class RAGClientWidget(QWidget):
         
         self.setLayout(layout)
     
-    def clean_text(self, text):
-        if not text: return ""
-        return re.sub(
-            r'\s+', ' ',
-            text.replace('&nbsp;', ' ')
-        ).strip()
-    
     def send_question(self):
         question = self.input_box.toPlainText().strip()
         if not question:
@@ -342,14 +375,9 @@ class RAGClientWidget(QWidget):
     
     def on_finished(self, answer, original_question):
         self.btn_send.setEnabled(True)
-        cleaned_answer = self.clean_text(answer or "")
-        
-        # Маркеры, означающие, что RAG не нашел информацию
-        fail_markers = ["не знаю", "не найден", "не могу ответить", "перевожу на оператора", "обратитесь к специалисту"]
-        
-        is_failed = not cleaned_answer or any(marker in cleaned_answer.lower() for marker in fail_markers)
+        cleaned_answer = clean_text(answer or "")
 
-        if is_failed:
+        if is_failed_answer(cleaned_answer):
             # Убрано "[Система]: К сожалению..." и "Перевожу на оператора"
             self.output_box.setText("Ваш запрос передан оператору.")
             if self.username:
@@ -428,3 +456,188 @@ class UserWidget(QWidget):
         
         dlg.resize(800, 400)
         dlg.exec()
+
+
+class PerformanceDialog(QDialog):
+    """Замеры обращений к БД и RAG API и журнал медленных операций."""
+    
+    COLUMNS = [
+        ("op", "Операция"), ("count", "Вызовов"), ("errors", "Ошибок"),
+        ("avg_ms", "Среднее, мс"), ("p50_ms", "p50, мс"),
+        ("p95_ms", "p95, мс"), ("p99_ms", "p99, мс"), ("max_ms", "Макс., мс"),
+    ]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Производительность клиента")
+        self.init_ui()
+        self.refresh()
+    
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        
+        threshold_row = QHBoxLayout()
+        threshold_row.addWidget(QLabel("Порог медленной операции, мс:"))
+        self.threshold = QSpinBox()
+        self.threshold.setRange(1, 600000)
+        self.threshold.setValue(int(instrumentation.SLOW_OP_THRESHOLD_MS))
+        self.threshold.valueChanged.connect(instrumentation.set_slow_threshold)
+        threshold_row.addWidget(self.threshold)
+        threshold_row.addStretch(1)
+        layout.addLayout(threshold_row)
+        
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels([c[1] for c in self.COLUMNS])
+        layout.addWidget(self.table)
+        
+        layout.addWidget(QLabel("Медленные операции:"))
+        self.slow_box = QTextEdit()
+        self.slow_box.setReadOnly(True)
+        layout.addWidget(self.slow_box)
+        
+        btns = QHBoxLayout()
+        refresh_btn = QPushButton("Обновить")
+        refresh_btn.clicked.connect(self.refresh)
+        json_btn = QPushButton("Экспорт JSON...")
+        json_btn.clicked.connect(lambda: self.export("json"))
+        csv_btn = QPushButton("Экспорт CSV...")
+        csv_btn.clicked.connect(lambda: self.export("csv"))
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        for b in (refresh_btn, json_btn, csv_btn, close_btn):
+            btns.addWidget(b)
+        layout.addLayout(btns)
+        
+        self.resize(900, 560)
+    
+    def refresh(self):
+        rows = instrumentation.snapshot()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, (key, _) in enumerate(self.COLUMNS):
+                self.table.setItem(i, j, QTableWidgetItem(str(row[key])))
+        self.table.resizeColumnsToContents()
+        
+        lines = []
+        for e in reversed(instrumentation.slow_ops()):
+            line = f"{e['ts']}  {e['op']}  {e['ms']} мс  [{e['thread']}]"
+            if e["error"]:
+                line += f"  ошибка: {e['error']}"
+            lines.append(line)
+        self.slow_box.setPlainText("\n".join(lines) or "Нет медленных операций.")
+    
+    def export(self, fmt):
+        if fmt == "json":
+            path, _ = QFileDialog.getSaveFileName(
+                self, "Экспорт замеров", "performance.json", "JSON (*.json)"
+            )
+        else:
+            path, _ = QFileDialog.getSaveFileName(
+                self, "Экспорт замеров", "performance.csv", "CSV (*.csv)"
+            )
+        if not path:
+            return
+        
+        try:
+            if fmt == "json":
+                instrumentation.export_json(path)
+            else:
+                instrumentation.export_csv(path)
+            QMessageBox.information(self, "Экспорт", f"Сохранено: {path}")
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить файл: {e}")
+
+
+class MaintenanceDialog(QDialog):
+    """Размер и фрагментация базы, резервные копии и обслуживание."""
+    
+    def __init__(self, scheduler=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Обслуживание базы")
+        self.scheduler = scheduler
+        self.thread = None
+        self.init_ui()
+        self.refresh()
+    
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        
+        self.report_box = QTextEdit()
+        self.report_box.setReadOnly(True)
+        layout.addWidget(self.report_box)
+        
+        self.status = QLabel("")
+        layout.addWidget(self.status)
+        
+        btns = QHBoxLayout()
+        refresh_btn = QPushButton("Обновить")
+        refresh_btn.clicked.connect(self.refresh)
+        self.backup_btn = QPushButton("Резервная копия")
+        self.backup_btn.clicked.connect(lambda: self.run_tasks(["backup"]))
+        self.optimize_btn = QPushButton("Оптимизировать")
+        self.optimize_btn.clicked.connect(
+            lambda: self.run_tasks(["optimize", "incremental_vacuum", "analyze"])
+        )
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        for b in (refresh_btn, self.backup_btn, self.optimize_btn, close_btn):
+            btns.addWidget(b)
+        layout.addLayout(btns)
+        
+        self.resize(640, 520)
+    
+    def refresh(self):
+        import maintenance
+        
+        try:
+            text = maintenance.format_report(maintenance.db_report())
+        except Exception as e:
+            text = f"Не удалось получить сведения о базе: {e}"
+        self.report_box.setPlainText(text)
+    
+    def run_tasks(self, tasks):
+        from maintenance import MaintenanceThread
+        
+        # Кнопки блокируются до запуска: быстрая задача может завершиться
+        # раньше, чем мы вернёмся из start()
+        self.backup_btn.setEnabled(False)
+        self.optimize_btn.setEnabled(False)
+        self.status.setText("Выполняется: " + ", ".join(tasks))
+        
+        if self.scheduler is not None:
+            thread = self.scheduler.start(
+                tasks, on_finished=self.on_finished, on_error=self.on_error
+            )
+        elif self.thread is None or not self.thread.isRunning():
+            thread = MaintenanceThread(tasks)
+            thread.finished.connect(self.on_finished)
+            thread.error.connect(self.on_error)
+            thread.start()
+        else:
+            thread = None
+        if thread is None:
+            self.status.setText("Обслуживание уже выполняется, попробуйте позже.")
+            self._unlock()
+            return
+        
+        self.thread = thread
+    
+    def on_finished(self, done):
+        lines = []
+        for item in done:
+            line = f"{item['task']}: {item['seconds']} с"
+            for f in item["result"].get("files", []):
+                line += f", копия {f['path']}"
+            lines.append(line)
+        self.status.setText("Готово. " + "; ".join(lines))
+        self._unlock()
+        self.refresh()
+    
+    def on_error(self, message):
+        self.status.setText(f"Ошибка: {message}")
+        self._unlock()
+    
+    def _unlock(self):
+        self.backup_btn.setEnabled(True)
+        self.optimize_btn.setEnabled(True)